@@ -0,0 +1,494 @@
+"""
+Mood analytics engines.
+
+advanced_analytics_pipeline() folds every bucket used by
+/mood-logs/analytics/advanced into a single $facet aggregation so only a
+small summary (sums and counts) leaves the database. build_advanced_analytics()
+turns that summary into the response, reproducing the rounding and ordering
+of the original per-log Python passes.
+
+MoodFrame is the in-process fallback for servers that can't run the
+pipeline: it loads logs once into columnar NumPy arrays, and frame_summary()
+produces the same summary shape with vectorized operations.
+energy_hour_scores() scores the hour-of-day energy histogram.
+"""
+from datetime import date
+from math import sqrt
+from statistics import mean
+
+import numpy as np
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# (summary key, response label, upper bound in hours; None = open ended)
+SLEEP_RANGES = [
+    ("less_than_5", "<5 hrs", 5),
+    ("5_to_6", "5-6 hrs", 6),
+    ("6_to_7", "6-7 hrs", 7),
+    ("7_to_8", "7-8 hrs", 8),
+    ("more_than_8", "8+ hrs", None),
+]
+
+# The advanced endpoint has always analysed at most this many logs
+MAX_ANALYTICS_LOGS = 1000
+
+
+def _truthy(expr) -> dict:
+    """Aggregation expression mirroring Python truthiness for scalar values"""
+    return {"$not": [{"$in": [{"$ifNull": [expr, None]}, [False, None, 0, ""]]}]}
+
+
+def _sum_count(value) -> dict:
+    return {"sum": {"$sum": value}, "count": {"$sum": 1}}
+
+
+def advanced_analytics_pipeline(user_id: str, start_date: str) -> list:
+    """Single-pass $facet pipeline producing the advanced analytics summary"""
+    sleep_branches = [
+        {"case": {"$lt": ["$sleep_hours", upper]}, "then": key}
+        for key, _, upper in SLEEP_RANGES if upper is not None
+    ]
+    return [
+        {"$match": {"user_id": user_id, "date": {"$gte": start_date}}},
+        {"$sort": {"date": 1}},
+        {"$limit": MAX_ANALYTICS_LOGS},
+        {"$project": {
+            "_id": 0,
+            "date": 1,
+            "mood_rating": 1,
+            "sleep_hours": 1,
+            "symptoms": 1,
+            "has_sleep": _truthy("$sleep_hours"),
+            "medication": _truthy("$medication_taken"),
+            # $isoDayOfWeek is 1=Monday..7=Sunday; Python's weekday() is 0..6
+            "weekday": {"$subtract": [
+                {"$isoDayOfWeek": {"$dateFromString": {
+                    "dateString": "$date",
+                    "format": "%Y-%m-%d",
+                    "onError": None,
+                    "onNull": None
+                }}},
+                1
+            ]}
+        }},
+        {"$facet": {
+            "overall": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "mood_sum": {"$sum": "$mood_rating"},
+                    "mood_sq_sum": {"$sum": {"$multiply": ["$mood_rating", "$mood_rating"]}},
+                    "ratings": {"$push": "$mood_rating"}
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "total": 1,
+                    "mood_sum": 1,
+                    "mood_sq_sum": 1,
+                    # Longest run of consecutive low (<= 4) days, in date order
+                    "max_low_streak": {"$let": {"vars": {"streak": {"$reduce": {
+                        "input": "$ratings",
+                        "initialValue": {"current": 0, "max": 0},
+                        "in": {"$let": {
+                            "vars": {"current": {"$cond": [
+                                {"$lte": ["$$this", 4]},
+                                {"$add": ["$$value.current", 1]},
+                                0
+                            ]}},
+                            "in": {
+                                "current": "$$current",
+                                "max": {"$max": ["$$value.max", "$$current"]}
+                            }
+                        }}
+                    }}}, "in": "$$streak.max"}}
+                }}
+            ],
+            "day_of_week": [
+                {"$match": {"weekday": {"$ne": None}}},
+                {"$group": {
+                    "_id": "$weekday",
+                    **_sum_count("$mood_rating"),
+                    "min": {"$min": "$mood_rating"},
+                    "max": {"$max": "$mood_rating"}
+                }},
+                {"$sort": {"_id": 1}}
+            ],
+            "distribution": [
+                {"$group": {"_id": "$mood_rating", "count": {"$sum": 1}}}
+            ],
+            "sleep": [
+                {"$match": {"has_sleep": True}},
+                {"$group": {
+                    "_id": {"$switch": {"branches": sleep_branches, "default": SLEEP_RANGES[-1][0]}},
+                    **_sum_count("$mood_rating")
+                }}
+            ],
+            "medication": [
+                {"$group": {"_id": "$medication", **_sum_count("$mood_rating")}}
+            ],
+            "symptoms": [
+                {"$project": {
+                    "date": 1,
+                    "mood_rating": 1,
+                    "symptom": {"$objectToArray": {"$ifNull": ["$symptoms", {}]}}
+                }},
+                {"$unwind": {"path": "$symptom", "includeArrayIndex": "position"}},
+                {"$group": {
+                    "_id": "$symptom.k",
+                    # First appearance, so the original dict insertion order is kept
+                    "first_seen": {"$min": {"date": "$date", "position": "$position"}},
+                    "with_sum": {"$sum": {"$cond": [_truthy("$symptom.v"), "$mood_rating", 0]}},
+                    "with_count": {"$sum": {"$cond": [_truthy("$symptom.v"), 1, 0]}},
+                    "without_sum": {"$sum": {"$cond": [_truthy("$symptom.v"), 0, "$mood_rating"]}},
+                    "without_count": {"$sum": {"$cond": [_truthy("$symptom.v"), 0, 1]}}
+                }},
+                {"$sort": {"first_seen.date": 1, "first_seen.position": 1}}
+            ]
+        }}
+    ]
+
+
+async def fetch_advanced_summary(collection, user_id: str, start_date: str) -> dict:
+    """Run the facet pipeline; returns None when the user has no logs in range"""
+    results = await collection.aggregate(
+        advanced_analytics_pipeline(user_id, start_date)
+    ).to_list(1)
+    if not results or not results[0]["overall"]:
+        return None
+    return results[0]
+
+
+def _mean(total, count):
+    """Mean of integer ratings, typed like statistics.mean (int when exact)"""
+    quotient, remainder = divmod(total, count)
+    return quotient if remainder == 0 else total / count
+
+
+def _avg(bucket: dict):
+    return _mean(bucket["sum"], bucket["count"])
+
+
+def build_advanced_analytics(summary: dict) -> dict:
+    """Turn a facet summary into the /mood-logs/analytics/advanced response"""
+    overall = summary["overall"][0]
+    total = overall["total"]
+
+    # 1. Day of Week Analysis
+    day_of_week_analysis = []
+    for bucket in summary["day_of_week"]:
+        day_idx = bucket["_id"]
+        day_of_week_analysis.append({
+            "day": DAY_NAMES[day_idx],
+            "day_index": day_idx,
+            "average_mood": round(_avg(bucket), 1),
+            "log_count": bucket["count"],
+            "min_mood": bucket["min"],
+            "max_mood": bucket["max"]
+        })
+
+    # 2. Mood Distribution
+    mood_counts = {bucket["_id"]: bucket["count"] for bucket in summary["distribution"]}
+    mood_distribution = []
+    for rating in range(1, 11):
+        mood_distribution.append({
+            "rating": rating,
+            "count": mood_counts.get(rating, 0),
+            "percentage": round((mood_counts.get(rating, 0) / total) * 100, 1)
+        })
+
+    # 3. Sleep-Mood Correlation
+    sleep_buckets = {bucket["_id"]: bucket for bucket in summary["sleep"]}
+    sleep_mood_correlation = None
+
+    if sum(bucket["count"] for bucket in sleep_buckets.values()) >= 5:
+        data = []
+        for key, label, _ in SLEEP_RANGES:
+            bucket = sleep_buckets.get(key)
+            data.append({
+                "range": label,
+                "avg_mood": round(_avg(bucket), 1) if bucket else None,
+                "count": bucket["count"] if bucket else 0
+            })
+        sleep_mood_correlation = {"data": data, "optimal_sleep": None}
+
+        best_range = max(
+            [(d["range"], d["avg_mood"]) for d in data if d["avg_mood"] is not None],
+            key=lambda x: x[1],
+            default=(None, None)
+        )
+        if best_range[0]:
+            sleep_mood_correlation["optimal_sleep"] = best_range[0]
+
+    # 4. Medication Impact Analysis
+    medication = {bucket["_id"]: bucket for bucket in summary["medication"]}
+    medication_impact = None
+    if True in medication and False in medication:
+        taken, not_taken = medication[True], medication[False]
+        medication_impact = {
+            "with_medication": {
+                "average_mood": round(_avg(taken), 1),
+                "count": taken["count"]
+            },
+            "without_medication": {
+                "average_mood": round(_avg(not_taken), 1),
+                "count": not_taken["count"]
+            },
+            "difference": round(_avg(taken) - _avg(not_taken), 1)
+        }
+
+    # 5. Symptom-Mood Correlation
+    symptom_mood_correlation = []
+    for bucket in summary["symptoms"]:
+        if bucket["with_count"] >= 3:
+            avg_with = round(_mean(bucket["with_sum"], bucket["with_count"]), 1)
+            avg_without = round(_mean(bucket["without_sum"], bucket["without_count"]), 1) if bucket["without_count"] else None
+            symptom_mood_correlation.append({
+                "symptom": bucket["_id"].replace("_", " ").title(),
+                "symptom_key": bucket["_id"],
+                "avg_mood_with_symptom": avg_with,
+                "avg_mood_without_symptom": avg_without,
+                "impact": round(avg_with - avg_without, 1) if avg_without else None,
+                "occurrence_count": bucket["with_count"]
+            })
+
+    # Sort by impact (most negative first)
+    symptom_mood_correlation.sort(key=lambda x: x["impact"] if x["impact"] is not None else 0)
+
+    # 6. Pattern Recognition
+    patterns = []
+
+    weekday_avgs = [d["average_mood"] for d in day_of_week_analysis if d["day_index"] < 5]
+    weekend_avgs = [d["average_mood"] for d in day_of_week_analysis if d["day_index"] >= 5]
+
+    if weekday_avgs and weekend_avgs:
+        weekday_avg = mean(weekday_avgs)
+        weekend_avg = mean(weekend_avgs)
+
+        if weekend_avg > weekday_avg + 0.5:
+            patterns.append({
+                "type": "weekly",
+                "pattern": "weekend_boost",
+                "description": "Your mood tends to be better on weekends",
+                "details": f"Weekend avg: {round(weekend_avg, 1)}, Weekday avg: {round(weekday_avg, 1)}"
+            })
+        elif weekday_avg > weekend_avg + 0.5:
+            patterns.append({
+                "type": "weekly",
+                "pattern": "weekday_preference",
+                "description": "Your mood tends to be better on weekdays",
+                "details": f"Weekday avg: {round(weekday_avg, 1)}, Weekend avg: {round(weekend_avg, 1)}"
+            })
+
+    max_low_streak = overall["max_low_streak"]
+    if max_low_streak >= 3:
+        patterns.append({
+            "type": "streak",
+            "pattern": "low_mood_streak",
+            "description": f"You had a streak of {max_low_streak} consecutive low mood days",
+            "details": "Consider reaching out for support during extended low periods"
+        })
+
+    if total >= 7:
+        # Population standard deviation from integer sums, so no rounding drift
+        mood_std = sqrt(total * overall["mood_sq_sum"] - overall["mood_sum"] ** 2) / total
+        if mood_std > 2.5:
+            patterns.append({
+                "type": "variability",
+                "pattern": "high_variability",
+                "description": "Your mood shows high variability",
+                "details": "Large mood swings may indicate the need for stabilization strategies"
+            })
+
+    # 7. Trigger Identification
+    triggers = []
+
+    for corr in symptom_mood_correlation[:5]:
+        if corr["impact"] and corr["impact"] < -1:
+            triggers.append({
+                "trigger": corr["symptom"],
+                "type": "symptom",
+                "impact": corr["impact"],
+                "description": f"When experiencing {corr['symptom'].lower()}, your mood drops by {abs(corr['impact'])} points on average",
+                "frequency": corr["occurrence_count"]
+            })
+
+    if sleep_mood_correlation:
+        low_sleep_data = next((d for d in sleep_mood_correlation["data"] if d["range"] == "<5 hrs" and d["avg_mood"]), None)
+        good_sleep_data = next((d for d in sleep_mood_correlation["data"] if d["range"] == "7-8 hrs" and d["avg_mood"]), None)
+
+        if low_sleep_data and good_sleep_data and low_sleep_data["avg_mood"] < good_sleep_data["avg_mood"] - 1:
+            triggers.append({
+                "trigger": "Poor Sleep (<5 hours)",
+                "type": "sleep",
+                "impact": round(low_sleep_data["avg_mood"] - good_sleep_data["avg_mood"], 1),
+                "description": f"Getting less than 5 hours of sleep correlates with lower mood (avg: {low_sleep_data['avg_mood']}/10)",
+                "frequency": low_sleep_data["count"]
+            })
+
+    if day_of_week_analysis:
+        worst_day = min(day_of_week_analysis, key=lambda x: x["average_mood"])
+        best_day = max(day_of_week_analysis, key=lambda x: x["average_mood"])
+
+        if best_day["average_mood"] - worst_day["average_mood"] > 1.5:
+            triggers.append({
+                "trigger": f"{worst_day['day']}s",
+                "type": "day_of_week",
+                "impact": round(worst_day["average_mood"] - best_day["average_mood"], 1),
+                "description": f"{worst_day['day']}s tend to be your most challenging day (avg mood: {worst_day['average_mood']}/10)",
+                "frequency": worst_day["log_count"]
+            })
+
+    return {
+        "patterns": patterns,
+        "triggers": triggers,
+        "day_of_week_analysis": day_of_week_analysis,
+        "mood_distribution": mood_distribution,
+        "sleep_mood_correlation": sleep_mood_correlation,
+        "medication_impact": medication_impact,
+        "symptom_mood_correlation": symptom_mood_correlation[:10]
+    }
+
+
+# ============= NUMPY KERNEL =============
+
+class MoodFrame:
+    """Columnar view of a user's mood logs, oldest date first"""
+
+    def __init__(self, logs: list):
+        logs = sorted(logs, key=lambda log: log.get('date') or '')
+        n = len(logs)
+        self.size = n
+        self.mood = np.fromiter((log['mood_rating'] for log in logs), dtype=np.int64, count=n)
+        self.date_ordinal = np.fromiter((_date_ordinal(log.get('date')) for log in logs), dtype=np.int64, count=n)
+        # date.fromordinal(1) is a Monday, so this matches datetime.weekday(); -1 = unparseable
+        self.weekday = np.where(self.date_ordinal > 0, (self.date_ordinal - 1) % 7, -1)
+        # 0.0 means "not logged", mirroring the truthiness check of the original code
+        self.sleep = np.fromiter((float(log.get('sleep_hours') or 0) for log in logs), dtype=np.float64, count=n)
+        self.medication = np.fromiter((bool(log.get('medication_taken')) for log in logs), dtype=bool, count=n)
+
+        # Symptom columns in order of first appearance; a log may omit a symptom
+        # entirely (neither "with" nor "without"), so presence is tracked too
+        self.symptom_names = []
+        columns = {}
+        for log in logs:
+            for symptom in (log.get('symptoms') or {}):
+                if symptom not in columns:
+                    columns[symptom] = len(self.symptom_names)
+                    self.symptom_names.append(symptom)
+        self.symptom_present = np.zeros((n, len(self.symptom_names)), dtype=bool)
+        self.symptom_value = np.zeros((n, len(self.symptom_names)), dtype=bool)
+        for row, log in enumerate(logs):
+            for symptom, value in (log.get('symptoms') or {}).items():
+                self.symptom_present[row, columns[symptom]] = True
+                self.symptom_value[row, columns[symptom]] = bool(value)
+
+
+def _date_ordinal(date_str) -> int:
+    try:
+        return date.fromisoformat(date_str).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+def _grouped(keys, values, minlength: int):
+    """Per-group integer sums and counts of values keyed by small non-negative ints"""
+    counts = np.bincount(keys, minlength=minlength)
+    sums = np.bincount(keys, weights=values, minlength=minlength)
+    return sums, counts
+
+
+def longest_run(mask) -> int:
+    """Length of the longest run of True values"""
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return int((np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max())
+
+
+def frame_summary(frame: MoodFrame) -> dict:
+    """Vectorized equivalent of the $facet summary, for build_advanced_analytics()"""
+    mood = frame.mood
+    overall = {
+        "total": frame.size,
+        "mood_sum": int(mood.sum()),
+        "mood_sq_sum": int((mood * mood).sum()),
+        "max_low_streak": longest_run(mood <= 4)
+    }
+
+    valid = frame.weekday >= 0
+    weekday, weekday_mood = frame.weekday[valid], mood[valid]
+    sums, counts = _grouped(weekday, weekday_mood, 7)
+    mins = np.full(7, np.iinfo(np.int64).max)
+    maxs = np.full(7, np.iinfo(np.int64).min)
+    np.minimum.at(mins, weekday, weekday_mood)
+    np.maximum.at(maxs, weekday, weekday_mood)
+    day_of_week = [
+        {"_id": day, "sum": int(sums[day]), "count": int(counts[day]), "min": int(mins[day]), "max": int(maxs[day])}
+        for day in np.flatnonzero(counts).tolist()
+    ]
+
+    rating_counts = np.bincount(mood, minlength=11)
+    distribution = [{"_id": rating, "count": int(rating_counts[rating])} for rating in np.flatnonzero(rating_counts).tolist()]
+
+    has_sleep = frame.sleep != 0
+    bounds = [upper for _, _, upper in SLEEP_RANGES if upper is not None]
+    sleep_bin = np.digitize(frame.sleep[has_sleep], bounds)
+    sums, counts = _grouped(sleep_bin, mood[has_sleep], len(SLEEP_RANGES))
+    sleep = [
+        {"_id": SLEEP_RANGES[i][0], "sum": int(sums[i]), "count": int(counts[i])}
+        for i in np.flatnonzero(counts).tolist()
+    ]
+
+    medication = [
+        {"_id": flag, "sum": int(mood[mask].sum()), "count": int(mask.sum())}
+        for flag, mask in ((True, frame.medication), (False, ~frame.medication)) if mask.any()
+    ]
+
+    with_mask = frame.symptom_present & frame.symptom_value
+    without_mask = frame.symptom_present & ~frame.symptom_value
+    with_sum, without_sum = mood @ with_mask, mood @ without_mask
+    with_count, without_count = with_mask.sum(axis=0), without_mask.sum(axis=0)
+    symptoms = [
+        {
+            "_id": name,
+            "with_sum": int(with_sum[i]),
+            "with_count": int(with_count[i]),
+            "without_sum": int(without_sum[i]),
+            "without_count": int(without_count[i])
+        }
+        for i, name in enumerate(frame.symptom_names)
+    ]
+
+    return {
+        "overall": [overall],
+        "day_of_week": day_of_week,
+        "distribution": distribution,
+        "sleep": sleep,
+        "medication": medication,
+        "symptoms": symptoms
+    }
+
+
+def energy_hour_scores(energy_sum, mood_sum, log_count, focus_sessions) -> list:
+    """Productivity score for every hour that has mood logs
+
+    Composite score: energy (40%) + mood (30%) + focus sessions (30%).
+    All arguments are length-24 arrays indexed by hour of day.
+    """
+    energy_sum, mood_sum = np.asarray(energy_sum, dtype=np.float64), np.asarray(mood_sum, dtype=np.float64)
+    log_count, focus_sessions = np.asarray(log_count), np.asarray(focus_sessions)
+    hours = np.flatnonzero(log_count)
+    avg_energy = energy_sum[hours] / log_count[hours]
+    avg_mood = mood_sum[hours] / log_count[hours]
+    focus = focus_sessions[hours]
+    scores = avg_energy * 0.4 + avg_mood * 0.3 + np.minimum(focus * 2, 10) * 0.3
+    return [
+        {
+            'hour': int(hour),
+            'avg_energy': round(float(e), 1),
+            'avg_mood': round(float(m), 1),
+            'focus_sessions': int(f),
+            'productivity_score': round(float(score), 1)
+        }
+        for hour, e, m, f, score in zip(hours, avg_energy, avg_mood, focus, scores)
+    ]
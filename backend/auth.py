@@ -1,3 +1,8 @@
+import asyncio
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,18 +11,55 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from database import users_collection
+from metrics import set_gauge, timed
+
+# Hashes made with a different cost are upgraded on the user's next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so hashing runs here instead of on the event loop;
+# the pool size caps how many cores a login burst can take
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 security = HTTPBearer()
 
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_password_jobs = 0  # queued or running
+
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+
+# token -> (exp timestamp, payload); a token's signature can't change, so a
+# verified payload stays valid until the token expires
+_verified_tokens = OrderedDict()
+# user_id -> (monotonic expiry, user document without password_hash)
+_user_cache = OrderedDict()
+
+async def _run_password_job(fn, *args):
+    global _password_jobs
+    _password_jobs += 1
+    set_gauge("auth.password_hash.queue_depth", _password_jobs)
+    try:
+        async with timed("auth.password_hash"):
+            return await asyncio.get_running_loop().run_in_executor(_password_executor, fn, *args)
+    finally:
+        _password_jobs -= 1
+        set_gauge("auth.password_hash.queue_depth", _password_jobs)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """(valid, new_hash); new_hash is set when the stored hash should be replaced (e.g. BCRYPT_ROUNDS changed)"""
+    return await _run_password_job(pwd_context.verify_and_update, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await _run_password_job(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -30,15 +72,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def decode_token(token: str) -> dict:
+    cached = _verified_tokens.get(token)
+    if cached:
+        if cached[0] > time.time():
+            _verified_tokens.move_to_end(token)
+            return cached[1]
+        del _verified_tokens[token]
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if "exp" in payload:
+        _verified_tokens[token] = (payload["exp"], payload)
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return payload
 
 async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     token = credentials.credentials
@@ -50,4 +102,51 @@ async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depend
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user_id
\ No newline at end of file
+    return user_id
+
+async def load_user(user_id: str) -> Optional[dict]:
+    """User document (without password_hash) through a short-TTL in-process cache
+
+    Returns a copy, so callers may modify it.
+    """
+    cached = _user_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        _user_cache.move_to_end(user_id)
+        return copy.deepcopy(cached[1])
+    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+    if user_doc:
+        remember_user(user_doc)
+    return user_doc
+
+def remember_user(user_doc: dict):
+    user_doc = {k: v for k, v in user_doc.items() if k not in ("_id", "password_hash")}
+    _user_cache[user_doc["id"]] = (time.monotonic() + USER_CACHE_TTL_SECONDS, copy.deepcopy(user_doc))
+    _user_cache.move_to_end(user_doc["id"])
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: str):
+    """Call after writing the user document; other workers see the change within USER_CACHE_TTL_SECONDS"""
+    _user_cache.pop(user_id, None)
+
+class CurrentUser:
+    """The authenticated user of one request; the document is loaded at most once"""
+
+    def __init__(self, user_id: str):
+        self.id = user_id
+        self._doc = None
+
+    async def doc(self) -> dict:
+        if self._doc is None:
+            self._doc = await load_user(self.id)
+            if self._doc is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="User not found"
+                )
+        return self._doc
+
+async def get_current_user_context(user_id: str = Depends(get_current_user_id)) -> CurrentUser:
+    # FastAPI caches dependencies per request, so every Depends() on this
+    # within one request shares the same CurrentUser
+    return CurrentUser(user_id)
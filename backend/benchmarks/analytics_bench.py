@@ -0,0 +1,119 @@
+"""
+Benchmark the NumPy analytics kernel against the per-log Python passes it replaced.
+
+    cd backend && python benchmarks/analytics_bench.py
+
+Both paths produce the summary consumed by build_advanced_analytics(); the
+responses are compared before timing so the numbers are apples to apples.
+"""
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import MoodFrame, frame_summary, build_advanced_analytics, SLEEP_RANGES  # noqa: E402
+
+SIZES = [30, 365, 3650]
+SYMPTOMS = ['racing_thoughts', 'low_energy', 'irritability', 'insomnia', 'hopelessness', 'focus_issues']
+
+
+def make_logs(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    return [
+        {
+            "date": (start + timedelta(days=i)).isoformat(),
+            "timestamp": datetime(2020, 1, 1, rng.randint(0, 23)).isoformat(),
+            "mood_rating": rng.randint(1, 10),
+            "sleep_hours": rng.choice([None, 4, 5.5, 6, 6.5, 7, 7.5, 8, 9]),
+            "medication_taken": rng.random() < 0.6,
+            "symptoms": {s: rng.random() < 0.5 for s in rng.sample(SYMPTOMS, rng.randint(0, 4))}
+        }
+        for i in range(n)
+    ]
+
+
+def legacy_summary(logs: list) -> dict:
+    """The original approach: one Python pass and one list per bucket"""
+    logs = sorted(logs, key=lambda log: log['date'])
+    moods = [log['mood_rating'] for log in logs]
+
+    streak = max_streak = 0
+    for rating in moods:
+        streak = streak + 1 if rating <= 4 else 0
+        max_streak = max(max_streak, streak)
+
+    day_mood = {i: [] for i in range(7)}
+    for log in logs:
+        day_mood[datetime.strptime(log['date'], "%Y-%m-%d").weekday()].append(log['mood_rating'])
+
+    mood_counts = {}
+    for rating in moods:
+        mood_counts[rating] = mood_counts.get(rating, 0) + 1
+
+    sleep_ranges = {key: [] for key, _, _ in SLEEP_RANGES}
+    for log in logs:
+        hours = log.get('sleep_hours')
+        if hours:
+            key = next(key for key, _, upper in SLEEP_RANGES if upper is None or hours < upper)
+            sleep_ranges[key].append(log['mood_rating'])
+
+    med_taken = [log['mood_rating'] for log in logs if log.get('medication_taken')]
+    med_not_taken = [log['mood_rating'] for log in logs if not log.get('medication_taken')]
+
+    symptom_moods = {}
+    for log in logs:
+        for symptom, present in log.get('symptoms', {}).items():
+            data = symptom_moods.setdefault(symptom, {"with": [], "without": []})
+            data["with" if present else "without"].append(log['mood_rating'])
+
+    return {
+        "overall": [{
+            "total": len(moods),
+            "mood_sum": sum(moods),
+            "mood_sq_sum": sum(m * m for m in moods),
+            "max_low_streak": max_streak
+        }],
+        "day_of_week": [
+            {"_id": day, "sum": sum(m), "count": len(m), "min": min(m), "max": max(m)}
+            for day, m in day_mood.items() if m
+        ],
+        "distribution": [{"_id": rating, "count": count} for rating, count in mood_counts.items()],
+        "sleep": [{"_id": key, "sum": sum(m), "count": len(m)} for key, m in sleep_ranges.items() if m],
+        "medication": [
+            {"_id": flag, "sum": sum(m), "count": len(m)}
+            for flag, m in ((True, med_taken), (False, med_not_taken)) if m
+        ],
+        "symptoms": [
+            {
+                "_id": symptom,
+                "with_sum": sum(d["with"]),
+                "with_count": len(d["with"]),
+                "without_sum": sum(d["without"]),
+                "without_count": len(d["without"])
+            }
+            for symptom, d in symptom_moods.items()
+        ]
+    }
+
+
+def main():
+    print(f"{'logs':>6} {'legacy (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for n in SIZES:
+        logs = make_logs(n)
+        legacy = build_advanced_analytics(legacy_summary(logs))
+        kernel = build_advanced_analytics(frame_summary(MoodFrame(logs)))
+        assert json.dumps(legacy) == json.dumps(kernel), f"results differ at {n} logs"
+
+        runs = max(5, 20000 // n)
+        legacy_ms = min(timeit.repeat(lambda: legacy_summary(logs), number=runs, repeat=3)) / runs * 1000
+        kernel_ms = min(timeit.repeat(lambda: frame_summary(MoodFrame(logs)), number=runs, repeat=3)) / runs * 1000
+        print(f"{n:>6} {legacy_ms:>12.3f} {kernel_ms:>12.3f} {legacy_ms / kernel_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
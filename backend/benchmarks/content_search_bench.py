@@ -0,0 +1,141 @@
+"""
+Benchmark content search over a synthetic 100k-item catalog: the original
+case-insensitive $regex scan vs the in-process inverted index.
+
+    cd backend && python benchmarks/content_search_bench.py [--items N] [--mongo]
+
+--mongo also compares $regex against the weighted $text index on a live
+MongoDB (MONGO_URL / DB_NAME), using a scratch content_search_bench collection
+that is dropped afterwards.
+"""
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from content_search import InvertedIndex  # noqa: E402
+
+DOMAIN_WORDS = (
+    "mood sleep anxiety focus routine energy stress calm breathing journal exercise habit "
+    "therapy support family work school meditation nutrition walking music social balance "
+    "tracking triggers recovery motivation planning gratitude relaxation resilience"
+).split()
+SYLLABLES = "ka lo mi ne ru sa ti vo be da fe gi ho ju".split()
+VOCABULARY_SIZE = 5000
+CATEGORIES = ["bipolar", "adhd", "depression", "general", "coping", "caregivers"]
+TYPES = ["article", "video", "audio", "exercise"]
+QUERIES = ["sleep", "breathing exercise", "resilience", "medit", "mood tracking triggers", "kaloti"]
+
+
+def make_vocabulary(rng: random.Random) -> list:
+    """Domain words first (the most frequent), then made-up words for the long tail"""
+    words = list(DOMAIN_WORDS)
+    seen = set(words)
+    while len(words) < VOCABULARY_SIZE:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def make_catalog(count: int, seed: int = 11) -> list:
+    """Catalog whose word frequencies follow a Zipf-like distribution, as real text does"""
+    rng = random.Random(seed)
+    words = make_vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+
+    def draw(k):
+        return rng.choices(words, weights=weights, k=k)
+
+    return [{
+        "id": str(i),
+        "title": " ".join(word.title() for word in draw(4)),
+        "content_type": rng.choice(TYPES),
+        "category": rng.choice(CATEGORIES),
+        "description": " ".join(draw(18)),
+        "tags": sorted(set(draw(3)))
+    } for i in range(count)]
+
+
+def legacy_search(items: list, search: str, limit: int = 50) -> list:
+    """The original filter: regex on title/description or exact tag, no ranking"""
+    pattern = re.compile(re.escape(search), re.IGNORECASE)
+    matches = []
+    for item in items:
+        if pattern.search(item["title"]) or pattern.search(item["description"]) or search.lower() in item["tags"]:
+            matches.append(item)
+            if len(matches) == limit:
+                break
+    return matches
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def mongo_section(items: list):
+    from pymongo import TEXT
+    from database import db
+    collection = db.content_search_bench
+    await collection.drop()
+    await collection.insert_many([dict(item) for item in items])
+    await collection.create_index(
+        [("title", TEXT), ("tags", TEXT), ("description", TEXT)],
+        weights={"title": 10, "tags": 5, "description": 1}
+    )
+    print(f"\n{'mongo query':<26}{'$regex ms':>12}{'$text ms':>12}")
+    for query in QUERIES:
+        start = time.perf_counter()
+        await collection.find({"$or": [
+            {"title": {"$regex": query, "$options": "i"}},
+            {"description": {"$regex": query, "$options": "i"}},
+            {"tags": {"$in": [query]}}
+        ]}, {"_id": 0}).limit(50).to_list(50)
+        regex_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await collection.find(
+            {"$text": {"$search": query}}, {"_id": 0, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(50).to_list(50)
+        text_ms = (time.perf_counter() - start) * 1000
+        print(f"{query:<26}{regex_ms:>12.1f}{text_ms:>12.1f}")
+    await collection.drop()
+
+
+def main(argv):
+    count = int(argv[argv.index("--items") + 1]) if "--items" in argv else 100_000
+    items = make_catalog(count)
+
+    start = time.perf_counter()
+    index = InvertedIndex(items)
+    print(f"Built inverted index over {count} items in {time.perf_counter() - start:.2f}s "
+          f"({len(index.vocabulary)} tokens)")
+
+    # The legacy scan stops at the first 50 matches in storage order; the
+    # index ranks every match, so it is timed against a full scan too
+    print(f"\n{'query':<26}{'matches':>9}{'scan first 50 ms':>18}{'full scan ms':>14}{'index ms':>10}")
+    for query in QUERIES:
+        matches = len(legacy_search(items, query, limit=count))
+        first_page = best_of(lambda: legacy_search(items, query))
+        full = best_of(lambda: legacy_search(items, query, limit=count))
+        indexed = best_of(lambda: index.search(query, limit=50))
+        print(f"{query:<26}{matches:>9}{first_page * 1000:>18.2f}{full * 1000:>14.2f}{indexed * 1000:>10.2f}")
+
+    if "--mongo" in argv:
+        asyncio.run(mongo_section(items))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,58 @@
+"""
+Benchmark crisis detection: compiled lexicon automaton vs the original keyword scans.
+
+    cd backend && python benchmarks/crisis_bench.py
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crisis import CrisisMatcher, LEXICON_PATH, LEVELS  # noqa: E402
+
+FILLER = (
+    "today was long and I tried to get through my tasks but kept getting distracted "
+    "by messages and noise and the meeting ran over so lunch was late again "
+).split()
+SIZES = [50, 500, 5000]  # words per message
+
+
+def legacy_level(message: str, lexicon: dict):
+    """The original approach: up to three any(kw in message) scans"""
+    message_lower = message.lower()
+    for level in LEVELS:
+        if any(kw in message_lower for kw in lexicon[level]):
+            return level
+    return None
+
+
+def make_message(words: int, phrase: str = None, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    tokens = [rng.choice(FILLER) for _ in range(words)]
+    if phrase:
+        tokens.append(phrase)
+    return " ".join(tokens)
+
+
+def main():
+    with open(LEXICON_PATH, encoding="utf-8") as f:
+        lexicon = json.load(f)
+    matcher = CrisisMatcher(lexicon)
+
+    print(f"{'words':>6} {'case':>10} {'legacy (us)':>12} {'automaton (us)':>14}")
+    for words in SIZES:
+        # "clean" never matches, so the legacy code scans the message for all ~45 phrases
+        for case, phrase in (("clean", None), ("moderate", "feeling numb"), ("critical", "want to die")):
+            message = make_message(words, phrase)
+            assert matcher.match(message).level == legacy_level(message, lexicon)
+            runs = max(10, 200000 // words)
+            legacy = min(timeit.repeat(lambda: legacy_level(message, lexicon), number=runs, repeat=3)) / runs
+            automaton = min(timeit.repeat(lambda: matcher.match(message), number=runs, repeat=3)) / runs
+            print(f"{words:>6} {case:>10} {legacy * 1e6:>12.1f} {automaton * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Benchmark LLM gateway overhead and concurrency limiting with the offline stub backend.
+
+    cd backend && python benchmarks/llm_gateway_bench.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm import LLMGateway, StubBackend  # noqa: E402
+
+CALLS = 200
+STUB_LATENCY_SECONDS = 0.02
+
+
+async def run(concurrency: int, latency: float) -> float:
+    gateway = LLMGateway(StubBackend(latency), concurrency=concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        gateway.complete("bench", "You are a benchmark.", f"Message {i}") for i in range(CALLS)
+    ))
+    return time.perf_counter() - start
+
+
+async def main():
+    overhead = await run(concurrency=CALLS, latency=0)
+    print(f"Gateway overhead: {overhead / CALLS * 1e6:.1f} us per call (stub with no latency)")
+    print(f"{'concurrency':>12} {'wall (s)':>9} {'calls/s':>9}")
+    for concurrency in (1, 4, 8, 32):
+        elapsed = await run(concurrency, STUB_LATENCY_SECONDS)
+        print(f"{concurrency:>12} {elapsed:>9.2f} {CALLS / elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
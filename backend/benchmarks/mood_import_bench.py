@@ -0,0 +1,120 @@
+"""
+Benchmark bulk mood-log import and export throughput.
+
+    cd backend && python benchmarks/mood_import_bench.py [--logs N] [--mongo]
+
+Without --mongo this measures streaming parse + validation of NDJSON and
+JSON array bodies. --mongo also compares, on a live MongoDB (MONGO_URL /
+DB_NAME), the one-at-a-time path of POST /mood-logs (find_one + insert_one
++ rollup per log) against import_mood_logs, and times the streaming export.
+It writes under a scratch user id and deletes that user's logs and rollup
+afterwards.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from mood_bulk import iter_records, validate_record  # noqa: E402
+
+CHUNK_BYTES = 64 * 1024  # roughly what the ASGI server hands over per receive
+
+
+def make_records(count: int, seed: int = 5) -> list:
+    rng = random.Random(seed)
+    start = date(2000, 1, 1)
+    return [{
+        "date": (start + timedelta(days=i)).isoformat(),
+        "mood_rating": rng.randint(1, 10),
+        "mood_tag": rng.choice(["low", "anxious", "calm", "energetic", None]),
+        "symptoms": {"anxiety": rng.random() < 0.3, "fatigue": rng.random() < 0.2},
+        "notes": "Imported from another tracker" if rng.random() < 0.1 else None,
+        "medication_taken": rng.random() < 0.7,
+        "sleep_hours": round(rng.uniform(4, 9), 1)
+    } for i in range(count)]
+
+
+async def chunked(body: bytes):
+    for i in range(0, len(body), CHUNK_BYTES):
+        yield body[i:i + CHUNK_BYTES]
+
+
+async def parse_rate(body: bytes) -> tuple:
+    start = time.perf_counter()
+    valid = 0
+    async for record, error in iter_records(chunked(body)):
+        if not error and validate_record(record)[0]:
+            valid += 1
+    return valid, time.perf_counter() - start
+
+
+async def mongo_section(records: list):
+    from database import mood_logs_collection, mood_stats_collection
+    from models import MoodLog, MoodLogCreate
+    from mood_bulk import import_mood_logs, export_mood_logs
+    from mood_stats import record_log_created
+
+    async def cleanup(user_id):
+        await mood_logs_collection.delete_many({"user_id": user_id})
+        await mood_stats_collection.delete_many({"user_id": user_id})
+
+    one_user = f"bench-{uuid.uuid4()}"
+    start = time.perf_counter()
+    for record in records:
+        log_data = MoodLogCreate(**record)
+        if await mood_logs_collection.find_one({"user_id": one_user, "date": log_data.date}):
+            continue
+        log_dict = MoodLog(user_id=one_user, **log_data.model_dump()).model_dump()
+        log_dict['timestamp'] = log_dict['timestamp'].isoformat()
+        await mood_logs_collection.insert_one(log_dict)
+        await record_log_created(log_dict)
+    one_at_a_time = time.perf_counter() - start
+    await cleanup(one_user)
+
+    bulk_user = f"bench-{uuid.uuid4()}"
+    body = "\n".join(json.dumps(record) for record in records).encode()
+    report = await import_mood_logs(bulk_user, chunked(body))
+    bulk = report["seconds"]
+
+    start = time.perf_counter()
+    exported = 0
+    async for chunk in export_mood_logs(bulk_user, "ndjson"):
+        exported += chunk.count("\n")
+    export_seconds = time.perf_counter() - start
+    await cleanup(bulk_user)
+
+    count = len(records)
+    print(f"\n{'mongo path':<24}{'seconds':>10}{'logs/s':>10}")
+    print(f"{'one at a time':<24}{one_at_a_time:>10.2f}{count / one_at_a_time:>10.0f}")
+    print(f"{'bulk import':<24}{bulk:>10.2f}{count / bulk:>10.0f}")
+    print(f"{'ndjson export':<24}{export_seconds:>10.2f}{exported / export_seconds:>10.0f}")
+
+
+def main(argv):
+    count = int(argv[argv.index("--logs") + 1]) if "--logs" in argv else 10_000
+    records = make_records(count)
+    bodies = {
+        "ndjson": "\n".join(json.dumps(record) for record in records).encode(),
+        "json array": json.dumps(records).encode(),
+    }
+    print(f"Parsing {count} records in {CHUNK_BYTES // 1024} KiB chunks")
+    print(f"{'body':<14}{'MiB':>8}{'valid':>8}{'seconds':>10}{'records/s':>12}")
+    for name, body in bodies.items():
+        valid, elapsed = asyncio.run(parse_rate(body))
+        print(f"{name:<14}{len(body) / 2**20:>8.2f}{valid:>8}{elapsed:>10.2f}{count / elapsed:>12.0f}")
+
+    if "--mongo" in argv:
+        asyncio.run(mongo_section(records))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Benchmark event-loop responsiveness during a login burst: bcrypt on the loop
+(the original handlers) vs the password hashing thread pool.
+
+A probe task stands in for unrelated requests: it wakes every few
+milliseconds and records how late it was scheduled. p99 lateness is what
+every other in-flight request on the worker would see.
+
+    cd backend && python benchmarks/password_hash_bench.py [BURST_SIZE]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import pwd_context, verify_password, PASSWORD_HASH_WORKERS, BCRYPT_ROUNDS  # noqa: E402
+
+PROBE_INTERVAL_SECONDS = 0.005
+
+
+async def probe(lateness: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL_SECONDS
+        await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+        lateness.append(max(0.0, time.perf_counter() - expected))
+
+
+async def blocking_verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+async def run_burst(verify, burst: int, hashed: str):
+    lateness = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lateness, stop))
+    await asyncio.sleep(PROBE_INTERVAL_SECONDS * 4)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[verify("correct horse", hashed) for _ in range(burst)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    assert all(results)
+
+    ordered = sorted(lateness)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    return elapsed, p99, ordered[-1]
+
+
+async def main(argv):
+    burst = int(argv[0]) if argv else 20
+    hashed = pwd_context.hash("correct horse")
+    print(f"Login burst of {burst}, bcrypt rounds={BCRYPT_ROUNDS}, pool workers={PASSWORD_HASH_WORKERS}")
+    print(f"{'mode':<12}{'burst s':>10}{'probe p99 ms':>15}{'probe max ms':>15}")
+    for name, verify in (("on loop", blocking_verify), ("thread pool", verify_password)):
+        elapsed, p99, worst = await run_burst(verify, burst, hashed)
+        print(f"{name:<12}{elapsed:>10.2f}{p99 * 1000:>15.1f}{worst * 1000:>15.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,117 @@
+"""
+Two-tier response cache for expensive, shareable results (LLM output).
+
+Lookups go to a small in-process LRU first, then to the response_cache
+collection, which every worker shares. Mongo entries carry a BSON
+expires_at date with a TTL index, so the server evicts them on its own.
+get_or_compute() also coalesces concurrent misses for the same key into a
+single computation (see singleflight.py).
+
+Hits and misses are counted per namespace (cache.<namespace>.* in
+/api/metrics/counters).
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from database import response_cache_collection
+from metrics import increment
+from singleflight import SingleFlight, input_hash
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(*parts) -> str:
+    """Stable content hash of JSON-serializable parts"""
+    return input_hash(*parts)
+
+
+def normalize_text(value) -> str:
+    """Case- and whitespace-insensitive form of a free-text key part"""
+    return " ".join(str(value or "").lower().split())
+
+
+class ResponseCache:
+    def __init__(self, namespace: str, ttl_seconds: int, lru_size: int = 256, collection=None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.lru_size = lru_size
+        self.collection = collection if collection is not None else response_cache_collection
+        self._lru = OrderedDict()  # key -> (monotonic expiry, value)
+        self._flights = SingleFlight()
+
+    def _doc_id(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _count(self, event: str):
+        increment(f"cache.{self.namespace}.{event}")
+
+    def _remember(self, key: str, value):
+        self._lru[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def get(self, key: str):
+        """Cached value, or None on a miss"""
+        entry = self._lru.get(key)
+        if entry:
+            if entry[0] > time.monotonic():
+                self._lru.move_to_end(key)
+                self._count("hit_memory")
+                return entry[1]
+            del self._lru[key]
+
+        try:
+            doc = await self.collection.find_one({
+                "_id": self._doc_id(key),
+                # The TTL monitor only runs every minute, so check expiry here too
+                "expires_at": {"$gt": datetime.now(timezone.utc)}
+            })
+        except Exception as e:
+            logger.error(f"Response cache read failed for {self.namespace}: {e}")
+            doc = None
+        if doc:
+            self._remember(key, doc['value'])
+            self._count("hit_mongo")
+            return doc['value']
+
+        self._count("miss")
+        return None
+
+    async def set(self, key: str, value):
+        self._remember(key, value)
+        now = datetime.now(timezone.utc)
+        doc = {
+            "namespace": self.namespace,
+            "value": value,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds)
+        }
+        try:
+            await self.collection.update_one({"_id": self._doc_id(key)}, {"$set": doc}, upsert=True)
+        except Exception as e:
+            # The in-process tier still serves this worker
+            logger.error(f"Response cache write failed for {self.namespace}: {e}")
+
+    async def invalidate(self, key: str):
+        self._lru.pop(key, None)
+        await self.collection.delete_one({"_id": self._doc_id(key)})
+
+    async def _compute_and_store(self, key: str, compute):
+        value = await compute()
+        await self.set(key, value)
+        return value
+
+    async def get_or_compute(self, key: str, compute):
+        """Cached value, or the result of `await compute()`, which is then cached
+
+        Concurrent misses for the same key share one compute() call; a caller
+        that is cancelled doesn't cancel it for the others. Exceptions
+        propagate to every waiter and nothing is cached.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+        return await self._flights.run(self.namespace, (key,), lambda: self._compute_and_store(key, compute))
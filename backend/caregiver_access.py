@@ -0,0 +1,86 @@
+"""
+In-process cache of caregiver relationships for authorization checks.
+
+Caregiver data endpoints look up the (caregiver, patient) relationship and
+its permissions on every request, and every crisis alert looks up the
+patient's alert-enabled caregivers. Both lookups go through short-TTL LRU
+caches here; a missing relationship is cached too, so repeated 403s don't
+query either.
+
+Writes to caregiver_relationships must call invalidate_relationship. That
+clears this worker at once; other workers see the change within
+CAREGIVER_ACCESS_TTL_SECONDS, which bounds how long a revoked permission can
+still be honored elsewhere. A lookup still reading when an invalidation
+happens doesn't cache what it read, since that may predate the change.
+"""
+import copy
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from database import caregiver_relationships_collection
+
+CAREGIVER_ACCESS_CACHE_SIZE = int(os.getenv("CAREGIVER_ACCESS_CACHE_SIZE", "4096"))
+CAREGIVER_ACCESS_TTL_SECONDS = float(os.getenv("CAREGIVER_ACCESS_TTL_SECONDS", "10"))
+MAX_ALERT_CAREGIVERS = 100
+
+# (caregiver_id, patient_id) -> (monotonic expiry, relationship or None)
+_relationships = OrderedDict()
+# patient_id -> (monotonic expiry, relationships with receive_alerts)
+_alert_relationships = OrderedDict()
+# Bumped by every invalidation; relationship writes are rare, so one counter will do
+_generation = 0
+
+
+def _get(cache: OrderedDict, key):
+    cached = cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        cache.move_to_end(key)
+        return True, copy.deepcopy(cached[1])
+    return False, None
+
+
+def _put(cache: OrderedDict, key, value, generation: int):
+    """Cache a lookup that started at `generation`, unless an invalidation has happened since"""
+    if generation != _generation:
+        return
+    cache[key] = (time.monotonic() + CAREGIVER_ACCESS_TTL_SECONDS, copy.deepcopy(value))
+    cache.move_to_end(key)
+    while len(cache) > CAREGIVER_ACCESS_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+async def load_relationship(caregiver_id: str, patient_id: str) -> Optional[dict]:
+    """The caregiver's relationship to the patient (a copy), or None if there is none"""
+    hit, relationship = _get(_relationships, (caregiver_id, patient_id))
+    if hit:
+        return relationship
+    generation = _generation
+    relationship = await caregiver_relationships_collection.find_one(
+        {"patient_id": patient_id, "caregiver_id": caregiver_id}, {"_id": 0}
+    )
+    _put(_relationships, (caregiver_id, patient_id), relationship, generation)
+    return relationship
+
+
+async def alert_relationships(patient_id: str) -> list:
+    """Relationships of the patient's caregivers who have the receive_alerts permission"""
+    hit, relationships = _get(_alert_relationships, patient_id)
+    if hit:
+        return relationships
+    generation = _generation
+    relationships = await caregiver_relationships_collection.find({
+        "patient_id": patient_id,
+        "permissions.receive_alerts": True
+    }, {"_id": 0}).to_list(MAX_ALERT_CAREGIVERS)
+    _put(_alert_relationships, patient_id, relationships, generation)
+    return relationships
+
+
+def invalidate_relationship(caregiver_id: str, patient_id: str):
+    """Call after creating, changing or deleting the relationship between the two users"""
+    global _generation
+    _generation += 1
+    _relationships.pop((caregiver_id, patient_id), None)
+    _alert_relationships.pop(patient_id, None)
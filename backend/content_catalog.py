@@ -0,0 +1,105 @@
+"""
+In-memory read-through cache of the educational content catalog.
+
+The catalog is small and only changes when seed_content.py runs, so each
+worker loads it once into Content models (parsing created_at once) with
+per-category and per-type indexes, and serves /api/content filters from
+memory. seed_content.py bumps a version counter in content_meta; workers
+check it every VERSION_CHECK_SECONDS and reload when it moves. The version
+is also the ETag of every content response.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from database import content_collection, content_meta_collection
+from models import Content
+
+logger = logging.getLogger(__name__)
+
+VERSION_CHECK_SECONDS = 5
+
+
+async def catalog_version() -> int:
+    doc = await content_meta_collection.find_one({"_id": "catalog"})
+    return doc.get("version", 0) if doc else 0
+
+
+async def bump_catalog_version() -> int:
+    """Signal every app worker that the content catalog changed"""
+    doc = await content_meta_collection.find_one_and_update(
+        {"_id": "catalog"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
+class ContentCatalog:
+    def __init__(self, docs: list, version: int):
+        self.version = version
+        self.docs = docs
+        loaded_at = datetime.now(timezone.utc)
+        self.items = []
+        for doc in docs:
+            if isinstance(doc.get('created_at'), str):
+                doc['created_at'] = datetime.fromisoformat(doc['created_at'])
+            # Seeded items have no created_at; pin one so responses (and the ETag) stay stable
+            self.items.append(Content(**{"created_at": loaded_at, **doc}))
+        self.by_id = {item.id: item for item in self.items}
+        self.by_category = defaultdict(list)
+        self.by_type = defaultdict(list)
+        for item in self.items:
+            self.by_category[item.category].append(item)
+            self.by_type[item.content_type].append(item)
+
+    @property
+    def etag(self) -> str:
+        return f'W/"content-{self.version}"'
+
+    def filter(self, category: str = None, content_type: str = None, skip: int = 0, limit: int = 50) -> list:
+        """Items in catalog order, optionally narrowed by category and/or type"""
+        if category and content_type:
+            pool = [item for item in self.by_category.get(category, []) if item.content_type == content_type]
+        elif category:
+            pool = self.by_category.get(category, [])
+        elif content_type:
+            pool = self.by_type.get(content_type, [])
+        else:
+            pool = self.items
+        return pool[skip:skip + limit]
+
+    def resolve(self, docs: list) -> list:
+        """Catalog items for documents found by a query, falling back to the documents themselves"""
+        return [self.by_id.get(doc['id']) or Content(**doc) for doc in docs]
+
+
+_catalog = None
+_checked_at = 0.0
+_load_lock = asyncio.Lock()
+
+
+async def load_catalog() -> ContentCatalog:
+    """(Re)load the catalog from content_collection"""
+    global _catalog, _checked_at
+    async with _load_lock:
+        version = await catalog_version()
+        docs = await content_collection.find({}, {"_id": 0}).to_list(None)
+        _catalog = ContentCatalog(docs, version)
+        _checked_at = time.monotonic()
+    logger.info(f"Loaded content catalog: {len(docs)} items, version {version}")
+    return _catalog
+
+
+async def get_catalog() -> ContentCatalog:
+    """The cached catalog, reloaded first if the version moved"""
+    global _checked_at
+    if _catalog is None:
+        return await load_catalog()
+    if time.monotonic() - _checked_at >= VERSION_CHECK_SECONDS:
+        _checked_at = time.monotonic()
+        if await catalog_version() != _catalog.version:
+            return await load_catalog()
+    return _catalog
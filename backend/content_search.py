@@ -0,0 +1,158 @@
+"""
+Full-text search over the educational content catalog.
+
+Searches use the weighted MongoDB text index on content (title > tags >
+description, see indexes.py) and come back sorted by relevance. Where
+$text isn't available (no text index yet, or CONTENT_SEARCH_BACKEND=memory)
+an in-process inverted index over the same fields and weights answers
+instead. It is built from the cached catalog (content_catalog.py) and
+rebuilt whenever the catalog reloads.
+"""
+import bisect
+import logging
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+from pymongo.errors import OperationFailure
+
+from content_catalog import get_catalog
+from database import content_collection
+
+logger = logging.getLogger(__name__)
+
+CONTENT_SEARCH_BACKEND = os.getenv("CONTENT_SEARCH_BACKEND", "mongo")  # "mongo" or "memory"
+
+# Mirrors the weights of the content text index
+FIELD_WEIGHTS = {"title": 10, "tags": 5, "description": 1}
+PREFIX_MIN_LENGTH = 3  # shorter terms only match whole words
+PREFIX_MATCH_FACTOR = 0.5  # a prefix match counts half as much as a whole word
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to what with your you".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class InvertedIndex:
+    """Weighted token -> item postings with prefix matching on query terms
+
+    Scores are accumulated in NumPy arrays over the whole catalog, so common
+    terms cost a vectorized pass rather than a Python loop per posting.
+    """
+
+    def __init__(self, items: list):
+        self.items = items
+        postings = defaultdict(dict)  # token -> {item position: weight}
+        for position, item in enumerate(items):
+            for field, weight in FIELD_WEIGHTS.items():
+                value = item.get(field)
+                text = " ".join(value) if isinstance(value, list) else value
+                for token in tokenize(text):
+                    token_postings = postings[token]
+                    token_postings[position] = token_postings.get(position, 0) + weight
+        # token -> (positions, weights)
+        self.postings = {
+            token: (np.fromiter(entries.keys(), np.int64, len(entries)),
+                    np.fromiter(entries.values(), np.float32, len(entries)))
+            for token, entries in postings.items()
+        }
+        self.vocabulary = sorted(self.postings)
+        self.categories = np.array([item.get('category') for item in items], dtype=object)
+        self.content_types = np.array([item.get('content_type') for item in items], dtype=object)
+
+    def _expand(self, term: str) -> list:
+        """Indexed tokens matching term: the word itself and, for longer terms, words it prefixes"""
+        if len(term) < PREFIX_MIN_LENGTH:
+            return [term] if term in self.postings else []
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + "\uffff")
+        return self.vocabulary[start:end]
+
+    def search(self, query: str, category: str = None, content_type: str = None,
+               skip: int = 0, limit: int = 50) -> list:
+        """Items matching any query term, most relevant first"""
+        scores = np.zeros(len(self.items), np.float32)
+        for term in set(tokenize(query)):
+            # A term scores its best matching word, so a prefix that matches
+            # several words of one item doesn't count them all
+            term_scores = np.zeros(len(self.items), np.float32)
+            for token in self._expand(term):
+                positions, weights = self.postings[token]
+                factor = 1.0 if token == term else PREFIX_MATCH_FACTOR
+                # positions are unique within one token's postings
+                term_scores[positions] = np.maximum(term_scores[positions], weights * factor)
+            scores += term_scores
+
+        candidates = np.flatnonzero(scores)
+        if category:
+            candidates = candidates[self.categories[candidates] == category]
+        if content_type:
+            candidates = candidates[self.content_types[candidates] == content_type]
+
+        wanted = skip + limit
+        if len(candidates) > wanted:
+            # Keep everything scoring at least the wanted-th best, ties included
+            kth_best = np.partition(scores[candidates], len(candidates) - wanted)[len(candidates) - wanted]
+            candidates = candidates[scores[candidates] >= kth_best]
+        # Highest score first; ties keep catalog order
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [self.items[position] for position in ranked[skip:wanted]]
+
+
+# ============= IN-PROCESS INDEX =============
+
+_index = None  # (catalog version, InvertedIndex)
+
+
+async def build_index() -> InvertedIndex:
+    """Inverted index over the current catalog, rebuilt when the catalog version moves"""
+    global _index
+    catalog = await get_catalog()
+    if _index is None or _index[0] != catalog.version:
+        _index = (catalog.version, InvertedIndex(catalog.docs))
+        logger.info(f"Built content search index over {len(catalog.docs)} items (catalog version {catalog.version})")
+    return _index[1]
+
+
+# ============= SEARCH =============
+
+_text_index_missing = False
+
+
+async def _mongo_search(query: str, filters: dict, skip: int, limit: int) -> list:
+    cursor = content_collection.find(
+        {"$text": {"$search": query}, **filters},
+        {"_id": 0, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).skip(skip).limit(limit)
+    items = await cursor.to_list(limit)
+    for item in items:
+        item.pop("score", None)
+    return items
+
+
+async def search_content(query: str, category: str = None, content_type: str = None,
+                         skip: int = 0, limit: int = 50) -> list:
+    """Content items matching `query`, most relevant first"""
+    global _text_index_missing
+    if CONTENT_SEARCH_BACKEND == "mongo" and not _text_index_missing:
+        filters = {}
+        if category:
+            filters["category"] = category
+        if content_type:
+            filters["content_type"] = content_type
+        try:
+            docs = await _mongo_search(query, filters, skip, limit)
+            return (await get_catalog()).resolve(docs)
+        except OperationFailure as e:
+            # "text index required for $text query"; don't retry on every request
+            logger.warning(f"Text search unavailable, using the in-process index: {e}")
+            _text_index_missing = True
+    index = await build_index()
+    catalog = await get_catalog()
+    return catalog.resolve(index.search(query, category, content_type, skip, limit))
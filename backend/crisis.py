@@ -0,0 +1,124 @@
+"""
+Crisis keyword detection for chat messages.
+
+The lexicon (crisis_lexicon.json, or CRISIS_LEXICON_PATH) is compiled into
+one Aho-Corasick automaton, so a message is scanned once no matter how many
+phrases there are. Phrases match at the start of a word and may continue
+into a longer word ("overdose" matches "overdosed"), but not from the middle
+of one. The file is re-read automatically when it changes on disk.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+import ahocorasick
+
+logger = logging.getLogger(__name__)
+
+LEXICON_PATH = Path(os.getenv("CRISIS_LEXICON_PATH", Path(__file__).parent / "crisis_lexicon.json"))
+RELOAD_CHECK_SECONDS = 5.0
+
+# Most severe first
+LEVELS = ["critical", "high", "moderate"]
+
+# Typographic apostrophes from phone keyboards count as plain ones
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "ʼ": "'"})
+
+
+class CrisisResult(NamedTuple):
+    level: Optional[str]  # most severe level matched, or None
+    phrases: List[str]    # matched lexicon phrases, in message order
+
+
+def _normalize(text: str) -> str:
+    # Case, typographic apostrophes and runs of whitespace don't matter.
+    # The cheap checks skip the slower rewrites for ordinary messages.
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(_APOSTROPHES)
+    # Tabs, newlines and other whitespace besides " " aren't printable
+    if "  " in text or not text.isprintable():
+        text = " ".join(text.split())
+    return text
+
+
+def compile_lexicon(lexicon: dict):
+    """Aho-Corasick automaton mapping each normalized phrase to (level, phrase, length)"""
+    automaton = ahocorasick.Automaton()
+    for level in reversed(LEVELS):
+        # A phrase listed under several levels keeps the most severe one
+        for phrase in lexicon.get(level, []):
+            key = _normalize(phrase)
+            automaton.add_word(key, (level, phrase, len(key)))
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
+class CrisisMatcher:
+    def __init__(self, lexicon: dict):
+        self.lexicon = lexicon
+        self.automaton = compile_lexicon(lexicon)
+
+    @classmethod
+    def from_file(cls, path: Path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, message: str) -> CrisisResult:
+        """Most severe level and every matched phrase, in a single scan"""
+        if not message or self.automaton is None:
+            return CrisisResult(None, [])
+        text = _normalize(message)
+        hits = []
+        for end, (level, phrase, length) in self.automaton.iter(text):
+            start = end - length + 1
+            # Only matches that begin a word count
+            if start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                continue
+            hits.append((start, level, phrase))
+        if not hits:
+            return CrisisResult(None, [])
+        hits.sort(key=lambda hit: hit[0])
+        level = min((hit[1] for hit in hits), key=LEVELS.index)
+        return CrisisResult(level, [phrase for _, _, phrase in hits])
+
+
+class _ReloadingMatcher:
+    """Matcher for LEXICON_PATH that recompiles when the file's mtime changes"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._mtime = None
+        self._checked_at = 0.0
+        self._matcher = CrisisMatcher({})
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = self.path.stat().st_mtime
+            if mtime != self._mtime:
+                self._matcher = CrisisMatcher.from_file(self.path)
+                self._mtime = mtime
+                logger.info(f"Loaded crisis lexicon from {self.path}")
+        except (OSError, ValueError) as e:
+            # Keep serving the last good lexicon
+            logger.error(f"Could not load crisis lexicon {self.path}: {e}")
+        self._checked_at = time.monotonic()
+
+    def match(self, message: str) -> CrisisResult:
+        if time.monotonic() - self._checked_at >= RELOAD_CHECK_SECONDS:
+            self._reload()
+        return self._matcher.match(message)
+
+
+_default_matcher = _ReloadingMatcher(LEXICON_PATH)
+
+
+def detect_crisis(message: str) -> CrisisResult:
+    """Classify a message against the shared lexicon"""
+    return _default_matcher.match(message)
@@ -1,5 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+from datetime import timezone
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -7,7 +8,9 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Timestamps are stored as native BSON dates and decoded as aware UTC datetimes;
+# calendar days (mood log "date", rollup buckets) stay "YYYY-MM-DD" strings
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
 db = client[os.environ['DB_NAME']]
 
 # Collections
@@ -19,12 +22,21 @@ caregiver_invitations_collection = db.caregiver_invitations
 caregiver_relationships_collection = db.caregiver_relationships
 notifications_collection = db.notifications
 push_subscriptions_collection = db.push_subscriptions
+mood_stats_collection = db.mood_stats  # Rollup maintained by mood_stats.py
+outbound_jobs_collection = db.outbound_jobs  # Email/push queue drained by outbox.py
+response_cache_collection = db.response_cache  # Shared LLM response cache (cache.py)
+suggestion_cache_collection = db.suggestion_cache  # Precomputed daily suggestions (suggestions.py)
+scheduled_runs_collection = db.scheduled_runs  # Once-a-day job claims shared by app workers (suggestions.py)
+content_meta_collection = db.content_meta  # Catalog version, bumped by seed_content.py
+migrations_collection = db.migrations  # Checkpoints of one-off data migrations (migrate_datetimes.py)
 
 # ADHD Tools Collections
 tasks_collection = db.tasks
 pomodoro_sessions_collection = db.pomodoro_sessions
 pomodoro_settings_collection = db.pomodoro_settings
 dopamine_items_collection = db.dopamine_items
+gamification_state_collection = db.gamification_state  # Rewards counters maintained by gamification.py
+energy_histogram_collection = db.energy_histogram  # Hour-of-day buckets maintained by energy_histogram.py
 
 async def close_db_connection():
     client.close()
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Per-user hour-of-day energy histogram behind /tools/energy/patterns.
+
+One energy_histogram document per user holds, for each of the last
+WINDOW_DAYS days, 24-bucket sums keyed by hour (UTC):
+
+    days.<YYYY-MM-DD>.logs.<hour>    mood logs written in that hour
+    days.<YYYY-MM-DD>.energy.<hour>  their energy (5 when not recorded)
+    days.<YYYY-MM-DD>.mood.<hour>    their mood rating
+    days.<YYYY-MM-DD>.focus.<hour>   completed sessions with focus_rating >= 7, by start hour
+
+Mood log and session writes adjust the buckets with an atomic $inc, so
+"last N days" is a single read summing at most WINDOW_DAYS x 24 counters.
+Logs created by a bulk import (imported: true) are left out: their
+timestamp is the import time, not when the mood was felt, so one import
+would otherwise pile its whole history into a single hour.
+Days older than the window are dropped on read. Users without a document
+are rebuilt on first read; until then, writes leave the histogram alone.
+
+    python energy_histogram.py --rebuild [--user USER_ID]
+"""
+import asyncio
+import logging
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+from pymongo.errors import DuplicateKeyError
+
+from database import energy_histogram_collection, mood_logs_collection, pomodoro_sessions_collection
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 90
+FOCUS_RATING_THRESHOLD = 7
+DEFAULT_ENERGY = 5
+FIELDS = ("logs", "energy", "mood", "focus")
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _cutoff(today: date) -> str:
+    return (today - timedelta(days=WINDOW_DAYS)).isoformat()
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def log_delta(log: dict, sign: int = 1) -> dict:
+    """$inc document for adding (sign=1) or removing (sign=-1) one mood log"""
+    logged_at = _as_datetime(log.get('timestamp')) if log and not log.get('imported') else None
+    if logged_at is None:
+        return {}
+    prefix = f"days.{logged_at.date().isoformat()}"
+    hour = logged_at.hour
+    return {
+        f"{prefix}.logs.{hour}": sign,
+        f"{prefix}.energy.{hour}": sign * (log.get('energy') or DEFAULT_ENERGY),
+        f"{prefix}.mood.{hour}": sign * log['mood_rating'],
+    }
+
+
+def is_focus_session(session: dict) -> bool:
+    return (
+        bool(session)
+        and session.get('status') == 'completed'
+        and (session.get('focus_rating') or 0) >= FOCUS_RATING_THRESHOLD
+    )
+
+
+def session_delta(session: dict, sign: int = 1) -> dict:
+    """$inc document for a high-focus session: counted on its created day, at its start hour"""
+    if not is_focus_session(session):
+        return {}
+    created_at = _as_datetime(session.get('created_at'))
+    started_at = _as_datetime(session.get('started_at'))
+    if created_at is None or started_at is None:
+        return {}
+    return {f"days.{created_at.date().isoformat()}.focus.{started_at.hour}": sign}
+
+
+def _merge(*deltas) -> dict:
+    merged = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] = merged.get(field, 0) + value
+    return {field: value for field, value in merged.items() if value}
+
+
+async def _apply(user_id: str, delta: dict):
+    cutoff = _cutoff(_today())
+    # Only days still in the window; "days." + YYYY-MM-DD sorts like the date
+    delta = {field: value for field, value in delta.items() if field[5:15] >= cutoff}
+    if not delta:
+        return
+    try:
+        # No upsert: a partial document would hide the user's history from the first-read rebuild
+        await energy_histogram_collection.update_one({"user_id": user_id}, {"$inc": delta})
+    except Exception as e:
+        # The log/session write already succeeded; drift is repaired by --rebuild
+        logger.error(f"Failed to update energy histogram for user {user_id}: {e}")
+
+
+async def record_log_energy(user_id: str, old_log: dict, new_log: dict):
+    """Swap a mood log's old contribution (None on create) for its new one (None on delete)"""
+    await _apply(user_id, _merge(log_delta(old_log, -1), log_delta(new_log, 1)))
+
+
+async def record_logs_energy(user_id: str, changes: list):
+    """Roll a batch of (old_log or None, new_log) upserts into the histogram in one update"""
+    await _apply(user_id, _merge(*(
+        delta for old_log, new_log in changes for delta in (log_delta(old_log, -1), log_delta(new_log, 1))
+    )))
+
+
+async def record_session_focus(user_id: str, old_session: dict, new_session: dict):
+    """Apply a pomodoro session update to the focus buckets"""
+    await _apply(user_id, _merge(session_delta(old_session, -1), session_delta(new_session, 1)))
+
+
+# ============= READS =============
+
+def hour_histogram(histogram: dict, days: int, today: date) -> tuple:
+    """(energy sum, mood sum, log count, focus sessions) arrays of length 24 over the last `days` days"""
+    since = (today - timedelta(days=days)).isoformat()
+    totals = {field: np.zeros(24) for field in FIELDS}
+    for day, buckets in histogram.get("days", {}).items():
+        if day < since:
+            continue
+        for field in FIELDS:
+            for hour, value in (buckets.get(field) or {}).items():
+                totals[field][int(hour)] += value
+    return totals["energy"], totals["mood"], totals["logs"].astype(np.int64), totals["focus"].astype(np.int64)
+
+
+async def load_histogram(user_id: str) -> dict:
+    """The user's histogram, rebuilt if missing; days past the window are pruned"""
+    histogram = await energy_histogram_collection.find_one({"user_id": user_id}, {"_id": 0})
+    if histogram is None:
+        return await rebuild_user(user_id)
+    cutoff = _cutoff(_today())
+    stale = [day for day in histogram.get("days", {}) if day < cutoff]
+    if stale:
+        await energy_histogram_collection.update_one(
+            {"user_id": user_id}, {"$unset": {f"days.{day}": "" for day in stale}}
+        )
+        for day in stale:
+            del histogram["days"][day]
+    return histogram
+
+
+# ============= REBUILD =============
+
+async def rebuild_user(user_id: str) -> dict:
+    """Recompute one user's histogram from their mood logs and sessions in the window
+
+    Meant for backfill: a log or session written mid-rebuild may be lost.
+    """
+    since = datetime.combine(date.fromisoformat(_cutoff(_today())), time(), tzinfo=timezone.utc)
+    delta = {}
+    async for log in mood_logs_collection.find(
+        {"user_id": user_id, "timestamp": {"$gte": since}},
+        {"_id": 0, "timestamp": 1, "mood_rating": 1, "energy": 1, "imported": 1}
+    ):
+        delta = _merge(delta, log_delta(log))
+    async for session in pomodoro_sessions_collection.find(
+        {"user_id": user_id, "status": "completed",
+         "focus_rating": {"$gte": FOCUS_RATING_THRESHOLD}, "created_at": {"$gte": since}},
+        {"_id": 0, "status": 1, "focus_rating": 1, "created_at": 1, "started_at": 1}
+    ):
+        delta = _merge(delta, session_delta(session))
+
+    histogram = {"user_id": user_id, "days": {}}
+    for path, value in delta.items():
+        _, day, field, hour = path.split(".")
+        histogram["days"].setdefault(day, {}).setdefault(field, {})[hour] = value
+    try:
+        await energy_histogram_collection.replace_one({"user_id": user_id}, histogram, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first read rebuilt the same user
+        pass
+    return histogram
+
+
+async def rebuild(user_id: str = None) -> int:
+    """Rebuild one user's histogram, or every user with mood logs or sessions; returns the number rebuilt"""
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = set(await mood_logs_collection.distinct("user_id"))
+        user_ids.update(await pomodoro_sessions_collection.distinct("user_id"))
+    for uid in user_ids:
+        await rebuild_user(uid)
+    return len(user_ids)
+
+
+async def main(argv):
+    if "--rebuild" not in argv:
+        print(__doc__)
+        return
+    user_id = argv[argv.index("--user") + 1] if "--user" in argv else None
+    rebuilt = await rebuild(user_id)
+    print(f"✅ Rebuilt energy histograms for {rebuilt} users")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
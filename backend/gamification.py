@@ -0,0 +1,304 @@
+"""
+Materialized per-user rewards state behind /tools/rewards/stats.
+
+One gamification_state document per user holds the running totals, XP,
+level, last activity date, current streak and per-day task/session counts
+for the last RECENT_DAYS days. Task, chunk and session updates apply their
+change with a compare-and-set on the document's version token, so the stats
+endpoint is a single read by user_id.
+
+Totals mirror what is currently stored: reopening or deleting a completed
+task takes its counts back out. The streak only ever moves forward on new
+activity; a rebuild recomputes it from the stored completion dates. Users
+without a state document are rebuilt on first read.
+
+    python gamification.py --rebuild [--user USER_ID]
+"""
+import asyncio
+import logging
+import sys
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from database import gamification_state_collection, tasks_collection, pomodoro_sessions_collection
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 8  # enough per-day counts for "last 7 days" on either side of midnight
+MAX_CAS_ATTEMPTS = 5
+DEFAULT_FOCUS_MINUTES = 25
+
+COUNTERS = ("tasks_completed", "chunks_completed", "sessions_completed", "focus_minutes")
+
+# (id, name, description, icon, stat, threshold)
+BADGES = [
+    ("first_task", "First Step", "Completed your first task", "rocket", "total_tasks_completed", 1),
+    ("task_master_10", "Task Master", "Completed 10 tasks", "trophy", "total_tasks_completed", 10),
+    ("task_master_50", "Task Champion", "Completed 50 tasks", "crown", "total_tasks_completed", 50),
+    ("focus_warrior", "Focus Warrior", "Completed 10 focus sessions", "flame", "total_sessions", 10),
+    ("focus_master", "Focus Master", "Completed 50 focus sessions", "zap", "total_sessions", 50),
+    ("streak_3", "On Fire", "3-day streak", "fire", "current_streak", 3),
+    ("streak_7", "Weekly Warrior", "7-day streak", "star", "current_streak", 7),
+    ("streak_30", "Unstoppable", "30-day streak", "medal", "current_streak", 30),
+    ("hour_focus", "Hour of Power", "1 hour total focus time", "clock", "total_focus_minutes", 60),
+    ("ten_hour_focus", "Focus Legend", "10 hours total focus time", "award", "total_focus_minutes", 600),
+]
+
+
+def activity_day(value):
+    """YYYY-MM-DD of a stored timestamp (ISO string or datetime), or None"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).date().isoformat()
+        except ValueError:
+            return None
+    return None
+
+
+def session_minutes(session: dict) -> int:
+    for field in ("actual_duration_minutes", "planned_duration_minutes"):
+        if session.get(field) is not None:
+            return session[field]
+    return DEFAULT_FOCUS_MINUTES
+
+
+def task_contribution(task: dict) -> dict:
+    # Chunks only count once their task is completed
+    if not task or task.get('status') != 'completed':
+        return {"tasks_completed": 0, "chunks_completed": 0}
+    return {
+        "tasks_completed": 1,
+        "chunks_completed": sum(1 for chunk in task.get('chunks') or [] if chunk.get('is_completed')),
+    }
+
+
+def session_contribution(session: dict) -> dict:
+    completed = bool(session) and session.get('status') == 'completed'
+    return {
+        "sessions_completed": 1 if completed else 0,
+        "focus_minutes": session_minutes(session) if completed else 0,
+    }
+
+
+def empty_state(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        **{counter: 0 for counter in COUNTERS},
+        "xp": 0,
+        "level": 1,
+        "last_activity_date": None,
+        "streak": 0,
+        "days": {},
+    }
+
+
+def _derive(state: dict) -> dict:
+    state["xp"] = state["tasks_completed"] * 10 + state["sessions_completed"] * 5 + state["chunks_completed"] * 2
+    state["level"] = 1 + state["tasks_completed"] // 5 + state["sessions_completed"] // 10
+    return state
+
+
+def apply_change(state: dict, delta: dict, today: str, dated: list = ()) -> dict:
+    """New state after adding `delta` to the totals
+
+    `dated` lists (day, "tasks" | "sessions", amount) changes to the per-day
+    counts. A newly completed task or session is activity today and extends
+    the streak; other changes (e.g. chunk toggles) don't.
+    """
+    state = {**state, "days": {day: dict(counts) for day, counts in state.get("days", {}).items()}}
+    for counter in COUNTERS:
+        state[counter] = state.get(counter, 0) + delta.get(counter, 0)
+
+    cutoff = (date.fromisoformat(today) - timedelta(days=RECENT_DAYS - 1)).isoformat()
+    for day, kind, amount in dated:
+        if day and day >= cutoff:
+            counts = state["days"].setdefault(day, {})
+            counts[kind] = counts.get(kind, 0) + amount
+    state["days"] = {day: counts for day, counts in state["days"].items() if day >= cutoff}
+
+    if any(day and amount > 0 for day, _, amount in dated):
+        last = state.get("last_activity_date")
+        yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
+        if last == yesterday:
+            state["streak"] = state.get("streak", 0) + 1
+        elif last != today:
+            state["streak"] = 1
+        state["last_activity_date"] = max(last or today, today)
+    return _derive(state)
+
+
+def reward_stats(state: dict, today: date) -> dict:
+    """The /tools/rewards/stats response for a state document"""
+    yesterday = (today - timedelta(days=1)).isoformat()
+    last = state.get("last_activity_date")
+    current_streak = state.get("streak", 0) if last and last >= yesterday else 0
+    week_ago = (today - timedelta(days=7)).isoformat()
+    recent = [counts for day, counts in state.get("days", {}).items() if day > week_ago]
+    stats = {
+        "current_streak": current_streak,
+        "total_tasks_completed": state["tasks_completed"],
+        "total_chunks_completed": state["chunks_completed"],
+        "total_focus_minutes": state["focus_minutes"],
+        "total_sessions": state["sessions_completed"],
+    }
+    stats["badges"] = [
+        {"id": badge_id, "name": name, "description": description, "icon": icon}
+        for badge_id, name, description, icon, stat, threshold in BADGES
+        if stats[stat] >= threshold
+    ]
+    stats["weekly_tasks"] = sum(counts.get("tasks", 0) for counts in recent)
+    stats["weekly_sessions"] = sum(counts.get("sessions", 0) for counts in recent)
+    stats["level"] = state["level"]
+    stats["xp"] = state["xp"]
+    return stats
+
+
+# ============= UPDATES =============
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+async def _update_state(user_id: str, delta: dict, dated: list):
+    for _ in range(MAX_CAS_ATTEMPTS):
+        state = await gamification_state_collection.find_one({"user_id": user_id}, {"_id": 0})
+        if state is None:
+            # The triggering write already landed, so a rebuild includes it
+            await rebuild_user(user_id)
+            return
+        new_state = apply_change(state, delta, _today(), dated)
+        new_state["version"] = str(uuid.uuid4())
+        result = await gamification_state_collection.replace_one(
+            {"user_id": user_id, "version": state.get("version")}, new_state
+        )
+        if result.matched_count:
+            return
+    logger.warning(f"Gamification state for user {user_id} kept changing underneath; rebuilding")
+    await rebuild_user(user_id)
+
+
+async def _record(user_id: str, before: dict, after: dict, dated: list):
+    delta = {counter: after[counter] - before[counter] for counter in after}
+    if not any(delta.values()):
+        return
+    try:
+        await _update_state(user_id, delta, dated)
+    except Exception as e:
+        # The task/session write already succeeded; drift is repaired by --rebuild
+        logger.error(f"Failed to update gamification state for user {user_id}: {e}")
+
+
+async def record_task_change(user_id: str, old_task: dict, new_task: dict):
+    """Apply a task update (or deletion, with new_task=None) to the user's state"""
+    before, after = task_contribution(old_task), task_contribution(new_task)
+    dated = []
+    if after["tasks_completed"] > before["tasks_completed"]:
+        dated.append((activity_day(new_task.get('completed_at')), "tasks", 1))
+    elif after["tasks_completed"] < before["tasks_completed"]:
+        dated.append((activity_day(old_task.get('completed_at')), "tasks", -1))
+    await _record(user_id, before, after, dated)
+
+
+async def record_session_change(user_id: str, old_session: dict, new_session: dict):
+    """Apply a pomodoro session update to the user's state"""
+    before, after = session_contribution(old_session), session_contribution(new_session)
+    dated = []
+    if after["sessions_completed"] > before["sessions_completed"]:
+        dated.append((activity_day(new_session.get('ended_at')), "sessions", 1))
+    elif after["sessions_completed"] < before["sessions_completed"]:
+        dated.append((activity_day(old_session.get('ended_at')), "sessions", -1))
+    await _record(user_id, before, after, dated)
+
+
+async def load_state(user_id: str) -> dict:
+    state = await gamification_state_collection.find_one({"user_id": user_id}, {"_id": 0})
+    return state or await rebuild_user(user_id)
+
+
+# ============= REBUILD =============
+
+async def rebuild_user(user_id: str) -> dict:
+    """Recompute one user's state from their tasks and sessions
+
+    Meant for backfill: a task or session update landing mid-rebuild may be lost.
+    """
+    today = _today()
+    cutoff = (date.fromisoformat(today) - timedelta(days=RECENT_DAYS - 1)).isoformat()
+    state = empty_state(user_id)
+    activity = set()
+
+    def count_day(day, kind):
+        activity.add(day)
+        if day >= cutoff:
+            counts = state["days"].setdefault(day, {})
+            counts[kind] = counts.get(kind, 0) + 1
+
+    async for task in tasks_collection.find(
+        {"user_id": user_id, "status": "completed"},
+        {"_id": 0, "status": 1, "completed_at": 1, "chunks.is_completed": 1}
+    ):
+        contribution = task_contribution(task)
+        state["tasks_completed"] += contribution["tasks_completed"]
+        state["chunks_completed"] += contribution["chunks_completed"]
+        day = activity_day(task.get('completed_at'))
+        if day:
+            count_day(day, "tasks")
+
+    async for session in pomodoro_sessions_collection.find(
+        {"user_id": user_id, "status": "completed"},
+        {"_id": 0, "ended_at": 1, "actual_duration_minutes": 1, "planned_duration_minutes": 1}
+    ):
+        state["sessions_completed"] += 1
+        state["focus_minutes"] += session_minutes(session)
+        day = activity_day(session.get('ended_at'))
+        if day:
+            count_day(day, "sessions")
+
+    if activity:
+        last = max(activity)
+        streak = 0
+        day = date.fromisoformat(last)
+        while day.isoformat() in activity:
+            streak += 1
+            day -= timedelta(days=1)
+        state["last_activity_date"] = last
+        state["streak"] = streak
+
+    state = _derive(state)
+    state["version"] = str(uuid.uuid4())
+    try:
+        await gamification_state_collection.replace_one({"user_id": user_id}, state, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first read rebuilt the same user
+        pass
+    return state
+
+
+async def rebuild(user_id: str = None) -> int:
+    """Rebuild one user's state, or every user with tasks or sessions; returns the number rebuilt"""
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = set(await tasks_collection.distinct("user_id"))
+        user_ids.update(await pomodoro_sessions_collection.distinct("user_id"))
+    for uid in user_ids:
+        await rebuild_user(uid)
+    return len(user_ids)
+
+
+async def main(argv):
+    if "--rebuild" not in argv:
+        print(__doc__)
+        return
+    user_id = argv[argv.index("--user") + 1] if "--user" in argv else None
+    rebuilt = await rebuild(user_id)
+    print(f"✅ Rebuilt gamification state for {rebuilt} users")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,233 @@
+"""
+Declarative index registry for the MongoDB collections.
+
+ensure_indexes() runs from the FastAPI startup hook and is idempotent:
+create_index is a no-op when an identical index already exists.
+
+Run directly to report which hot queries are still not covered by an index:
+
+    python indexes.py --report
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# collection name -> list of (keys, options)
+INDEXES = {
+    "users": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("email", ASCENDING)], {"unique": True}),
+    ],
+    "mood_logs": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("date", DESCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ],
+    "mood_stats": [
+        ([("user_id", ASCENDING), ("period", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+    ],
+    "chat_history": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "content": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("category", ASCENDING), ("content_type", ASCENDING)], {}),
+        ([("title", TEXT), ("tags", TEXT), ("description", TEXT)],
+         {"name": "content_text", "weights": {"title": 10, "tags": 5, "description": 1}}),
+    ],
+    "caregiver_invitations": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("patient_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("patient_id", ASCENDING), ("caregiver_email", ASCENDING), ("status", ASCENDING)], {}),
+        ([("caregiver_email", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "caregiver_relationships": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("patient_id", ASCENDING), ("caregiver_id", ASCENDING)], {}),
+        ([("caregiver_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+        ([("patient_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+        ([("patient_id", ASCENDING), ("caregiver_email", ASCENDING)], {}),
+    ],
+    "notifications": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "outbound_jobs": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("dedup_key", ASCENDING)], {"unique": True, "partialFilterExpression": {"dedup_key": {"$type": "string"}}}),
+        ([("channel", ASCENDING), ("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        ([("status", ASCENDING), ("updated_at", DESCENDING)], {}),
+    ],
+    "response_cache": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "suggestion_cache": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "scheduled_runs": [
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "push_subscriptions": [
+        ([("user_id", ASCENDING), ("endpoint", ASCENDING)], {"unique": True}),
+    ],
+    "tasks": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "pomodoro_sessions": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], {}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "pomodoro_settings": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "gamification_state": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "energy_histogram": [
+        ([("user_id", ASCENDING)], {"unique": True}),
+    ],
+    "dopamine_items": [
+        ([("id", ASCENDING)], {"unique": True}),
+        ([("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+        ([("user_id", ASCENDING), ("category", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+}
+
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Representative shapes of the queries server.py issues on the request path:
+# (collection name, filter, sort)
+HOT_QUERIES = [
+    ("users", {"email": "user@example.com"}, None),
+    ("users", {"id": "user-id"}, None),
+    ("users", {"id": {"$in": ["user-id", "other-id"]}}, None),
+    ("mood_logs", {"user_id": "user-id", "date": "2024-01-01"}, None),
+    ("mood_logs", {"id": "log-id", "user_id": "user-id"}, None),
+    ("mood_logs", {"user_id": "user-id", "date": {"$gte": "2024-01-01"}}, [("date", -1)]),
+    ("mood_logs", {"user_id": "user-id", "timestamp": {"$gte": SINCE}}, None),
+    ("mood_stats", {"user_id": {"$in": ["user-id", "other-id"]}, "period": "day", "bucket": {"$gte": "2024-01-01"}, "count": {"$gt": 0}}, [("user_id", 1), ("bucket", -1)]),
+    ("mood_stats", {"user_id": {"$in": ["user-id", "other-id"]}, "period": "day", "count": {"$gt": 0}}, None),
+    ("chat_history", {"user_id": "user-id"}, None),
+    ("content", {"id": "1"}, None),
+    ("content", {"category": "adhd", "content_type": "article"}, None),
+    ("caregiver_invitations", {"patient_id": "user-id"}, [("created_at", -1), ("id", -1)]),
+    ("caregiver_invitations", {"caregiver_email": "user@example.com", "status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("caregiver_relationships", {"patient_id": "user-id", "caregiver_id": "user-id"}, None),
+    ("caregiver_relationships", {"patient_id": "user-id", "permissions.receive_alerts": True}, None),
+    ("caregiver_relationships", {"caregiver_id": "user-id"}, [("created_at", 1), ("id", 1)]),
+    ("caregiver_relationships", {"patient_id": "user-id"}, [("created_at", 1), ("id", 1)]),
+    ("notifications", {"user_id": "user-id"}, [("created_at", -1), ("id", -1)]),
+    ("notifications", {"user_id": "user-id", "is_read": False}, [("created_at", -1), ("id", -1)]),
+    ("outbound_jobs", {"channel": "email", "send_alone": {"$ne": True}, "status": "pending", "next_attempt_at": {"$lte": SINCE}}, [("next_attempt_at", 1)]),
+    ("push_subscriptions", {"user_id": "user-id"}, None),
+    ("tasks", {"user_id": "user-id"}, [("created_at", -1), ("id", -1)]),
+    ("tasks", {"user_id": "user-id", "status": "pending"}, [("created_at", -1), ("id", -1)]),
+    ("tasks", {"user_id": "user-id", "status": "completed"}, None),
+    ("pomodoro_sessions", {"user_id": "user-id"}, [("created_at", -1), ("id", -1)]),
+    ("pomodoro_sessions", {"user_id": "user-id", "status": "completed", "created_at": {"$gte": SINCE}}, None),
+    ("pomodoro_settings", {"user_id": "user-id"}, None),
+    ("gamification_state", {"user_id": "user-id"}, None),
+    ("energy_histogram", {"user_id": "user-id"}, None),
+    ("dopamine_items", {"user_id": "user-id"}, [("created_at", 1), ("id", 1)]),
+    ("dopamine_items", {"user_id": "user-id", "category": "micro"}, [("created_at", 1), ("id", 1)]),
+]
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def ensure_indexes():
+    """Create every registered index; failures are logged, never raised. Returns how many failed"""
+    created = 0
+    failed = 0
+    for collection_name, specs in INDEXES.items():
+        collection = db[collection_name]
+        for keys, options in specs:
+            try:
+                await collection.create_index(keys, **options)
+                created += 1
+            except OperationFailure as e:
+                failed += 1
+                if e.code == DUPLICATE_KEY_ERROR:
+                    logger.error(
+                        f"Unique index {keys} on {collection_name} NOT built: existing documents share a key. "
+                        f"Uniqueness is not enforced until the duplicates are removed and the app restarted: {e}"
+                    )
+                else:
+                    # e.g. an existing index with the same name but different options
+                    logger.error(f"Could not create index {keys} on {collection_name}: {e}")
+    if failed:
+        logger.error(f"Ensured {created} indexes across {len(INDEXES)} collections; {failed} FAILED (see above)")
+    else:
+        logger.info(f"Ensured {created} indexes across {len(INDEXES)} collections")
+    return failed
+
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten a winningPlan tree into its list of stage names"""
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return [s for s in stages if s]
+
+
+async def report_uncovered_queries() -> list:
+    """Explain every hot query and return those that scan or sort in memory"""
+    uncovered = []
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        # Newer servers wrap the classic plan in a queryPlan document
+        stages = _plan_stages(winning_plan.get("queryPlan", winning_plan))
+        problems = []
+        if "COLLSCAN" in stages:
+            problems.append("COLLSCAN")
+        if "SORT" in stages:
+            problems.append("in-memory SORT")
+        if problems:
+            uncovered.append({
+                "collection": collection_name,
+                "query": query,
+                "sort": sort,
+                "problems": problems,
+                "stages": stages
+            })
+    return uncovered
+
+
+async def main(argv):
+    if "--report" in argv:
+        uncovered = await report_uncovered_queries()
+        if not uncovered:
+            print(f"✅ All {len(HOT_QUERIES)} hot queries are covered by an index")
+        for item in uncovered:
+            sort = f" sort={item['sort']}" if item['sort'] else ""
+            print(f"❌ {item['collection']} {item['query']}{sort}: {', '.join(item['problems'])} ({' <- '.join(item['stages'])})")
+    else:
+        failed = await ensure_indexes()
+        if failed:
+            print(f"❌ {failed} indexes could not be created; see the log above")
+        else:
+            print(f"✅ Indexes ensured for {len(INDEXES)} collections")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
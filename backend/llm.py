@@ -0,0 +1,285 @@
+"""
+Shared gateway for every chat model call.
+
+Endpoints call llm_gateway.complete() / stream() with a call-site name
+instead of building their own LlmChat. The gateway bounds concurrent model
+calls, applies a per-call timeout, retries transient failures with jittered
+exponential backoff and records latency and token counts per call site
+(llm.<call_site> in /api/metrics/latency and /api/metrics/counters).
+
+Backends, chosen with LLM_BACKEND:
+
+- "emergent" (default): LlmChat with EMERGENT_LLM_KEY. When
+  EMERGENT_LLM_BASE_URL points at an OpenAI-compatible endpoint for the
+  key, calls go through litellm (which LlmChat is built on) over one
+  long-lived keep-alive HTTP client, and replies can be streamed.
+- "stub": canned replies with no network, for tests and benchmarks.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import httpx
+
+from metrics import record_latency, increment
+
+logger = logging.getLogger(__name__)
+
+CHAT_PROVIDER = "openai"
+CHAT_MODEL = "gpt-5.2"
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE_SECONDS = 0.5
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection failures and 408/429/5xx responses; other errors would fail again"""
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status_code, int) and (status_code in (408, 429) or status_code >= 500)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) when the backend reports no usage"""
+    return max(1, len(text) // 4) if text else 0
+
+
+# ============= BACKENDS =============
+
+class LlmChatBackend:
+    """emergentintegrations LlmChat; it exposes no client to reuse, so one is built per call"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    async def complete(self, system_message: str, text: str, session_id: str):
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(CHAT_PROVIDER, CHAT_MODEL)
+        reply = await chat.send_message(UserMessage(text=text))
+        return reply, None
+
+    async def stream(self, system_message: str, text: str, session_id: str):
+        # No streaming API: the whole reply arrives as one chunk
+        reply, _ = await self.complete(system_message, text, session_id)
+        yield reply
+
+    async def aclose(self):
+        pass
+
+
+class LiteLLMBackend:
+    """litellm against an OpenAI-compatible endpoint over a shared keep-alive client"""
+
+    def __init__(self, api_key: str, base_url: str):
+        import litellm
+        self.litellm = litellm
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_CONCURRENCY * 2, max_keepalive_connections=LLM_CONCURRENCY),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+        )
+        litellm.aclient_session = self.client
+
+    def _request(self, system_message: str, text: str, **kwargs):
+        return self.litellm.acompletion(
+            model=f"{CHAT_PROVIDER}/{CHAT_MODEL}",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": text}
+            ],
+            api_key=self.api_key,
+            api_base=self.base_url,
+            **kwargs
+        )
+
+    async def complete(self, system_message: str, text: str, session_id: str):
+        response = await self._request(system_message, text)
+        usage = getattr(response, "usage", None)
+        tokens = (usage.prompt_tokens, usage.completion_tokens) if usage else None
+        return response.choices[0].message.content or "", tokens
+
+    async def stream(self, system_message: str, text: str, session_id: str):
+        response = await self._request(system_message, text, stream=True)
+        async for chunk in response:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                yield content
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class StubBackend:
+    """Offline backend: instant, deterministic replies shaped like what callers parse"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.calls = []
+
+    def reply_for(self, system_message: str, text: str) -> str:
+        if "json array" in text.lower():
+            return json.dumps([{
+                "activity": "Stub Breathing Exercise",
+                "title": "Stub first step",
+                "description": "A placeholder suggestion from the stub LLM backend",
+                "duration": "5-10 min",
+                "category": "mindfulness",
+                "benefit": "Lets tests run without a model",
+                "estimated_minutes": 5
+            }])
+        if "JSON" in text or "JSON" in system_message:
+            return json.dumps({"why_this_helps": "Stub reply", "steps": [], "success_tips": []})
+        return f"Stub reply to: {text[:80]}"
+
+    async def complete(self, system_message: str, text: str, session_id: str):
+        self.calls.append({"system_message": system_message, "text": text, "session_id": session_id})
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self.reply_for(system_message, text), None
+
+    async def stream(self, system_message: str, text: str, session_id: str):
+        reply, _ = await self.complete(system_message, text, session_id)
+        for word in reply.split(" "):
+            yield word + " "
+
+    async def aclose(self):
+        pass
+
+
+def backend_from_env():
+    """Backend selected by LLM_BACKEND, or None when the AI service isn't configured"""
+    if os.getenv("LLM_BACKEND", "emergent") == "stub":
+        return StubBackend(float(os.getenv("LLM_STUB_LATENCY_MS", "0")) / 1000)
+    api_key = os.getenv("EMERGENT_LLM_KEY")
+    if not api_key:
+        return None
+    base_url = os.getenv("EMERGENT_LLM_BASE_URL")
+    return LiteLLMBackend(api_key, base_url) if base_url else LlmChatBackend(api_key)
+
+
+# ============= GATEWAY =============
+
+_END_OF_STREAM = object()
+
+
+class LLMNotConfiguredError(RuntimeError):
+    pass
+
+
+class LLMGateway:
+    def __init__(self, backend=None, concurrency: int = LLM_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @property
+    def configured(self) -> bool:
+        return self.backend is not None
+
+    def _require_backend(self):
+        if self.backend is None:
+            raise LLMNotConfiguredError("AI service not configured")
+        return self.backend
+
+    def _record_tokens(self, call_site: str, tokens, system_message: str, text: str, reply: str):
+        prompt_tokens, completion_tokens = tokens or (estimate_tokens(system_message + text), estimate_tokens(reply))
+        increment(f"llm.{call_site}.prompt_tokens", prompt_tokens)
+        increment(f"llm.{call_site}.completion_tokens", completion_tokens)
+
+    async def complete(self, call_site: str, system_message: str, text: str, session_id: str = None) -> str:
+        """Full reply to `text`, retried on failure or timeout"""
+        backend = self._require_backend()
+        session_id = session_id or f"{call_site}_{time.time_ns()}"
+        for attempt in range(self.max_retries + 1):
+            # The slot is held per attempt, so a backoff doesn't keep other calls waiting
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    reply, tokens = await asyncio.wait_for(
+                        backend.complete(system_message, text, session_id), self.timeout
+                    )
+                except Exception as e:
+                    record_latency(f"llm.{call_site}", time.perf_counter() - start, ok=False)
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+                else:
+                    record_latency(f"llm.{call_site}", time.perf_counter() - start)
+                    self._record_tokens(call_site, tokens, system_message, text, reply)
+                    return reply
+            delay = random.uniform(0, RETRY_BASE_SECONDS * 2 ** attempt)
+            logger.warning(f"LLM call {call_site} failed (attempt {attempt + 1}), retrying in {delay:.2f}s: {error!r}")
+            await asyncio.sleep(delay)
+
+    async def _pump(self, call_site: str, system_message: str, text: str, session_id: str, queue: asyncio.Queue):
+        """Read the backend's stream into `queue`, holding a concurrency slot only until it ends"""
+        backend = self._require_backend()
+        async with self._semaphore:
+            start = time.perf_counter()
+            pieces = []
+            ok = False
+            chunks = backend.stream(system_message, text, session_id).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    pieces.append(chunk)
+                    queue.put_nowait(chunk)
+                ok = True
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                if hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                record_latency(f"llm.{call_site}", time.perf_counter() - start, ok)
+                if ok:
+                    self._record_tokens(call_site, None, system_message, text, "".join(pieces))
+        queue.put_nowait(_END_OF_STREAM)
+
+    async def stream(self, call_site: str, system_message: str, text: str, session_id: str = None):
+        """Yield the reply in pieces; not retried, since pieces may already be delivered
+
+        The timeout applies to the wait for each piece. The reply is buffered
+        as it arrives, so a slow reader doesn't keep a concurrency slot.
+        """
+        self._require_backend()
+        session_id = session_id or f"{call_site}_{time.time_ns()}"
+        queue = asyncio.Queue()
+        pump = asyncio.create_task(self._pump(call_site, system_message, text, session_id, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The reader went away or failed: stop reading the model's reply
+            if not pump.done():
+                pump.cancel()
+            await asyncio.gather(pump, return_exceptions=True)
+
+    async def aclose(self):
+        if self.backend is not None:
+            await self.backend.aclose()
+
+
+llm_gateway = LLMGateway(backend_from_env())
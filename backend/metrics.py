@@ -0,0 +1,80 @@
+"""
+In-process latency metrics and counters.
+
+Each named operation keeps its most recent samples in a bounded window, so
+percentiles reflect current behaviour and memory stays flat. Counters are
+plain running totals (e.g. tokens per LLM call site); gauges hold a current
+level (e.g. a queue depth) and the highest level seen. Numbers are per
+worker process and reset on restart.
+"""
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+WINDOW_SIZE = 1000  # samples kept per metric
+
+_samples = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+_counts = defaultdict(lambda: {"count": 0, "errors": 0})
+_counters = defaultdict(int)
+_gauges = defaultdict(lambda: {"current": 0, "max": 0})
+
+
+def record_latency(name: str, seconds: float, ok: bool = True):
+    """Record one sample for the named operation"""
+    _samples[name].append(seconds)
+    _counts[name]["count"] += 1
+    if not ok:
+        _counts[name]["errors"] += 1
+
+
+def increment(name: str, amount: int = 1):
+    """Add to a running counter"""
+    _counters[name] += amount
+
+
+def set_gauge(name: str, value: float):
+    """Set the current level of a gauge"""
+    _gauges[name]["current"] = value
+    _gauges[name]["max"] = max(_gauges[name]["max"], value)
+
+
+@asynccontextmanager
+async def timed(name: str):
+    """Time the enclosed block; an exception counts as an error and is re-raised"""
+    start = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        record_latency(name, time.perf_counter() - start, ok)
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary() -> dict:
+    """count, errors and p50/p95/max in milliseconds for every metric"""
+    summary = {}
+    for name, samples in sorted(_samples.items()):
+        ordered = sorted(samples)
+        summary[name] = {
+            **_counts[name],
+            "p50_ms": round(_percentile(ordered, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2)
+        }
+    return summary
+
+
+def counter_summary() -> dict:
+    """Current value of every counter"""
+    return dict(sorted(_counters.items()))
+
+
+def gauge_summary() -> dict:
+    """Current and peak level of every gauge"""
+    return {name: dict(gauge) for name, gauge in sorted(_gauges.items())}
@@ -0,0 +1,170 @@
+"""
+One-time migration of ISO-string timestamps to native BSON dates.
+
+Documents written before the switch store created_at, timestamp, due_date
+and the like as isoformat() strings. This converts them in place, one
+collection at a time and BATCH_SIZE documents per bulk write. Each update
+is conditional on the field still holding the string it read, so a
+concurrent request that rewrote the document wins. The last _id done per
+collection is checkpointed in the migrations collection after every
+batch, so an interrupted run resumes where it stopped. The checkpoint is
+cleared once a collection is done: a rerun scans it again from the start
+and picks up strings an old worker wrote during a rolling deploy, while
+documents already converted no longer match and are skipped.
+
+    python migrate_datetimes.py [--dry-run] [--collection NAME] [--batch-size N]
+
+Run it when deploying the switch; until a document is converted, date range
+filters (which now compare BSON dates) skip it.
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from database import db, migrations_collection
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "bson_datetimes"
+BATCH_SIZE = 1000
+
+# collection name -> timestamp fields; "array.field" converts inside each array element
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "mood_logs": ["timestamp"],
+    "chat_history": ["created_at", "updated_at", "messages.timestamp"],
+    "content": ["created_at"],
+    "caregiver_invitations": ["created_at", "expires_at"],
+    "caregiver_relationships": ["created_at"],
+    "notifications": ["created_at"],
+    "push_subscriptions": ["created_at"],
+    "outbound_jobs": ["created_at", "updated_at", "next_attempt_at", "locked_until", "sent_at"],
+    "tasks": ["created_at", "updated_at", "due_date", "completed_at", "chunks.completed_at"],
+    "pomodoro_sessions": ["created_at", "started_at", "ended_at"],
+    "dopamine_items": ["created_at", "last_used_at"],
+}
+
+
+def parse_timestamp(value):
+    """Aware UTC datetime for an ISO string (naive strings are taken as UTC), else None"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def stored_datetime(value):
+    """A stored timestamp as an aware UTC datetime, whether or not its document was migrated yet"""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return parse_timestamp(value)
+
+
+def converted_fields(doc: dict, fields: list) -> dict:
+    """{top-level field: new value} for every string timestamp in doc that parses"""
+    update = {}
+    for field in fields:
+        if "." in field:
+            array_field, inner = field.split(".", 1)
+            elements = update.get(array_field, doc.get(array_field))
+            if not isinstance(elements, list):
+                continue
+            changed = False
+            new_elements = []
+            for element in elements:
+                if isinstance(element, dict) and isinstance(element.get(inner), str):
+                    parsed = parse_timestamp(element[inner])
+                    if parsed:
+                        element = {**element, inner: parsed}
+                        changed = True
+                new_elements.append(element)
+            if changed:
+                update[array_field] = new_elements
+        elif isinstance(doc.get(field), str):
+            parsed = parse_timestamp(doc[field])
+            if parsed:
+                update[field] = parsed
+    return update
+
+
+async def migrate_collection(name: str, fields: list, batch_size: int = BATCH_SIZE, dry_run: bool = False) -> int:
+    """Convert one collection, resuming from its checkpoint; returns the number of documents converted"""
+    collection = db[name]
+    checkpoint = await migrations_collection.find_one({"_id": MIGRATION_ID}) or {}
+    last_id = checkpoint.get("collections", {}).get(name)
+    has_strings = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field.split(".")[0]: 1 for field in fields}
+
+    converted = 0
+    unparseable = 0
+    while True:
+        query = has_strings if last_id is None else {"$and": [{"_id": {"$gt": last_id}}, has_strings]}
+        docs = await collection.find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        operations = []
+        for doc in docs:
+            update = converted_fields(doc, fields)
+            if not update:
+                unparseable += 1
+                continue
+            # Only if the fields still hold what was read
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], **{field: doc.get(field) for field in update}},
+                {"$set": update}
+            ))
+        converted += len(operations)
+        last_id = docs[-1]["_id"]
+        if not dry_run:
+            if operations:
+                await collection.bulk_write(operations, ordered=False)
+            await migrations_collection.update_one(
+                {"_id": MIGRATION_ID},
+                {"$set": {f"collections.{name}": last_id, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        logger.info(f"{name}: {converted} documents converted so far")
+
+    if not dry_run:
+        await migrations_collection.update_one(
+            {"_id": MIGRATION_ID},
+            {"$unset": {f"collections.{name}": ""}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+        )
+    if unparseable:
+        logger.warning(f"{name}: {unparseable} documents have timestamp strings that don't parse; left as is")
+    return converted
+
+
+async def migrate(collections: list = None, batch_size: int = BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Convert every registered collection (or the named ones); returns {collection: documents converted}"""
+    results = {}
+    for name, fields in DATETIME_FIELDS.items():
+        if collections and name not in collections:
+            continue
+        results[name] = await migrate_collection(name, fields, batch_size, dry_run)
+    return results
+
+
+async def main(argv):
+    collections = [argv[argv.index("--collection") + 1]] if "--collection" in argv else None
+    if collections and collections[0] not in DATETIME_FIELDS:
+        print(f"❌ Unknown collection {collections[0]}; expected one of {', '.join(DATETIME_FIELDS)}")
+        return
+    batch_size = int(argv[argv.index("--batch-size") + 1]) if "--batch-size" in argv else BATCH_SIZE
+    dry_run = "--dry-run" in argv
+    results = await migrate(collections, batch_size, dry_run)
+    verb = "Would convert" if dry_run else "Converted"
+    for name, converted in results.items():
+        print(f"✅ {name}: {verb.lower()} {converted} documents")
+    print(f"✅ {verb} {sum(results.values())} documents to BSON dates")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
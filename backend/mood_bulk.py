@@ -0,0 +1,326 @@
+"""
+Bulk mood-log import and export.
+
+Import accepts a JSON array or NDJSON body of MoodLogCreate records and
+parses it as it arrives, so memory stays flat however large the upload.
+Valid records are written IMPORT_BATCH_SIZE at a time as unordered upserts
+on (user_id, date): a record for a date that already has a log replaces its
+fields, keeping the log's id. Every rejected record is reported by its
+position in the body. The mood_stats rollup and the energy histogram are
+adjusted once per batch from the pre-images read just before the write; a log
+changed concurrently by another request can drift them, which their --rebuild
+repairs.
+
+Logs a batch inserts are marked imported: their timestamp is the import
+time, so the hour-of-day energy histogram leaves them out. A record that
+replaces an existing log keeps that log's timestamp and marker.
+
+Export streams NDJSON or CSV straight from a Mongo cursor.
+"""
+import codecs
+import csv
+import io
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import mood_logs_collection
+from energy_histogram import record_logs_energy
+from models import MoodLogCreate
+from mood_stats import record_logs_upserted
+from suggestions import refresh_in_background
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+MOOD_IMPORT_MAX_ITEMS = 20_000
+MAX_RECORD_BYTES = 64 * 1024  # a single record larger than this is treated as malformed
+MAX_REPORTED_ERRORS = 100
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+EXPORT_FIELDS = ["id", "date", "mood_rating", "mood_tag", "medication_taken", "sleep_hours", "notes", "symptoms", "timestamp"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class BulkFormatError(ValueError):
+    """The body can't be split into records (as opposed to one bad record)"""
+
+
+# ============= PARSING =============
+
+async def _text_chunks(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _loads(line: str) -> tuple:
+    try:
+        return json.loads(line), None
+    except json.JSONDecodeError as e:
+        return None, f"Malformed JSON: {e.msg}"
+
+
+async def _ndjson_records(first: str, texts):
+    buffer = first
+    while True:
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield _loads(line)
+        if len(buffer) > MAX_RECORD_BYTES:
+            raise BulkFormatError(f"Line longer than {MAX_RECORD_BYTES} bytes")
+        text = await anext(texts, None)
+        if text is None:
+            break
+        buffer += text
+    if buffer.strip():
+        yield _loads(buffer)
+
+
+def _skip_whitespace(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+async def _array_records(first: str, texts):
+    decoder = json.JSONDecoder()
+    buffer = first
+    pos = _skip_whitespace(buffer, 0) + 1  # past the opening "["
+    state = "first"  # "first" value or "]", a "value", a "separator", or "end"
+    finished = False
+    while True:
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if state == "end":
+                raise BulkFormatError("Unexpected data after the closing ']'")
+            if state == "separator":
+                if char not in ",]":
+                    raise BulkFormatError(f"Expected ',' or ']' at offset {pos}")
+                state = "value" if char == "," else "end"
+                pos += 1
+                continue
+            if state == "first" and char == "]":
+                state = "end"
+                pos += 1
+                continue
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if finished:
+                    raise BulkFormatError(f"Malformed JSON at offset {pos}: {e.msg}")
+                if len(buffer) - pos > MAX_RECORD_BYTES:
+                    raise BulkFormatError(f"Record longer than {MAX_RECORD_BYTES} bytes at offset {pos}")
+                break  # most likely cut off mid-record; wait for more of the body
+            if end == len(buffer) and not finished and not isinstance(record, (dict, list)):
+                break  # a number or literal may continue in the next chunk
+            yield record, None
+            pos = end
+            state = "separator"
+        if finished:
+            break
+        text = await anext(texts, None)
+        buffer = buffer[pos:] + (text or "")
+        pos = 0
+        finished = text is None
+    if state != "end":
+        raise BulkFormatError("Body ended before the closing ']'")
+
+
+async def iter_records(chunks):
+    """(record, error) for each item of a JSON array or NDJSON body, parsed as it arrives"""
+    texts = _text_chunks(chunks)
+    first = ""
+    async for text in texts:
+        first += text
+        if first.strip():
+            break
+    if not first.strip():
+        return
+    records = _array_records if first.lstrip()[0] == "[" else _ndjson_records
+    async for item in records(first, texts):
+        yield item
+
+
+def validate_record(record) -> tuple:
+    """(MoodLogCreate, None) for a valid record, else (None, error message)"""
+    if not isinstance(record, dict):
+        return None, "Expected a JSON object"
+    try:
+        log = MoodLogCreate(**record)
+    except ValidationError as e:
+        return None, "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+    try:
+        datetime.strptime(log.date, "%Y-%m-%d")
+    except ValueError:
+        return None, "date: expected YYYY-MM-DD"
+    return log, None
+
+
+# ============= IMPORT =============
+
+def _reject(report: dict, index: int, error: str, date: str = None):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        entry = {"index": index, "error": error}
+        if date:
+            entry["date"] = date
+        report["errors"].append(entry)
+    else:
+        report["errors_truncated"] = True
+
+
+async def _write_batch(user_id: str, batch: list, report: dict):
+    """Upsert one batch of (index, MoodLogCreate) and roll the results into mood_stats and the energy histogram"""
+    if not batch:
+        return
+    dates = [log.date for _, log in batch]
+    existing = {
+        doc['date']: doc
+        for doc in await mood_logs_collection.find(
+            {"user_id": user_id, "date": {"$in": dates}}, {"_id": 0}
+        ).to_list(len(dates))
+    }
+    now = datetime.now(timezone.utc)
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "date": log.date},
+            {
+                "$set": log.model_dump(exclude={"date"}),
+                "$setOnInsert": {"id": str(uuid.uuid4()), "timestamp": now, "imported": True}
+            },
+            upsert=True
+        )
+        for _, log in batch
+    ]
+
+    write_errors = {}
+    try:
+        await mood_logs_collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        write_errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+
+    changes = []
+    for position, (index, log) in enumerate(batch):
+        if position in write_errors:
+            _reject(report, index, write_errors[position], log.date)
+            continue
+        old_log = existing.get(log.date)
+        report["updated" if old_log else "inserted"] += 1
+        if old_log:
+            stored = {"timestamp": old_log.get('timestamp', now), "imported": old_log.get('imported', False)}
+        else:
+            stored = {"timestamp": now, "imported": True}
+        changes.append((old_log, {"user_id": user_id, **log.model_dump(), **stored}))
+    await record_logs_upserted(changes)
+    await record_logs_energy(user_id, changes)
+
+
+async def import_mood_logs(user_id: str, chunks) -> dict:
+    """Upsert the user's mood logs from a streamed body; returns the per-item report"""
+    started = time.perf_counter()
+    report = {"received": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    seen_dates = set()
+    batch = []
+    try:
+        async for record, error in iter_records(chunks):
+            index = report["received"]
+            if index >= MOOD_IMPORT_MAX_ITEMS:
+                _reject(report, index, f"Import limit of {MOOD_IMPORT_MAX_ITEMS} records reached; the rest of the body was ignored")
+                break
+            report["received"] += 1
+            log = None
+            if not error:
+                log, error = validate_record(record)
+            if not error and log.date in seen_dates:
+                error = "Duplicate date earlier in this import"
+            if error:
+                _reject(report, index, error, record.get('date') if isinstance(record, dict) else None)
+                continue
+            seen_dates.add(log.date)
+            batch.append((index, log))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await _write_batch(user_id, batch, report)
+                batch = []
+    except BulkFormatError as e:
+        if report["received"] == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        # Everything before the damage is still imported
+        _reject(report, report["received"], str(e))
+    await _write_batch(user_id, batch, report)
+
+    elapsed = time.perf_counter() - started
+    report["seconds"] = round(elapsed, 3)
+    report["logs_per_second"] = round((report["inserted"] + report["updated"]) / elapsed) if elapsed > 0 else None
+    logger.info(f"Imported mood logs for user {user_id}: {report['inserted']} inserted, "
+                f"{report['updated']} updated, {report['failed']} failed in {elapsed:.2f}s")
+
+    if datetime.now(timezone.utc).strftime("%Y-%m-%d") in seen_dates:
+        refresh_in_background(user_id)
+    return report
+
+
+# ============= EXPORT =============
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if isinstance(value, dict):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+async def export_mood_logs(user_id: str, fmt: str = "ndjson", start_date: str = None, end_date: str = None):
+    """Yield the user's mood logs oldest first as NDJSON or CSV, in chunks of about EXPORT_FLUSH_BYTES"""
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        date_filter = {}
+        if start_date:
+            date_filter["$gte"] = start_date
+        if end_date:
+            date_filter["$lte"] = end_date
+        query["date"] = date_filter
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+    exported = 0
+    async for doc in mood_logs_collection.find(query, {"_id": 0, "user_id": 0}).sort("date", 1):
+        if writer:
+            writer.writerow([_csv_value(doc.get(field)) for field in EXPORT_FIELDS])
+        else:
+            buffer.write(json.dumps(doc, default=_json_default))
+            buffer.write("\n")
+        exported += 1
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    logger.info(f"Exported {exported} mood logs for user {user_id} as {fmt}")
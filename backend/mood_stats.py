@@ -0,0 +1,295 @@
+"""
+Incremental per-user mood statistics rollup.
+
+Every mood log contributes to one "day" bucket and one "week" bucket (keyed
+by the Monday of its ISO week) in the mood_stats collection. create, update
+and delete adjust those buckets with atomic $inc, so the analytics endpoints
+read O(buckets) instead of O(logs).
+
+Rebuild the rollup from the raw logs (all users, or one):
+
+    python mood_stats.py --rebuild [--user USER_ID]
+"""
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from database import mood_logs_collection, mood_stats_collection
+
+logger = logging.getLogger(__name__)
+
+LOW_MOOD_THRESHOLD = 3  # ratings at or below this count as a very low mood day
+RECENT_DAYS_HORIZON = 90  # "recent" logged days are looked for this far back, no further
+
+
+def week_start(date_str: str):
+    """Monday of the ISO week containing date_str, or None if it doesn't parse"""
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+    return (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+
+
+def _bucket_keys(log: dict) -> list:
+    keys = [("day", log['date'])]
+    week = week_start(log['date'])
+    if week:
+        keys.append(("week", week))
+    return keys
+
+
+def log_delta(log: dict, sign: int = 1) -> dict:
+    """$inc document for adding (sign=1) or removing (sign=-1) one log"""
+    rating = log['mood_rating']
+    delta = {
+        "count": sign,
+        "mood_sum": sign * rating,
+        "medication_count": sign if log.get('medication_taken') else 0,
+        # Only logs that record the field; a log without it isn't a missed dose
+        "medication_missed_count": sign if 'medication_taken' in log and not log['medication_taken'] else 0,
+        "low_mood_count": sign if rating <= LOW_MOOD_THRESHOLD else 0,
+    }
+    for symptom, value in (log.get('symptoms') or {}).items():
+        # Keys that aren't valid field names can't be counted under symptoms.*
+        if value and '.' not in symptom and not symptom.startswith('$'):
+            delta[f"symptoms.{symptom}"] = sign
+    return delta
+
+
+def _merge(*deltas) -> dict:
+    merged = {}
+    for delta in deltas:
+        for field, value in delta.items():
+            merged[field] = merged.get(field, 0) + value
+    return {field: value for field, value in merged.items() if value}
+
+
+def _upserts(user_id: str, date_str: str, delta: dict) -> list:
+    return [
+        UpdateOne(
+            {"user_id": user_id, "period": period, "bucket": bucket},
+            {"$inc": delta},
+            upsert=True
+        )
+        for period, bucket in _bucket_keys({"date": date_str})
+    ]
+
+
+async def _apply(user_id: str, date_str: str, delta: dict):
+    if not delta:
+        return
+    try:
+        await mood_stats_collection.bulk_write(_upserts(user_id, date_str, delta), ordered=False)
+    except Exception as e:
+        # The log write already succeeded; drift is repaired by --rebuild
+        logger.error(f"Failed to update mood_stats for user {user_id}: {e}")
+
+
+async def record_log_created(log: dict):
+    """Roll a newly inserted log into its buckets"""
+    await _apply(log['user_id'], log['date'], log_delta(log, 1))
+
+
+async def record_log_updated(old_log: dict, new_log: dict):
+    """Swap a log's old contribution for its new one in a single $inc"""
+    await _apply(new_log['user_id'], new_log['date'], _merge(log_delta(old_log, -1), log_delta(new_log, 1)))
+
+
+async def record_log_deleted(log: dict):
+    """Remove a deleted log's contribution from its buckets"""
+    await _apply(log['user_id'], log['date'], log_delta(log, -1))
+
+
+async def record_logs_upserted(changes: list):
+    """Roll a batch of (old_log or None, new_log) upserts into their buckets in one bulk write"""
+    buckets = {}
+    for old_log, new_log in changes:
+        delta = log_delta(new_log, 1)
+        if old_log:
+            delta = _merge(log_delta(old_log, -1), delta)
+        for period, bucket in _bucket_keys(new_log):
+            key = (new_log['user_id'], period, bucket)
+            buckets[key] = _merge(buckets.get(key, {}), delta)
+    try:
+        await _flush(buckets)
+    except Exception as e:
+        # The log writes already succeeded; drift is repaired by --rebuild
+        logger.error(f"Failed to update mood_stats for {len(changes)} imported logs: {e}")
+
+
+def _window_filter(start_date: str) -> dict:
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    first_monday = start + timedelta(days=(7 - start.weekday()) % 7)
+    first_monday_str = first_monday.strftime("%Y-%m-%d")
+    return {"$or": [
+        {"period": "week", "bucket": {"$gte": first_monday_str}},
+        {"period": "day", "bucket": {"$gte": start_date, "$lt": first_monday_str}}
+    ]}
+
+
+async def load_stat_buckets(user_id: str, start_date: str) -> list:
+    """Buckets covering every log dated on or after start_date, oldest first
+
+    Whole weeks come from week buckets; the days before the first full week
+    come from day buckets, so the result is exact with at most 6 day reads.
+    """
+    query = {"user_id": user_id, **_window_filter(start_date)}
+    buckets = await mood_stats_collection.find(query, {"_id": 0}).sort("bucket", 1).to_list(None)
+    return [b for b in buckets if b.get('count', 0) > 0]
+
+
+async def load_stat_buckets_for_users(user_ids: list, start_date: str) -> dict:
+    """load_stat_buckets for several users in one query: {user_id: buckets}"""
+    if not user_ids:
+        return {}
+    query = {"user_id": {"$in": user_ids}, **_window_filter(start_date)}
+    by_user = {}
+    async for bucket in mood_stats_collection.find(query, {"_id": 0}).sort([("user_id", 1), ("bucket", 1)]):
+        if bucket.get('count', 0) > 0:
+            by_user.setdefault(bucket['user_id'], []).append(bucket)
+    return by_user
+
+
+def _recent_floor() -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=RECENT_DAYS_HORIZON)).strftime("%Y-%m-%d")
+
+
+async def recent_stat_days(user_id: str, limit: int = 7) -> list:
+    """Most recent day buckets (one per logged day) within RECENT_DAYS_HORIZON, newest first"""
+    return await mood_stats_collection.find(
+        {"user_id": user_id, "period": "day", "bucket": {"$gte": _recent_floor()}, "count": {"$gt": 0}},
+        {"_id": 0}
+    ).sort("bucket", -1).limit(limit).to_list(limit)
+
+
+async def recent_stat_days_for_users(user_ids: list, limit: int = 7) -> dict:
+    """recent_stat_days for several users in one aggregation: {user_id: day buckets}
+
+    The horizon bounds what $group collects to RECENT_DAYS_HORIZON buckets per
+    user, however old the account.
+    """
+    if not user_ids:
+        return {}
+    results = await mood_stats_collection.aggregate([
+        {"$match": {
+            "user_id": {"$in": user_ids},
+            "period": "day",
+            "bucket": {"$gte": _recent_floor()},
+            "count": {"$gt": 0}
+        }},
+        {"$sort": {"user_id": 1, "bucket": -1}},
+        {"$group": {
+            "_id": "$user_id",
+            # Only the fields the concern checks read, to keep the pushed arrays small
+            "days": {"$push": {
+                "bucket": "$bucket",
+                "count": "$count",
+                "low_mood_count": {"$ifNull": ["$low_mood_count", 0]},
+                "medication_count": {"$ifNull": ["$medication_count", 0]},
+                "medication_missed_count": {"$ifNull": ["$medication_missed_count", 0]}
+            }}
+        }},
+        {"$project": {"days": {"$slice": ["$days", limit]}}}
+    ]).to_list(None)
+    return {result["_id"]: result["days"] for result in results}
+
+
+async def last_log_dates_for_users(user_ids: list) -> dict:
+    """Date of each user's latest logged day, however long ago: {user_id: "YYYY-MM-DD"}"""
+    if not user_ids:
+        return {}
+    results = await mood_stats_collection.aggregate([
+        {"$match": {"user_id": {"$in": user_ids}, "period": "day", "count": {"$gt": 0}}},
+        {"$group": {"_id": "$user_id", "last": {"$max": "$bucket"}}}
+    ]).to_list(None)
+    return {result["_id"]: result["last"] for result in results}
+
+
+def summarize_stats(buckets: list) -> dict:
+    """Combine ordered buckets into totals, symptom counts and half-period averages"""
+    total = sum(b['count'] for b in buckets)
+    summary = {
+        "total_logs": total,
+        "mood_sum": sum(b['mood_sum'] for b in buckets),
+        "medication_count": sum(b.get('medication_count', 0) for b in buckets),
+        "symptom_counts": {},
+        "first_half_avg": None,
+        "second_half_avg": None,
+    }
+    for bucket in buckets:
+        for symptom, count in bucket.get('symptoms', {}).items():
+            if count > 0:
+                summary["symptom_counts"][symptom] = summary["symptom_counts"].get(symptom, 0) + count
+
+    # Split the period in two by log count; a bucket is never divided
+    half = total // 2
+    if half > 0:
+        first = {"count": 0, "mood_sum": 0}
+        second = {"count": 0, "mood_sum": 0}
+        target = first
+        for bucket in buckets:
+            if target is first and first["count"] + bucket['count'] > half:
+                target = second
+            target["count"] += bucket['count']
+            target["mood_sum"] += bucket['mood_sum']
+        if first["count"] and second["count"]:
+            summary["first_half_avg"] = first["mood_sum"] / first["count"]
+            summary["second_half_avg"] = second["mood_sum"] / second["count"]
+    return summary
+
+
+async def _flush(buckets: dict):
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "period": period, "bucket": bucket},
+            {"$inc": delta},
+            upsert=True
+        )
+        for (user_id, period, bucket), delta in buckets.items() if delta
+    ]
+    for i in range(0, len(operations), 1000):
+        await mood_stats_collection.bulk_write(operations[i:i + 1000], ordered=False)
+
+
+async def rebuild(user_id: str = None) -> int:
+    """Recompute the rollup from raw mood logs; returns the number of logs rolled up
+
+    Meant to run offline: writes that land during a rebuild may be lost.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    await mood_stats_collection.delete_many(query)
+
+    buckets = {}
+    current_user = None
+    rolled_up = 0
+    projection = {"_id": 0, "user_id": 1, "date": 1, "mood_rating": 1, "medication_taken": 1, "symptoms": 1}
+    # Walk the logs user by user so only one user's buckets are held in memory
+    async for log in mood_logs_collection.find(query, projection).sort("user_id", 1):
+        if log['user_id'] != current_user:
+            await _flush(buckets)
+            buckets = {}
+            current_user = log['user_id']
+        for period, bucket in _bucket_keys(log):
+            key = (log['user_id'], period, bucket)
+            buckets[key] = _merge(buckets.get(key, {}), log_delta(log, 1))
+        rolled_up += 1
+    await _flush(buckets)
+    return rolled_up
+
+
+async def main(argv):
+    if "--rebuild" not in argv:
+        print(__doc__)
+        return
+    user_id = argv[argv.index("--user") + 1] if "--user" in argv else None
+    rolled_up = await rebuild(user_id)
+    print(f"✅ Rebuilt mood_stats from {rolled_up} mood logs")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,340 @@
+"""
+Durable outbound queue for crisis emails and push notifications.
+
+Request handlers enqueue() a job into the outbound_jobs collection and
+return; a pool of worker tasks inside the app process claims due jobs,
+delivers them through a transport and retries failures with exponential
+backoff. Jobs that exhaust their attempts are parked as dead letters.
+
+Inspect or requeue dead letters:
+
+    python outbox.py --dead
+    python outbox.py --retry [JOB_ID]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import resend
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import outbound_jobs_collection, push_subscriptions_collection
+from metrics import record_latency
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 600
+LEASE_SECONDS = 60  # a claimed job is retried if its worker hasn't finished by then
+CLAIM_BATCH_SIZE = 50  # jobs per channel per pass; Resend accepts up to 100 emails per batch
+POLL_INTERVAL_SECONDS = 2.0
+CRISIS_DEDUP_WINDOW_SECONDS = 30 * 60
+
+CHANNELS = ("email", "push")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retry number `attempts`, doubling up to a cap, with 10% jitter"""
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * (1 + random.random() * 0.1)
+
+
+def crisis_dedup_key(channel: str, caregiver_id: str, patient_id: str, crisis_level: str,
+                     now: datetime = None) -> str:
+    """One alert per (channel, caregiver, patient, crisis level) per crisis window
+
+    The level is part of the key so an escalation within the window still alerts.
+    """
+    window = int((now or _now()).timestamp() // CRISIS_DEDUP_WINDOW_SECONDS)
+    return f"crisis:{channel}:{caregiver_id}:{patient_id}:{crisis_level}:{window}"
+
+
+# ============= TRANSPORTS =============
+
+class LiveTransport:
+    """Delivers email through Resend and push to the user's subscribed devices"""
+
+    async def send_emails(self, emails: list):
+        # The batch endpoint validates every email up front, so it either
+        # accepts the whole batch or raises
+        await asyncio.to_thread(resend.Batch.send, emails)
+
+    async def send_push(self, push: dict):
+        subscriptions = await push_subscriptions_collection.find({"user_id": push['user_id']}).to_list(10)
+        for sub in subscriptions:
+            # In production, use web-push library
+            # For now, we store the notification intent
+            logger.info(f"Push notification queued for user {push['user_id']}: {push['title']}")
+
+
+class FakeTransport:
+    """Records deliveries in memory; fail_next() makes upcoming calls raise
+
+    Like Resend's batch endpoint, a batch containing an email to one of
+    `rejected_recipients` fails as a whole.
+    """
+
+    def __init__(self):
+        self.email_batches = []
+        self.pushes = []
+        self.rejected_recipients = set()
+        self._failures = 0
+
+    def fail_next(self, count: int = 1):
+        self._failures += count
+
+    def _maybe_fail(self):
+        if self._failures > 0:
+            self._failures -= 1
+            raise RuntimeError("Simulated transport failure")
+
+    @property
+    def emails(self) -> list:
+        return [email for batch in self.email_batches for email in batch]
+
+    async def send_emails(self, emails: list):
+        self._maybe_fail()
+        for email in emails:
+            to = email.get('to') or []
+            rejected = self.rejected_recipients.intersection([to] if isinstance(to, str) else to)
+            if rejected:
+                raise ValueError(f"Invalid recipient {', '.join(sorted(rejected))}")
+        self.email_batches.append(list(emails))
+
+    async def send_push(self, push: dict):
+        self._maybe_fail()
+        self.pushes.append(push)
+
+
+# ============= QUEUE =============
+
+_wake = asyncio.Event()
+
+
+async def enqueue(channel: str, payload: dict, dedup_key: str = None, collection=None) -> bool:
+    """Queue a job for delivery; returns False if dedup_key was already queued"""
+    if channel not in CHANNELS:
+        raise ValueError(f"Unknown outbound channel: {channel}")
+    now = _now()
+    job = {
+        "id": str(uuid.uuid4()),
+        "channel": channel,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "updated_at": now
+    }
+    if dedup_key:
+        job["dedup_key"] = dedup_key
+    try:
+        await (collection if collection is not None else outbound_jobs_collection).insert_one(job)
+    except DuplicateKeyError:
+        logger.info(f"Skipping duplicate outbound job {dedup_key}")
+        return False
+    _wake.set()
+    return True
+
+
+class OutboxWorker:
+    """Pool of worker tasks draining the outbound job queue"""
+
+    def __init__(self, collection=None, transport=None, concurrency: int = OUTBOX_WORKERS):
+        self.collection = collection if collection is not None else outbound_jobs_collection
+        self.transport = transport or LiveTransport()
+        self.concurrency = concurrency
+        self._tasks = []
+        self._stopping = False
+
+    async def _claim(self, channel: str, limit: int, send_alone: bool = False) -> list:
+        """Atomically lease up to `limit` due jobs of one channel
+
+        `send_alone` picks the jobs that must be delivered on their own rather
+        than batched with others.
+        """
+        jobs = []
+        while len(jobs) < limit:
+            now = _now()
+            job = await self.collection.find_one_and_update(
+                {"channel": channel, "send_alone": True if send_alone else {"$ne": True}, "$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "processing", "locked_until": {"$lte": now}}
+                ]},
+                {
+                    "$set": {
+                        "status": "processing",
+                        "locked_until": now + timedelta(seconds=LEASE_SECONDS),
+                        "updated_at": now
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("next_attempt_at", 1)],
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if not job:
+                break
+            jobs.append(job)
+        return jobs
+
+    async def _complete(self, jobs: list):
+        now = _now()
+        await self.collection.update_many(
+            {"id": {"$in": [job['id'] for job in jobs]}},
+            {"$set": {"status": "sent", "sent_at": now, "updated_at": now}, "$unset": {"locked_until": ""}}
+        )
+
+    async def _fail(self, jobs: list, error: Exception):
+        now = _now()
+        for job in jobs:
+            update = {"last_error": str(error)[:500], "updated_at": now}
+            if job['attempts'] >= MAX_ATTEMPTS:
+                update["status"] = "dead"
+                logger.error(f"Outbound {job['channel']} job {job['id']} dead after {job['attempts']} attempts: {error}")
+            else:
+                update["status"] = "pending"
+                update["next_attempt_at"] = now + timedelta(seconds=backoff_seconds(job['attempts']))
+                logger.warning(f"Outbound {job['channel']} job {job['id']} failed (attempt {job['attempts']}): {error}")
+            await self.collection.update_one(
+                {"id": job['id']},
+                {"$set": update, "$unset": {"locked_until": ""}}
+            )
+
+    async def _release_alone(self, jobs: list):
+        """Return leased jobs to the queue, to be claimed and sent one at a time
+
+        The attempt their claim counted is given back, since they weren't
+        sent on their own yet.
+        """
+        now = _now()
+        await self.collection.update_many(
+            {"id": {"$in": [job['id'] for job in jobs]}},
+            {
+                "$set": {"status": "pending", "send_alone": True, "next_attempt_at": now, "updated_at": now},
+                "$unset": {"locked_until": ""},
+                "$inc": {"attempts": -1}
+            }
+        )
+        _wake.set()
+
+    async def _attempt(self, channel: str, send):
+        """Run one transport call; returns the exception it raised, or None"""
+        start = time.perf_counter()
+        try:
+            await send()
+        except Exception as e:
+            record_latency(f"outbox.{channel}", time.perf_counter() - start, ok=False)
+            return e
+        record_latency(f"outbox.{channel}", time.perf_counter() - start)
+        return None
+
+    async def _deliver(self, channel: str, jobs: list, send):
+        error = await self._attempt(channel, send)
+        if error:
+            await self._fail(jobs, error)
+        else:
+            await self._complete(jobs)
+
+    async def _deliver_emails(self, jobs: list):
+        error = await self._attempt("email", lambda: self.transport.send_emails([job['payload'] for job in jobs]))
+        if not error:
+            await self._complete(jobs)
+        elif len(jobs) == 1:
+            await self._fail(jobs, error)
+        else:
+            # A batch is rejected as a whole. Sending the jobs one by one here
+            # could outlast the lease, so they go back to the queue to be
+            # claimed singly, and only the bad ones are retried
+            logger.warning(f"Email batch of {len(jobs)} failed, requeueing to send individually: {error}")
+            await self._release_alone(jobs)
+
+    async def process_once(self) -> int:
+        """Deliver one batch of due emails and pushes; returns how many jobs were handled"""
+        emails = await self._claim("email", CLAIM_BATCH_SIZE)
+        if emails:
+            await self._deliver_emails(emails)
+        alone = await self._claim("email", 1, send_alone=True)
+        if alone:
+            await self._deliver_emails(alone)
+
+        pushes = await self._claim("push", CLAIM_BATCH_SIZE)
+        for job in pushes:
+            await self._deliver("push", [job], lambda job=job: self.transport.send_push(job['payload']))
+        return len(emails) + len(alone) + len(pushes)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                if await self.process_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} outbox workers")
+
+    async def stop(self):
+        self._stopping = True
+        _wake.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def dead_letters(limit: int = 100) -> list:
+    """Most recently failed jobs that exhausted their retries"""
+    return await outbound_jobs_collection.find(
+        {"status": "dead"}, {"_id": 0}
+    ).sort("updated_at", -1).to_list(limit)
+
+
+async def retry_dead(job_id: str = None) -> int:
+    """Requeue one dead job, or all of them; returns the number requeued"""
+    query = {"status": "dead"}
+    if job_id:
+        query["id"] = job_id
+    result = await outbound_jobs_collection.update_many(
+        query,
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": _now()}}
+    )
+    return result.modified_count
+
+
+async def main(argv):
+    if "--dead" in argv:
+        jobs = await dead_letters()
+        if not jobs:
+            print("✅ No dead outbound jobs")
+        for job in jobs:
+            print(f"❌ {job['id']} {job['channel']} attempts={job['attempts']} updated={job['updated_at']}: {job.get('last_error')}")
+    elif "--retry" in argv:
+        index = argv.index("--retry")
+        job_id = argv[index + 1] if len(argv) > index + 1 else None
+        requeued = await retry_dead(job_id)
+        print(f"✅ Requeued {requeued} dead outbound jobs")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
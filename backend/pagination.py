@@ -0,0 +1,76 @@
+"""
+Keyset (seek) pagination with opaque cursors.
+
+A page is fetched in a fixed sort order that ends with a unique field
+(usually "id"). The cursor encodes the sort values of the last document
+returned, and the next page starts strictly after them. With a compound
+index on (filter fields..., sort fields...) every page is one index seek,
+so page 100 costs the same as page 1, unlike skip/limit.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+
+# Caps `limit` on endpoints that gained it with pagination. Endpoints that
+# already took a caller-chosen limit keep accepting any positive value.
+MAX_PAGE_SIZE = 200
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_length: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return [_decode_value(v) for v in values]
+
+
+def seek_filter(sort: list, values: list) -> dict:
+    """Documents strictly after `values` in `sort` order (lexicographic over the sort fields)"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$lt" if direction < 0 else "$gt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+async def fetch_page(collection, query: dict, sort: list, limit: int, cursor: str = None,
+                     projection: dict = None) -> tuple:
+    """(documents, next_cursor) for one page; next_cursor is None on the last page
+
+    `sort` is a list of (field, direction) pairs whose values together
+    identify a document, e.g. [("created_at", -1), ("id", -1)].
+    """
+    if cursor:
+        query = {"$and": [query, seek_filter(sort, decode_cursor(cursor, len(sort)))]}
+    docs = await collection.find(
+        query, projection if projection is not None else {"_id": 0}
+    ).sort(sort).limit(limit + 1).to_list(limit + 1)
+
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor([docs[-1].get(field) for field, _ in sort])
@@ -2,6 +2,7 @@
 Seed educational content into the database
 """
 from database import content_collection
+from content_catalog import bump_catalog_version
 import asyncio
 
 MENTAL_HEALTH_CONTENT = [
@@ -487,6 +488,10 @@ async def seed_content():
             print(f"✅ Successfully seeded {len(MENTAL_HEALTH_CONTENT)} content items")
         else:
             print("⚠️  No content to seed")
+        
+        # Running app workers reload the catalog when the version moves
+        version = await bump_catalog_version()
+        print(f"✅ Content catalog version is now {version}")
     except Exception as e:
         print(f"❌ Error seeding content: {e}")
 
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
@@ -6,11 +7,14 @@ import logging
 import asyncio
 import json
 import re
+import uuid
 from pathlib import Path
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from statistics import mean
 import resend
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 
 # Local imports
 from models import (
@@ -28,19 +32,47 @@ from models import (
     DopamineItem, DopamineItemCreate, DopamineItemUpdate
 )
 from auth import (
-    get_password_hash, verify_password, create_access_token, get_current_user_id
+    get_password_hash, verify_and_update_password, create_access_token, get_current_user_id,
+    CurrentUser, get_current_user_context, load_user, remember_user, invalidate_user
 )
 from database import (
-    users_collection, mood_logs_collection, chat_history_collection, content_collection,
+    users_collection, mood_logs_collection, chat_history_collection,
     caregiver_invitations_collection, caregiver_relationships_collection, notifications_collection,
     push_subscriptions_collection,
     # ADHD Tools
     tasks_collection, pomodoro_sessions_collection, pomodoro_settings_collection, dopamine_items_collection,
     close_db_connection
 )
-
-# AI Chat Integration
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from indexes import ensure_indexes
+from metrics import timed, latency_summary, counter_summary, gauge_summary
+from outbox import enqueue, crisis_dedup_key, OutboxWorker
+from llm import llm_gateway
+from crisis import detect_crisis
+from cache import ResponseCache, cache_key, normalize_text
+from singleflight import SingleFlight
+from pagination import fetch_page, MAX_PAGE_SIZE
+from mood_bulk import import_mood_logs, export_mood_logs, EXPORT_MEDIA_TYPES
+from migrate_datetimes import stored_datetime
+from caregiver_access import load_relationship, alert_relationships, invalidate_relationship
+from gamification import record_task_change, record_session_change, load_state, reward_stats
+from energy_histogram import (
+    record_log_energy, record_session_focus, load_histogram, hour_histogram, WINDOW_DAYS as ENERGY_WINDOW_DAYS
+)
+from content_catalog import get_catalog, load_catalog
+from content_search import search_content, build_index as build_content_index
+from suggestions import (
+    cached_suggestions, generate_suggestions, invalidate_suggestions,
+    refresh_in_background, SuggestionScheduler
+)
+from analytics import (
+    fetch_advanced_summary, build_advanced_analytics,
+    MoodFrame, frame_summary, energy_hour_scores, MAX_ANALYTICS_LOGS
+)
+from mood_stats import (
+    record_log_created, record_log_updated, record_log_deleted,
+    load_stat_buckets, recent_stat_days, summarize_stats,
+    load_stat_buckets_for_users, recent_stat_days_for_users, last_log_dates_for_users
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -55,126 +87,131 @@ app = FastAPI(title="Mental Health Companion API")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Identical model requests from the same user that overlap (double taps,
+# retries, reconnects) share one call; a result stays shareable briefly after
+LLM_SINGLEFLIGHT_RETENTION_SECONDS = float(os.getenv("LLM_SINGLEFLIGHT_RETENTION_SECONDS", "5"))
+llm_flights = SingleFlight(retention_seconds=LLM_SINGLEFLIGHT_RETENTION_SECONDS)
+# Chat only shares truly concurrent duplicates: a short message sent again on
+# purpose ("yes", "ok") must get a new reply and a new stored turn
+chat_flights = SingleFlight()
+
 
 # Helper function for caregiver crisis alerts
 async def send_caregiver_crisis_alert(user_id: str, user_name: str, crisis_level: str, message_snippet: str):
-    """Send crisis alerts to all caregivers of a user via in-app, email, and push"""
+    """Send crisis alerts to all caregivers of a user via in-app, email, and push
+
+    In-app notifications are written before returning; email and push go
+    through the outbound queue so the chat response isn't held by providers.
+    """
     try:
-        # Find all caregivers who have alert permissions
-        relationships = await caregiver_relationships_collection.find({
-            "patient_id": user_id,
-            "permissions.receive_alerts": True
-        }).to_list(100)
-        
-        for rel in relationships:
-            caregiver_id = rel['caregiver_id']
-            caregiver_email = rel.get('caregiver_email')
+        async with timed("crisis_alert.fanout"):
+            # Find all caregivers who have alert permissions
+            relationships = await alert_relationships(user_id)
+            if not relationships:
+                return
             
-            # Get caregiver's notification preferences
-            caregiver_doc = await users_collection.find_one({"id": caregiver_id})
-            notif_prefs = caregiver_doc.get('notification_preferences', {}) if caregiver_doc else {}
+            # Load every caregiver's notification preferences in one query
+            caregiver_ids = [rel['caregiver_id'] for rel in relationships]
+            caregiver_docs = await users_collection.find(
+                {"id": {"$in": caregiver_ids}},
+                {"_id": 0, "id": 1, "notification_preferences": 1}
+            ).to_list(len(caregiver_ids))
+            prefs_by_id = {doc['id']: doc.get('notification_preferences', {}) for doc in caregiver_docs}
             
-            # Create in-app notification for each caregiver
-            notification = Notification(
-                user_id=caregiver_id,
-                notification_type="crisis_alert",
-                title=f"⚠️ Crisis Alert: {user_name}",
-                message=f"{user_name} may be in distress. Crisis level: {crisis_level.upper()}. Please check in on them.",
-                related_user_id=user_id,
-                related_user_name=user_name
-            )
-            notification_dict = notification.model_dump()
-            notification_dict['created_at'] = notification_dict['created_at'].isoformat()
-            notification_dict['crisis_level'] = crisis_level
-            notification_dict['message_snippet'] = message_snippet[:100] if message_snippet else ""
-            
-            await notifications_collection.insert_one(notification_dict)
-            
-            # Send email notification if enabled
-            if caregiver_email and notif_prefs.get('email_crisis_alerts', True):
-                await send_crisis_email(
-                    caregiver_email=caregiver_email,
-                    caregiver_name=rel.get('caregiver_name', 'Caregiver'),
-                    patient_name=user_name,
-                    crisis_level=crisis_level
-                )
-            
-            # Send push notification if enabled
-            if notif_prefs.get('push_crisis_alerts', True):
-                await send_push_notification(
+            notifications = []
+            jobs = []
+            for rel in relationships:
+                caregiver_id = rel['caregiver_id']
+                caregiver_email = rel.get('caregiver_email')
+                notif_prefs = prefs_by_id.get(caregiver_id, {})
+                
+                # Create in-app notification for each caregiver
+                notification = Notification(
                     user_id=caregiver_id,
-                    title=f"🚨 Crisis Alert: {user_name}",
-                    body=f"{user_name} may need your support. Crisis level: {crisis_level.upper()}",
-                    data={"type": "crisis_alert", "patient_id": user_id}
+                    notification_type="crisis_alert",
+                    title=f"⚠️ Crisis Alert: {user_name}",
+                    message=f"{user_name} may be in distress. Crisis level: {crisis_level.upper()}. Please check in on them.",
+                    related_user_id=user_id,
+                    related_user_name=user_name
                 )
+                notification_dict = notification.model_dump()
+                notification_dict['crisis_level'] = crisis_level
+                notification_dict['message_snippet'] = message_snippet[:100] if message_snippet else ""
+                notifications.append(notification_dict)
+                
+                # Send email notification if enabled
+                if caregiver_email and notif_prefs.get('email_crisis_alerts', True):
+                    jobs.append(("email", caregiver_id, build_crisis_email(
+                        caregiver_email=caregiver_email,
+                        caregiver_name=rel.get('caregiver_name', 'Caregiver'),
+                        patient_name=user_name,
+                        crisis_level=crisis_level
+                    )))
+                
+                # Send push notification if enabled
+                if notif_prefs.get('push_crisis_alerts', True):
+                    jobs.append(("push", caregiver_id, {
+                        "user_id": caregiver_id,
+                        "title": f"🚨 Crisis Alert: {user_name}",
+                        "body": f"{user_name} may need your support. Crisis level: {crisis_level.upper()}",
+                        "data": {"type": "crisis_alert", "patient_id": user_id}
+                    }))
+            
+            await notifications_collection.insert_many(notifications)
             
+            # A repeated crisis message within the dedup window doesn't re-email anyone,
+            # unless it escalates the crisis level
+            for channel, caregiver_id, payload in jobs:
+                await enqueue(channel, payload, dedup_key=crisis_dedup_key(channel, caregiver_id, user_id, crisis_level))
+        
         logging.info(f"Crisis alert sent to {len(relationships)} caregivers for user {user_id}")
     except Exception as e:
         logging.error(f"Error sending caregiver crisis alert: {e}")
 
 
-async def send_crisis_email(caregiver_email: str, caregiver_name: str, patient_name: str, crisis_level: str):
-    """Send crisis alert email to caregiver"""
-    try:
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-        </head>
-        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%); padding: 20px; border-radius: 10px 10px 0 0;">
-                <h1 style="color: white; margin: 0; font-size: 24px;">🚨 Crisis Alert</h1>
+def build_crisis_email(caregiver_email: str, caregiver_name: str, patient_name: str, crisis_level: str) -> dict:
+    """Resend params for a crisis alert email to a caregiver"""
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+    </head>
+    <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <div style="background: linear-gradient(135deg, #ef4444 0%, #dc2626 100%); padding: 20px; border-radius: 10px 10px 0 0;">
+            <h1 style="color: white; margin: 0; font-size: 24px;">🚨 Crisis Alert</h1>
+        </div>
+        <div style="background: #fef2f2; padding: 20px; border: 1px solid #fecaca; border-top: none; border-radius: 0 0 10px 10px;">
+            <p style="color: #1f2937; font-size: 16px;">Hi {caregiver_name},</p>
+            <p style="color: #1f2937; font-size: 16px;">
+                <strong>{patient_name}</strong> may be experiencing distress and could use your support.
+            </p>
+            <div style="background: white; padding: 15px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #ef4444;">
+                <p style="margin: 0; color: #7f1d1d; font-weight: bold;">Crisis Level: {crisis_level.upper()}</p>
             </div>
-            <div style="background: #fef2f2; padding: 20px; border: 1px solid #fecaca; border-top: none; border-radius: 0 0 10px 10px;">
-                <p style="color: #1f2937; font-size: 16px;">Hi {caregiver_name},</p>
-                <p style="color: #1f2937; font-size: 16px;">
-                    <strong>{patient_name}</strong> may be experiencing distress and could use your support.
-                </p>
-                <div style="background: white; padding: 15px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #ef4444;">
-                    <p style="margin: 0; color: #7f1d1d; font-weight: bold;">Crisis Level: {crisis_level.upper()}</p>
-                </div>
-                <p style="color: #1f2937; font-size: 16px;">
-                    Please consider reaching out to check in on them. Your support can make a real difference.
-                </p>
-                <div style="background: #fee2e2; padding: 15px; border-radius: 8px; margin-top: 20px;">
-                    <p style="margin: 0 0 10px 0; color: #7f1d1d; font-weight: bold;">Emergency Resources:</p>
-                    <p style="margin: 5px 0; color: #7f1d1d;">📞 988 Suicide & Crisis Lifeline</p>
-                    <p style="margin: 5px 0; color: #7f1d1d;">💬 Text HOME to 741741</p>
-                    <p style="margin: 5px 0; color: #7f1d1d;">🚑 911 for immediate danger</p>
-                </div>
-                <p style="color: #6b7280; font-size: 14px; margin-top: 20px;">
-                    — The Mentl Team
-                </p>
+            <p style="color: #1f2937; font-size: 16px;">
+                Please consider reaching out to check in on them. Your support can make a real difference.
+            </p>
+            <div style="background: #fee2e2; padding: 15px; border-radius: 8px; margin-top: 20px;">
+                <p style="margin: 0 0 10px 0; color: #7f1d1d; font-weight: bold;">Emergency Resources:</p>
+                <p style="margin: 5px 0; color: #7f1d1d;">📞 988 Suicide & Crisis Lifeline</p>
+                <p style="margin: 5px 0; color: #7f1d1d;">💬 Text HOME to 741741</p>
+                <p style="margin: 5px 0; color: #7f1d1d;">🚑 911 for immediate danger</p>
             </div>
-        </body>
-        </html>
-        """
-        
-        params = {
-            "from": SENDER_EMAIL,
-            "to": [caregiver_email],
-            "subject": f"🚨 Crisis Alert: {patient_name} needs support",
-            "html": html_content
-        }
-        
-        await asyncio.to_thread(resend.Emails.send, params)
-        logging.info(f"Crisis email sent to {caregiver_email}")
-    except Exception as e:
-        logging.error(f"Failed to send crisis email: {e}")
-
-
-async def send_push_notification(user_id: str, title: str, body: str, data: dict = None):
-    """Send push notification to user's subscribed devices"""
-    try:
-        subscriptions = await push_subscriptions_collection.find({"user_id": user_id}).to_list(10)
-        
-        for sub in subscriptions:
-            # In production, use web-push library
-            # For now, we store the notification intent
-            logging.info(f"Push notification queued for user {user_id}: {title}")
-    except Exception as e:
-        logging.error(f"Failed to send push notification: {e}")
+            <p style="color: #6b7280; font-size: 14px; margin-top: 20px;">
+                — The Mentl Team
+            </p>
+        </div>
+    </body>
+    </html>
+    """
+    
+    return {
+        "from": SENDER_EMAIL,
+        "to": [caregiver_email],
+        "subject": f"🚨 Crisis Alert: {patient_name} needs support",
+        "html": html_content
+    }
 
 
 # Configure logging
@@ -208,10 +245,16 @@ async def register(user_data: UserCreate):
     
     # Hash password and store
     user_dict = user.model_dump()
-    user_dict['password_hash'] = get_password_hash(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['password_hash'] = await get_password_hash(user_data.password)
     
-    await users_collection.insert_one(user_dict)
+    try:
+        await users_collection.insert_one(user_dict)
+    except DuplicateKeyError:
+        # A concurrent registration took the email after the check above
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     # Create access token
     access_token = create_access_token(data={"sub": user.id})
@@ -231,17 +274,22 @@ async def login(credentials: UserLogin):
         )
     
     # Verify password
-    if not verify_password(credentials.password, user_doc['password_hash']):
+    valid, new_hash = await verify_and_update_password(credentials.password, user_doc['password_hash'])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
+    if new_hash:
+        # Stored with an outdated cost; upgrade while the plaintext is at hand
+        await users_collection.update_one(
+            {"id": user_doc['id'], "password_hash": user_doc['password_hash']},
+            {"$set": {"password_hash": new_hash}}
+        )
     
     # Create user object (exclude password_hash)
     user_doc.pop('password_hash', None)
     user_doc.pop('_id', None)
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
     user = User(**user_doc)
     
     # Create access token
@@ -251,17 +299,9 @@ async def login(credentials: UserLogin):
 
 
 @api_router.get("/auth/me", response_model=User)
-async def get_current_user(user_id: str = Depends(get_current_user_id)):
+async def get_current_user(user: CurrentUser = Depends(get_current_user_context)):
     """Get current user profile"""
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    if not user_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    user_doc = await user.doc()
     
     return User(**user_doc)
 
@@ -269,7 +309,7 @@ async def get_current_user(user_id: str = Depends(get_current_user_id)):
 @api_router.put("/auth/profile", response_model=User)
 async def update_profile(
     update_data: UserUpdate,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Update user profile"""
     update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
@@ -280,21 +320,24 @@ async def update_profile(
             detail="No fields to update"
         )
     
-    result = await users_collection.update_one(
-        {"id": user_id},
-        {"$set": update_dict}
+    user_doc = await users_collection.find_one_and_update(
+        {"id": user.id},
+        {"$set": update_dict},
+        projection={"_id": 0, "password_hash": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if not user_doc:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Return updated user
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    # Later requests read the updated profile from the user cache
+    remember_user(user_doc)
+    # Today's precomputed suggestions were made for the old conditions
+    if 'conditions' in update_dict:
+        await invalidate_suggestions(user.id)
     
     return User(**user_doc)
 
@@ -302,11 +345,9 @@ async def update_profile(
 # ============= DIETARY PREFERENCES ROUTES =============
 
 @api_router.get("/users/me/dietary-preferences")
-async def get_dietary_preferences(user_id: str = Depends(get_current_user_id)):
+async def get_dietary_preferences(user: CurrentUser = Depends(get_current_user_context)):
     """Get user's dietary preferences"""
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
     dietary_prefs = user_doc.get('dietary_preferences', {})
     return {"dietary_preferences": dietary_prefs, "is_configured": bool(dietary_prefs)}
@@ -315,7 +356,7 @@ async def get_dietary_preferences(user_id: str = Depends(get_current_user_id)):
 @api_router.put("/users/me/dietary-preferences")
 async def update_dietary_preferences(
     prefs: DietaryPreferencesUpdate,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Update user's dietary preferences"""
     update_data = {k: v for k, v in prefs.model_dump().items() if v is not None}
@@ -323,18 +364,19 @@ async def update_dietary_preferences(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    # Merge with existing preferences
-    user_doc = await users_collection.find_one({"id": user_id})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    existing_prefs = user_doc.get('dietary_preferences', {})
-    existing_prefs.update(update_data)
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"dietary_preferences": existing_prefs}}
+    # Merge field by field in Mongo, so concurrent updates of different fields both stick
+    updated = await users_collection.find_one_and_update(
+        {"id": user.id},
+        {"$set": {f"dietary_preferences.{k}": v for k, v in update_data.items()}},
+        projection={"_id": 0, "dietary_preferences": 1},
+        return_document=ReturnDocument.AFTER
     )
+    invalidate_user(user.id)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Cached dietary suggestions need no invalidation: they are shared by every
+    # user with the same quantized profile, and this user's new profile has a new key
+    existing_prefs = updated.get('dietary_preferences', {})
     
     return {"message": "Dietary preferences updated", "dietary_preferences": existing_prefs}
 
@@ -342,21 +384,20 @@ async def update_dietary_preferences(
 @api_router.post("/dietary/suggestions")
 async def get_dietary_suggestions(
     request: DietarySuggestionRequest,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Get AI-powered dietary suggestions based on mood, condition, and preferences"""
     try:
         # Get user info
-        user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
+        user_doc = await user.doc()
         
         conditions = user_doc.get('conditions', [])
         dietary_prefs = user_doc.get('dietary_preferences', {})
         
         # Get recent mood data for context
         recent_logs = await mood_logs_collection.find(
-            {"user_id": user_id}
+            {"user_id": user.id},
+            {"_id": 0, "mood_rating": 1, "sleep_hours": 1}
         ).sort("date", -1).limit(3).to_list(3)
         
         # Determine time of day if not provided
@@ -374,31 +415,38 @@ async def get_dietary_suggestions(
             else:
                 time_of_day = "night"
         
-        # Build context for AI
-        context = build_dietary_context(
-            conditions=conditions,
-            dietary_prefs=dietary_prefs,
-            recent_logs=recent_logs,
-            request=request,
-            time_of_day=time_of_day
-        )
+        # The prompt is built only from quantized inputs, so users with the
+        # same profile and state share one cached suggestion
+        profile = dietary_profile(conditions, dietary_prefs)
+        state = dietary_state(recent_logs, request, time_of_day)
+        context = build_dietary_context(profile, state)
         
         # Generate AI suggestion
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not api_key:
+        if not llm_gateway.configured:
             raise HTTPException(status_code=500, detail="AI service not configured")
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"dietary_{user_id}_{datetime.now().strftime('%Y%m%d%H%M')}",
-            system_message=DIETARY_SYSTEM_PROMPT
-        ).with_model("openai", "gpt-5.2")
-        
-        user_message = UserMessage(text=context)
-        ai_response = await chat.send_message(user_message)
+        async def generate_suggestion():
+            ai_response = await llm_gateway.complete(
+                "dietary_suggestions",
+                system_message=DIETARY_SYSTEM_PROMPT,
+                text=context,
+                session_id=f"dietary_{user.id}_{datetime.now().strftime('%Y%m%d%H%M')}"
+            )
+            suggestion = parse_dietary_json(ai_response, request.suggestion_type)
+            if suggestion is None:
+                raise DietaryParseError(ai_response)
+            return suggestion
         
-        # Parse AI response
-        suggestion = parse_dietary_response(ai_response, request.suggestion_type)
+        try:
+            suggestion = await dietary_cache.get_or_compute(
+                cache_key(profile, state, DIETARY_PROMPT_VERSION),
+                generate_suggestion
+            )
+            # Cached suggestions are shared, so each response gets its own id
+            suggestion = {**suggestion, "id": str(uuid.uuid4())}
+        except DietaryParseError as e:
+            # Fallback: raw response as description (not cached)
+            suggestion = dietary_fallback(e.response, request.suggestion_type)
         
         return {"suggestion": suggestion, "context": {
             "time_of_day": time_of_day,
@@ -412,34 +460,105 @@ async def get_dietary_suggestions(
         raise HTTPException(status_code=500, detail=f"Error generating suggestion: {str(e)}")
 
 
-def build_dietary_context(conditions, dietary_prefs, recent_logs, request, time_of_day):
+# Bump when the dietary prompt changes so stale cached replies are ignored
+DIETARY_PROMPT_VERSION = 1
+dietary_cache = ResponseCache("dietary_suggestions", ttl_seconds=12 * 3600, lru_size=512)
+
+ENERGY_BANDS = {"very_low": "low", "low": "low", "moderate": "moderate", "high": "high", "very_high": "high"}
+MOOD_BAND_LABELS = {"low": "low (1-3/10)", "moderate": "moderate (4-6/10)", "good": "good (7-10/10)"}
+
+
+class DietaryParseError(ValueError):
+    """Model reply that doesn't contain a usable suggestion"""
+
+    def __init__(self, response: str):
+        super().__init__("Unparseable dietary suggestion")
+        self.response = response
+
+
+def mood_band(rating) -> Optional[str]:
+    """Coarse band for a 1-10 mood rating"""
+    if rating is None:
+        return None
+    if rating <= 3:
+        return "low"
+    if rating <= 6:
+        return "moderate"
+    return "good"
+
+
+def sleep_band(hours) -> Optional[str]:
+    if hours is None:
+        return None
+    if hours < 6:
+        return "short"
+    if hours <= 9:
+        return "normal"
+    return "long"
+
+
+def normalized_list(values) -> list:
+    """Sorted, de-duplicated, case- and whitespace-insensitive list"""
+    return sorted({normalize_text(v) for v in values or []} - {""})
+
+
+def dietary_profile(conditions, dietary_prefs) -> dict:
+    """Canonical form of the user-specific part of the dietary prompt"""
+    return {
+        "conditions": normalized_list(conditions),
+        "diet_type": normalize_text(dietary_prefs.get('diet_type')) or None,
+        "allergies": normalized_list(dietary_prefs.get('allergies')),
+        "intolerances": normalized_list(dietary_prefs.get('intolerances')),
+        "avoid_foods": normalized_list(dietary_prefs.get('avoid_foods')),
+        "cultural_preferences": normalize_text(dietary_prefs.get('cultural_preferences')) or None,
+        "preferred_cuisines": normalized_list(dietary_prefs.get('preferred_cuisines')),
+        "meal_prep_time": normalize_text(dietary_prefs.get('meal_prep_time')) or "moderate",
+        "budget_preference": normalize_text(dietary_prefs.get('budget_preference')) or "moderate"
+    }
+
+
+def dietary_state(recent_logs, request, time_of_day) -> dict:
+    """Current mood/energy and recent history, quantized into bands"""
+    moods = [log['mood_rating'] for log in recent_logs if log.get('mood_rating') is not None]
+    sleeps = [log['sleep_hours'] for log in recent_logs if log.get('sleep_hours') is not None]
+    energy = normalize_text(request.current_energy).replace(" ", "_")
+    return {
+        "suggestion_type": request.suggestion_type,
+        "time_of_day": time_of_day,
+        "mood": mood_band(request.current_mood),
+        "energy": ENERGY_BANDS.get(energy, energy or None),
+        "symptoms": normalized_list(request.current_symptoms),
+        "recent_mood": mood_band(round(mean(moods))) if moods else None,
+        "recent_sleep": sleep_band(mean(sleeps)) if sleeps else None
+    }
+
+
+def build_dietary_context(profile: dict, state: dict) -> str:
     """Build context string for AI dietary suggestion"""
-    context = f"""Generate a {request.suggestion_type.replace('_', ' ')} recommendation.
+    context = f"""Generate a {state['suggestion_type'].replace('_', ' ')} recommendation.
 
 USER PROFILE:
-- Mental Health Conditions: {', '.join(conditions) if conditions else 'None specified'}
-- Time of Day: {time_of_day}
-- Current Mood Rating: {request.current_mood or 'Not specified'}/10
-- Current Energy Level: {request.current_energy or 'Not specified'}
-- Current Symptoms: {', '.join(request.current_symptoms) if request.current_symptoms else 'None specified'}
+- Mental Health Conditions: {', '.join(profile['conditions']) or 'None specified'}
+- Time of Day: {state['time_of_day']}
+- Current Mood: {MOOD_BAND_LABELS.get(state['mood'], 'Not specified')}
+- Current Energy Level: {state['energy'] or 'Not specified'}
+- Current Symptoms: {', '.join(state['symptoms']) or 'None specified'}
 
 DIETARY PREFERENCES:
-- Diet Type: {dietary_prefs.get('diet_type', 'No restriction')}
-- Allergies: {', '.join(dietary_prefs.get('allergies', [])) or 'None'}
-- Intolerances: {', '.join(dietary_prefs.get('intolerances', [])) or 'None'}
-- Foods to Avoid: {', '.join(dietary_prefs.get('avoid_foods', [])) or 'None'}
-- Cultural Preference: {dietary_prefs.get('cultural_preferences', 'None specified')}
-- Preferred Cuisines: {', '.join(dietary_prefs.get('preferred_cuisines', [])) or 'Any'}
-- Prep Time Preference: {dietary_prefs.get('meal_prep_time', 'moderate')}
-- Budget: {dietary_prefs.get('budget_preference', 'moderate')}
-
-RECENT MOOD HISTORY:
-"""
-    for log in recent_logs:
-        context += f"- {log.get('date')}: Mood {log.get('mood_rating')}/10, Energy: {log.get('energy', 'N/A')}, Sleep: {log.get('sleep_hours', 'N/A')}h\n"
-    
-    context += f"""
-SUGGESTION TYPE: {request.suggestion_type}
+- Diet Type: {profile['diet_type'] or 'No restriction'}
+- Allergies: {', '.join(profile['allergies']) or 'None'}
+- Intolerances: {', '.join(profile['intolerances']) or 'None'}
+- Foods to Avoid: {', '.join(profile['avoid_foods']) or 'None'}
+- Cultural Preference: {profile['cultural_preferences'] or 'None specified'}
+- Preferred Cuisines: {', '.join(profile['preferred_cuisines']) or 'Any'}
+- Prep Time Preference: {profile['meal_prep_time']}
+- Budget: {profile['budget_preference']}
+
+RECENT MOOD HISTORY (last 3 logs):
+- Typical mood: {MOOD_BAND_LABELS.get(state['recent_mood'], 'Not logged')}
+- Typical sleep: {state['recent_sleep'] or 'Not logged'}
+
+SUGGESTION TYPE: {state['suggestion_type']}
 - quick_snack: Simple, ready-to-eat or minimal prep snack
 - recipe: A complete dish with full recipe
 - meal_plan: Structured meals for the day
@@ -460,8 +579,8 @@ Please respond in the following JSON format:
     return context
 
 
-def parse_dietary_response(response: str, suggestion_type: str) -> dict:
-    """Parse AI response into structured suggestion"""
+def parse_dietary_json(response: str, suggestion_type: str) -> Optional[dict]:
+    """Structured suggestion from the AI response, or None if it has no usable JSON"""
     try:
         # Try to extract JSON from response
         json_match = re.search(r'\{[\s\S]*\}', response)
@@ -482,8 +601,11 @@ def parse_dietary_response(response: str, suggestion_type: str) -> dict:
             return suggestion.model_dump()
     except (json.JSONDecodeError, Exception) as e:
         logger.error(f"Error parsing dietary response: {e}")
-    
-    # Fallback: return raw response as description
+    return None
+
+
+def dietary_fallback(response: str, suggestion_type: str) -> dict:
+    """Raw response as description when it couldn't be parsed"""
     return DietarySuggestion(
         suggestion_type=suggestion_type,
         title="Nutritional Suggestion",
@@ -570,21 +692,38 @@ async def create_mood_log(
     )
     
     log_dict = mood_log.model_dump()
-    log_dict['timestamp'] = log_dict['timestamp'].isoformat()
     
-    await mood_logs_collection.insert_one(log_dict)
+    try:
+        await mood_logs_collection.insert_one(log_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent create for the same date
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Mood log already exists for this date. Use PUT to update."
+        )
+    
+    await record_log_created(log_dict)
+    await record_log_energy(user_id, None, log_dict)
+    if log_dict['date'] == datetime.now(timezone.utc).strftime("%Y-%m-%d"):
+        refresh_in_background(user_id)
     
     return mood_log
 
 
 @api_router.get("/mood-logs", response_model=List[MoodLog])
 async def get_mood_logs(
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    limit: int = 100,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get user's mood logs with optional date range filter"""
+    """Get user's mood logs with optional date range filter, newest first
+
+    The body stays a plain list; the cursor for the next page is returned in
+    the X-Next-Cursor header when there is one.
+    """
     query = {"user_id": user_id}
     
     if start_date or end_date:
@@ -595,34 +734,61 @@ async def get_mood_logs(
             date_filter["$lte"] = end_date
         query["date"] = date_filter
     
-    logs = await mood_logs_collection.find(query, {"_id": 0}).sort("date", -1).limit(limit).to_list(limit)
-    
-    # Convert ISO strings back to datetime
-    for log in logs:
-        if isinstance(log.get('timestamp'), str):
-            log['timestamp'] = datetime.fromisoformat(log['timestamp'])
+    # date is unique per user, so it alone orders the pages
+    logs, next_cursor = await fetch_page(mood_logs_collection, query, [("date", -1)], limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [MoodLog(**log) for log in logs]
 
 
+@api_router.post("/mood-logs/bulk")
+async def import_mood_logs_bulk(
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Create or replace many mood logs from a JSON array or NDJSON body of MoodLogCreate records"""
+    return await import_mood_logs(user_id, request.stream())
+
+
+@api_router.get("/mood-logs/export")
+async def export_mood_logs_stream(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Download the user's mood logs, oldest first, as NDJSON or CSV"""
+    return StreamingResponse(
+        export_mood_logs(user_id, export_format, start_date, end_date),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="mood-logs.{export_format}"'}
+    )
+
+
+# Bump when the activity details prompt changes so stale cached replies are ignored
+ACTIVITY_DETAILS_PROMPT_VERSION = 1
+activity_details_cache = ResponseCache("activity_details", ttl_seconds=7 * 24 * 3600, lru_size=512)
+
+
 @api_router.post("/activities/details")
 async def get_activity_details(
     activity: dict,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Get detailed AI-generated instructions for a specific activity"""
     try:
         # Get user info for personalization
-        user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
+        user_doc = await user.doc()
         
         activity_name = activity.get('activity', 'Unknown Activity')
         activity_category = activity.get('category', 'general')
         activity_description = activity.get('description', '')
         
-        # Build personalized prompt
-        conditions_str = ', '.join(user_doc.get('conditions', ['general']))
+        # Build personalized prompt; conditions are sorted so the prompt (and
+        # its cached result) doesn't depend on the order the user picked them
+        conditions = sorted(user_doc.get('conditions') or ['general'])
+        conditions_str = ', '.join(conditions)
         
         detail_prompt = f"""Generate comprehensive, beginner-friendly instructions for this mental health activity:
 
@@ -658,42 +824,53 @@ Format as JSON:
 
 Provide ONLY valid JSON, no markdown."""
 
-        # Call AI
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not api_key:
+        if not llm_gateway.configured:
             raise HTTPException(status_code=500, detail="AI service not configured")
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"activity_details_{user_id}",
-            system_message="You are a mental health activity guide. Provide clear, practical, and encouraging instructions in valid JSON format only."
-        ).with_model("openai", "gpt-5.2")
-        
-        from emergentintegrations.llm.chat import UserMessage
-        user_message = UserMessage(text=detail_prompt)
-        ai_response = await chat.send_message(user_message)
-        
-        # Parse AI response as JSON
-        # Try to extract JSON from response
-        json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-        if json_match:
-            details_json = json_match.group(0)
-        else:
-            details_json = ai_response
+        async def generate_details():
+            # Call AI
+            ai_response = await llm_gateway.complete(
+                "activity_details",
+                system_message="You are a mental health activity guide. Provide clear, practical, and encouraging instructions in valid JSON format only.",
+                text=detail_prompt,
+                session_id=f"activity_details_{user.id}"
+            )
+            
+            # Parse AI response as JSON
+            # Try to extract JSON from response
+            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
+            if json_match:
+                details_json = json_match.group(0)
+            else:
+                details_json = ai_response
+            
+            try:
+                details = json.loads(details_json)
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse activity details: {ai_response[:200]}")
+                raise
+            
+            return {"details": details, "generated_at": datetime.now(timezone.utc).isoformat()}
         
-        details = json.loads(details_json)
+        # The prompt depends only on these inputs, so results are shared across users
+        key = cache_key(
+            normalize_text(activity_name),
+            normalize_text(activity_category),
+            normalize_text(activity_description),
+            conditions,
+            ACTIVITY_DETAILS_PROMPT_VERSION
+        )
+        generated = await activity_details_cache.get_or_compute(key, generate_details)
         
         return {
             "activity": activity_name,
             "category": activity_category,
             "description": activity_description,
-            "details": details,
-            "generated_at": datetime.now(timezone.utc).isoformat()
+            **generated
         }
         
     except json.JSONDecodeError:
-        logger.error(f"Failed to parse activity details: {ai_response[:200]}")
-        # Fallback response
+        # Fallback response (not cached)
         return {
             "activity": activity.get('activity', 'Activity'),
             "category": activity.get('category', 'general'),
@@ -731,142 +908,24 @@ Provide ONLY valid JSON, no markdown."""
 
 
 @api_router.get("/mood-logs/suggestions")
-async def get_mood_suggestions(user_id: str = Depends(get_current_user_id)):
+async def get_mood_suggestions(user: CurrentUser = Depends(get_current_user_context)):
     """Get AI-powered activity suggestions based on recent mood logs"""
     try:
-        # Get user info for conditions
-        user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get recent mood logs (last 7 days)
-        start_date = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%d")
-        recent_logs = await mood_logs_collection.find({
-            "user_id": user_id,
-            "date": {"$gte": start_date}
-        }).sort("date", -1).limit(7).to_list(7)
+        # Normally precomputed by the batch or after today's log was written
+        cached = await cached_suggestions(user.id)
+        if cached:
+            return cached
         
-        # Get today's log if exists
-        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-        today_log = await mood_logs_collection.find_one({
-            "user_id": user_id,
-            "date": today
-        })
-        
-        # Build context for AI
-        context = "USER PROFILE:\n"
-        context += f"Conditions: {', '.join(user_doc.get('conditions', ['general']))}\n\n"
-        
-        if today_log:
-            context += "TODAY'S MOOD LOG:\n"
-            context += f"- Mood Rating: {today_log.get('mood_rating')}/10\n"
-            context += f"- Mood Tag: {today_log.get('mood_tag', 'Not specified')}\n"
-            
-            symptoms = today_log.get('symptoms', {})
-            if symptoms:
-                active_symptoms = [k.replace('_', ' ') for k, v in symptoms.items() if v]
-                if active_symptoms:
-                    context += f"- Symptoms: {', '.join(active_symptoms)}\n"
-            
-            if today_log.get('notes'):
-                context += f"- Notes: {today_log.get('notes')[:100]}\n"
-            
-            context += f"- Sleep: {today_log.get('sleep_hours', 'Not logged')} hours\n"
-            context += f"- Medication: {'Taken' if today_log.get('medication_taken') else 'Not taken'}\n\n"
-        
-        if recent_logs and len(recent_logs) > 1:
-            mood_ratings = [log['mood_rating'] for log in recent_logs]
-            avg_mood = sum(mood_ratings) / len(mood_ratings)
-            context += "RECENT TREND (Last 7 days):\n"
-            context += f"- Average mood: {avg_mood:.1f}/10\n"
-            context += f"- Recent ratings: {', '.join(map(str, mood_ratings[:5]))}\n\n"
+        # Get user info for conditions
+        user_doc = await user.doc()
         
-        # Create AI prompt for suggestions
-        suggestion_prompt = f"""{context}
-Based on this user's current mood state and mental health conditions, provide 4-5 specific, actionable activity suggestions that could help improve or manage their mood.
-
-REQUIREMENTS:
-1. Make suggestions specific to their conditions ({', '.join(user_doc.get('conditions', []))})
-2. Consider their current mood level
-3. Include a mix of quick (5-10 min) and longer activities
-4. Be practical and realistic
-5. Include activities from different categories: physical, mindfulness, social, creative, self-care
-
-FORMAT YOUR RESPONSE AS A JSON ARRAY (no markdown, just raw JSON):
-[
-  {{
-    "activity": "Short activity name (4-6 words)",
-    "description": "Brief description (1 sentence, max 100 chars)",
-    "duration": "5-10 min" or "15-30 min" or "30+ min",
-    "category": "physical" or "mindfulness" or "social" or "creative" or "self-care",
-    "benefit": "How it helps (1 sentence, max 80 chars)"
-  }}
-]
-
-Provide exactly 4-5 suggestions in valid JSON format."""
-
-        # Call AI
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not api_key:
+        if not llm_gateway.configured:
             raise HTTPException(status_code=500, detail="AI service not configured")
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"suggestions_{user_id}",
-            system_message="You are a mental health activity advisor. Provide practical, evidence-based activity suggestions in valid JSON format only."
-        ).with_model("openai", "gpt-5.2")
-        
-        from emergentintegrations.llm.chat import UserMessage
-        user_message = UserMessage(text=suggestion_prompt)
-        ai_response = await chat.send_message(user_message)
-        
-        # Parse AI response as JSON
-        # Try to extract JSON from response (in case AI adds markdown)
-        json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-        if json_match:
-            suggestions_json = json_match.group(0)
-        else:
-            suggestions_json = ai_response
-        
-        suggestions = json.loads(suggestions_json)
-        
-        return {
-            "suggestions": suggestions,
-            "based_on_mood": today_log.get('mood_rating') if today_log else None,
-            "generated_at": datetime.now(timezone.utc).isoformat()
-        }
+        return await generate_suggestions(user_doc)
         
-    except json.JSONDecodeError:
-        logger.error(f"Failed to parse AI suggestions: {ai_response[:200]}")
-        # Fallback suggestions
-        return {
-            "suggestions": [
-                {
-                    "activity": "5-Minute Breathing Exercise",
-                    "description": "Practice deep breathing to calm your nervous system",
-                    "duration": "5-10 min",
-                    "category": "mindfulness",
-                    "benefit": "Reduces anxiety and promotes relaxation"
-                },
-                {
-                    "activity": "Short Walk Outside",
-                    "description": "Take a brief walk in fresh air",
-                    "duration": "10-15 min",
-                    "category": "physical",
-                    "benefit": "Boosts mood and energy levels"
-                },
-                {
-                    "activity": "Gratitude Journaling",
-                    "description": "Write down 3 things you're grateful for",
-                    "duration": "5-10 min",
-                    "category": "self-care",
-                    "benefit": "Shifts focus to positive aspects"
-                }
-            ],
-            "based_on_mood": today_log.get('mood_rating') if today_log else None,
-            "generated_at": datetime.now(timezone.utc).isoformat(),
-            "fallback": True
-        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating suggestions: {str(e)}")
         raise HTTPException(
@@ -922,9 +981,6 @@ async def get_mood_log(
             detail="Mood log not found"
         )
     
-    if isinstance(log.get('timestamp'), str):
-        log['timestamp'] = datetime.fromisoformat(log['timestamp'])
-    
     return MoodLog(**log)
 
 
@@ -943,21 +999,25 @@ async def update_mood_log(
             detail="No fields to update"
         )
     
-    result = await mood_logs_collection.update_one(
+    # The pre-image is needed to adjust the mood_stats rollup
+    old_log = await mood_logs_collection.find_one_and_update(
         {"id": log_id, "user_id": user_id},
-        {"$set": update_dict}
+        {"$set": update_dict},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not old_log:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Mood log not found"
         )
     
-    # Return updated log
-    log = await mood_logs_collection.find_one({"id": log_id}, {"_id": 0})
-    if isinstance(log.get('timestamp'), str):
-        log['timestamp'] = datetime.fromisoformat(log['timestamp'])
+    log = {**old_log, **update_dict}
+    await record_log_updated(old_log, log)
+    await record_log_energy(user_id, old_log, log)
+    if datetime.now(timezone.utc).strftime("%Y-%m-%d") in (old_log.get('date'), log.get('date')):
+        refresh_in_background(user_id)
     
     return MoodLog(**log)
 
@@ -968,32 +1028,56 @@ async def delete_mood_log(
     user_id: str = Depends(get_current_user_id)
 ):
     """Delete a mood log entry"""
-    result = await mood_logs_collection.delete_one({"id": log_id, "user_id": user_id})
+    deleted_log = await mood_logs_collection.find_one_and_delete(
+        {"id": log_id, "user_id": user_id},
+        projection={"_id": 0}
+    )
     
-    if result.deleted_count == 0:
+    if not deleted_log:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Mood log not found"
         )
     
+    await record_log_deleted(deleted_log)
+    await record_log_energy(user_id, deleted_log, None)
+    if deleted_log.get('date') == datetime.now(timezone.utc).strftime("%Y-%m-%d"):
+        await invalidate_suggestions(user_id)
+    
     return None
 
 
+def mood_trend(stats: dict) -> str:
+    """Compare the first and second half of the period from a mood_stats summary"""
+    if stats["first_half_avg"] is None:
+        return "stable"
+    if stats["second_half_avg"] > stats["first_half_avg"] + 0.5:
+        return "improving"
+    if stats["second_half_avg"] < stats["first_half_avg"] - 0.5:
+        return "declining"
+    return "stable"
+
+
+def most_common_symptoms(stats: dict, limit: int = 5) -> list:
+    """Top symptoms by occurrence from a mood_stats summary"""
+    return sorted(
+        [{"symptom": k, "count": v} for k, v in stats["symptom_counts"].items()],
+        key=lambda x: x['count'],
+        reverse=True
+    )[:limit]
+
+
 @api_router.get("/mood-logs/analytics/summary", response_model=MoodAnalytics)
 async def get_mood_analytics(
     days: int = 30,
     user_id: str = Depends(get_current_user_id)
 ):
     """Get mood analytics and insights"""
-    # Get logs from last N days
+    # Read the pre-aggregated mood_stats buckets for the last N days
     start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    stats = summarize_stats(await load_stat_buckets(user_id, start_date))
     
-    logs = await mood_logs_collection.find({
-        "user_id": user_id,
-        "date": {"$gte": start_date}
-    }, {"_id": 0}).to_list(1000)
-    
-    if not logs:
+    if not stats["total_logs"]:
         return MoodAnalytics(
             average_mood=0.0,
             total_logs=0,
@@ -1002,36 +1086,9 @@ async def get_mood_analytics(
             insights=["Start logging your mood to see insights!"]
         )
     
-    # Calculate average mood
-    mood_ratings = [log['mood_rating'] for log in logs]
-    avg_mood = mean(mood_ratings)
-    
-    # Determine mood trend (simple: compare first half vs second half)
-    half = len(mood_ratings) // 2
-    if half > 0:
-        first_half_avg = mean(mood_ratings[:half])
-        second_half_avg = mean(mood_ratings[half:])
-        if second_half_avg > first_half_avg + 0.5:
-            trend = "improving"
-        elif second_half_avg < first_half_avg - 0.5:
-            trend = "declining"
-        else:
-            trend = "stable"
-    else:
-        trend = "stable"
-    
-    # Get most common symptoms
-    symptom_counts = {}
-    for log in logs:
-        for symptom, value in log.get('symptoms', {}).items():
-            if value:  # If symptom is present/true
-                symptom_counts[symptom] = symptom_counts.get(symptom, 0) + 1
-    
-    most_common = sorted(
-        [{"symptom": k, "count": v} for k, v in symptom_counts.items()],
-        key=lambda x: x['count'],
-        reverse=True
-    )[:5]
+    avg_mood = stats["mood_sum"] / stats["total_logs"]
+    trend = mood_trend(stats)
+    most_common = most_common_symptoms(stats)
     
     # Generate insights
     insights = []
@@ -1046,15 +1103,14 @@ async def get_mood_analytics(
         insights.append("Your mood is improving! Keep up the good work with your self-care routine.")
     
     # Check for medication consistency
-    medication_logs = [log for log in logs if log.get('medication_taken')]
-    if len(medication_logs) > 0:
-        medication_rate = len(medication_logs) / len(logs)
+    if stats["medication_count"] > 0:
+        medication_rate = stats["medication_count"] / stats["total_logs"]
         if medication_rate < 0.7:
             insights.append(f"Medication adherence: {int(medication_rate * 100)}%. Try setting reminders to maintain consistency.")
     
     return MoodAnalytics(
         average_mood=round(avg_mood, 1),
-        total_logs=len(logs),
+        total_logs=stats["total_logs"],
         mood_trend=trend,
         most_common_symptoms=most_common,
         insights=insights
@@ -1069,12 +1125,19 @@ async def get_advanced_analytics(
     """Get advanced analytics with pattern recognition and trigger identification"""
     start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
     
-    logs = await mood_logs_collection.find({
-        "user_id": user_id,
-        "date": {"$gte": start_date}
-    }, {"_id": 0}).sort("date", 1).to_list(1000)
-    
-    if not logs:
+    # All buckets are computed server-side in a single $facet aggregation
+    try:
+        summary = await fetch_advanced_summary(mood_logs_collection, user_id, start_date)
+    except OperationFailure as e:
+        # Servers without the needed operators fall back to the in-process kernel
+        logger.warning(f"Analytics aggregation failed, using NumPy kernel: {e}")
+        logs = await mood_logs_collection.find(
+            {"user_id": user_id, "date": {"$gte": start_date}},
+            {"_id": 0, "date": 1, "mood_rating": 1, "sleep_hours": 1, "medication_taken": 1, "symptoms": 1}
+        ).sort("date", 1).to_list(MAX_ANALYTICS_LOGS)  # same window as the pipeline's $sort + $limit
+        summary = frame_summary(MoodFrame(logs)) if logs else None
+    
+    if not summary:
         return {
             "patterns": [],
             "triggers": [],
@@ -1086,328 +1149,30 @@ async def get_advanced_analytics(
             "symptom_mood_correlation": []
         }
     
-    # 1. Day of Week Analysis
-    day_mood = {i: [] for i in range(7)}  # 0=Monday, 6=Sunday
-    day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    for log in logs:
-        try:
-            date_obj = datetime.strptime(log['date'], "%Y-%m-%d")
-            day_of_week = date_obj.weekday()
-            day_mood[day_of_week].append(log['mood_rating'])
-        except (ValueError, KeyError):
-            continue
-    
-    day_of_week_analysis = []
-    for day_idx, moods in day_mood.items():
-        if moods:
-            day_of_week_analysis.append({
-                "day": day_names[day_idx],
-                "day_index": day_idx,
-                "average_mood": round(mean(moods), 1),
-                "log_count": len(moods),
-                "min_mood": min(moods),
-                "max_mood": max(moods)
-            })
-    
-    # 2. Mood Distribution
-    mood_distribution = []
-    mood_counts = {}
-    for log in logs:
-        rating = log['mood_rating']
-        mood_counts[rating] = mood_counts.get(rating, 0) + 1
-    
-    for rating in range(1, 11):
-        mood_distribution.append({
-            "rating": rating,
-            "count": mood_counts.get(rating, 0),
-            "percentage": round((mood_counts.get(rating, 0) / len(logs)) * 100, 1) if logs else 0
-        })
-    
-    # 3. Sleep-Mood Correlation
-    sleep_mood_data = [(log.get('sleep_hours'), log['mood_rating']) for log in logs if log.get('sleep_hours')]
-    sleep_mood_correlation = None
-    
-    if len(sleep_mood_data) >= 5:
-        # Group by sleep ranges
-        sleep_ranges = {
-            "less_than_5": [],
-            "5_to_6": [],
-            "6_to_7": [],
-            "7_to_8": [],
-            "more_than_8": []
-        }
-        
-        for sleep, mood in sleep_mood_data:
-            if sleep < 5:
-                sleep_ranges["less_than_5"].append(mood)
-            elif sleep < 6:
-                sleep_ranges["5_to_6"].append(mood)
-            elif sleep < 7:
-                sleep_ranges["6_to_7"].append(mood)
-            elif sleep < 8:
-                sleep_ranges["7_to_8"].append(mood)
-            else:
-                sleep_ranges["more_than_8"].append(mood)
-        
-        sleep_mood_correlation = {
-            "data": [
-                {"range": "<5 hrs", "avg_mood": round(mean(sleep_ranges["less_than_5"]), 1) if sleep_ranges["less_than_5"] else None, "count": len(sleep_ranges["less_than_5"])},
-                {"range": "5-6 hrs", "avg_mood": round(mean(sleep_ranges["5_to_6"]), 1) if sleep_ranges["5_to_6"] else None, "count": len(sleep_ranges["5_to_6"])},
-                {"range": "6-7 hrs", "avg_mood": round(mean(sleep_ranges["6_to_7"]), 1) if sleep_ranges["6_to_7"] else None, "count": len(sleep_ranges["6_to_7"])},
-                {"range": "7-8 hrs", "avg_mood": round(mean(sleep_ranges["7_to_8"]), 1) if sleep_ranges["7_to_8"] else None, "count": len(sleep_ranges["7_to_8"])},
-                {"range": "8+ hrs", "avg_mood": round(mean(sleep_ranges["more_than_8"]), 1) if sleep_ranges["more_than_8"] else None, "count": len(sleep_ranges["more_than_8"])}
-            ],
-            "optimal_sleep": None
-        }
-        
-        # Find optimal sleep range
-        best_range = max(
-            [(r, d["avg_mood"]) for r, d in zip(["<5 hrs", "5-6 hrs", "6-7 hrs", "7-8 hrs", "8+ hrs"], sleep_mood_correlation["data"]) if d["avg_mood"] is not None],
-            key=lambda x: x[1],
-            default=(None, None)
-        )
-        if best_range[0]:
-            sleep_mood_correlation["optimal_sleep"] = best_range[0]
-    
-    # 4. Medication Impact Analysis
-    medication_impact = None
-    med_taken_moods = [log['mood_rating'] for log in logs if log.get('medication_taken')]
-    med_not_taken_moods = [log['mood_rating'] for log in logs if not log.get('medication_taken')]
-    
-    if med_taken_moods and med_not_taken_moods:
-        medication_impact = {
-            "with_medication": {
-                "average_mood": round(mean(med_taken_moods), 1),
-                "count": len(med_taken_moods)
-            },
-            "without_medication": {
-                "average_mood": round(mean(med_not_taken_moods), 1),
-                "count": len(med_not_taken_moods)
-            },
-            "difference": round(mean(med_taken_moods) - mean(med_not_taken_moods), 1)
-        }
-    
-    # 5. Symptom-Mood Correlation
-    symptom_mood_correlation = []
-    symptom_moods = {}
-    
-    for log in logs:
-        for symptom, present in log.get('symptoms', {}).items():
-            if symptom not in symptom_moods:
-                symptom_moods[symptom] = {"with": [], "without": []}
-            if present:
-                symptom_moods[symptom]["with"].append(log['mood_rating'])
-            else:
-                symptom_moods[symptom]["without"].append(log['mood_rating'])
-    
-    for symptom, data in symptom_moods.items():
-        if len(data["with"]) >= 3:
-            avg_with = round(mean(data["with"]), 1)
-            avg_without = round(mean(data["without"]), 1) if data["without"] else None
-            symptom_mood_correlation.append({
-                "symptom": symptom.replace("_", " ").title(),
-                "symptom_key": symptom,
-                "avg_mood_with_symptom": avg_with,
-                "avg_mood_without_symptom": avg_without,
-                "impact": round(avg_with - avg_without, 1) if avg_without else None,
-                "occurrence_count": len(data["with"])
-            })
-    
-    # Sort by impact (most negative first)
-    symptom_mood_correlation.sort(key=lambda x: x["impact"] if x["impact"] is not None else 0)
-    
-    # 6. Pattern Recognition
-    patterns = []
-    
-    # Check for weekend vs weekday pattern
-    weekday_moods = [m for d, m in zip(day_of_week_analysis, [d.get("average_mood") for d in day_of_week_analysis]) if d.get("day_index", 0) < 5 and m]
-    weekend_moods = [m for d, m in zip(day_of_week_analysis, [d.get("average_mood") for d in day_of_week_analysis]) if d.get("day_index", 0) >= 5 and m]
-    
-    if weekday_moods and weekend_moods:
-        weekday_avg = mean([d["average_mood"] for d in day_of_week_analysis if d["day_index"] < 5])
-        weekend_avg = mean([d["average_mood"] for d in day_of_week_analysis if d["day_index"] >= 5])
-        
-        if weekend_avg > weekday_avg + 0.5:
-            patterns.append({
-                "type": "weekly",
-                "pattern": "weekend_boost",
-                "description": "Your mood tends to be better on weekends",
-                "details": f"Weekend avg: {round(weekend_avg, 1)}, Weekday avg: {round(weekday_avg, 1)}"
-            })
-        elif weekday_avg > weekend_avg + 0.5:
-            patterns.append({
-                "type": "weekly",
-                "pattern": "weekday_preference",
-                "description": "Your mood tends to be better on weekdays",
-                "details": f"Weekday avg: {round(weekday_avg, 1)}, Weekend avg: {round(weekend_avg, 1)}"
-            })
-    
-    # Check for low mood streaks
-    current_streak = 0
-    max_low_streak = 0
-    
-    for log in logs:
-        if log['mood_rating'] <= 4:
-            current_streak += 1
-            max_low_streak = max(max_low_streak, current_streak)
-        else:
-            current_streak = 0
-    
-    if max_low_streak >= 3:
-        patterns.append({
-            "type": "streak",
-            "pattern": "low_mood_streak",
-            "description": f"You had a streak of {max_low_streak} consecutive low mood days",
-            "details": "Consider reaching out for support during extended low periods"
-        })
-    
-    # Check for high variability
-    if len(logs) >= 7:
-        all_mood_ratings = [log['mood_rating'] for log in logs]
-        mood_mean = mean(all_mood_ratings)
-        mood_std = (sum((m - mood_mean)**2 for m in all_mood_ratings) / len(all_mood_ratings)) ** 0.5
-        if mood_std > 2.5:
-            patterns.append({
-                "type": "variability",
-                "pattern": "high_variability",
-                "description": "Your mood shows high variability",
-                "details": "Large mood swings may indicate the need for stabilization strategies"
-            })
-    
-    # 7. Trigger Identification
-    triggers = []
-    
-    # Identify symptoms that correlate with low mood
-    for corr in symptom_mood_correlation[:5]:
-        if corr["impact"] and corr["impact"] < -1:
-            triggers.append({
-                "trigger": corr["symptom"],
-                "type": "symptom",
-                "impact": corr["impact"],
-                "description": f"When experiencing {corr['symptom'].lower()}, your mood drops by {abs(corr['impact'])} points on average",
-                "frequency": corr["occurrence_count"]
-            })
-    
-    # Sleep as a trigger
-    if sleep_mood_correlation:
-        low_sleep_data = next((d for d in sleep_mood_correlation["data"] if d["range"] == "<5 hrs" and d["avg_mood"]), None)
-        good_sleep_data = next((d for d in sleep_mood_correlation["data"] if d["range"] == "7-8 hrs" and d["avg_mood"]), None)
-        
-        if low_sleep_data and good_sleep_data and low_sleep_data["avg_mood"] < good_sleep_data["avg_mood"] - 1:
-            triggers.append({
-                "trigger": "Poor Sleep (<5 hours)",
-                "type": "sleep",
-                "impact": round(low_sleep_data["avg_mood"] - good_sleep_data["avg_mood"], 1),
-                "description": f"Getting less than 5 hours of sleep correlates with lower mood (avg: {low_sleep_data['avg_mood']}/10)",
-                "frequency": low_sleep_data["count"]
-            })
-    
-    # Day of week triggers
-    if day_of_week_analysis:
-        worst_day = min(day_of_week_analysis, key=lambda x: x["average_mood"])
-        best_day = max(day_of_week_analysis, key=lambda x: x["average_mood"])
-        
-        if best_day["average_mood"] - worst_day["average_mood"] > 1.5:
-            triggers.append({
-                "trigger": f"{worst_day['day']}s",
-                "type": "day_of_week",
-                "impact": round(worst_day["average_mood"] - best_day["average_mood"], 1),
-                "description": f"{worst_day['day']}s tend to be your most challenging day (avg mood: {worst_day['average_mood']}/10)",
-                "frequency": worst_day["log_count"]
-            })
-    
-    return {
-        "patterns": patterns,
-        "triggers": triggers,
-        "day_of_week_analysis": day_of_week_analysis,
-        "mood_distribution": mood_distribution,
-        "sleep_mood_correlation": sleep_mood_correlation,
-        "medication_impact": medication_impact,
-        "symptom_mood_correlation": symptom_mood_correlation[:10]
-    }
+    return build_advanced_analytics(summary)
 
 
-@api_router.post("/chat", response_model=ChatResponse)
-async def chat_with_ai(
-    request: ChatRequest,
-    user_id: str = Depends(get_current_user_id)
-):
-    """Chat with AI assistant with enhanced crisis detection"""
+CHAT_HISTORY_LIMIT = 50  # messages kept per user
+
+
+async def append_chat_turn(user_id: str, *messages: ChatMessage):
+    """Atomically append messages to the user's history, keeping the newest CHAT_HISTORY_LIMIT"""
+    now = datetime.now(timezone.utc)
+    update = {
+        "$push": {"messages": {"$each": [m.model_dump() for m in messages], "$slice": -CHAT_HISTORY_LIMIT}},
+        "$set": {"updated_at": now},
+        "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}
+    }
     try:
-        # Get user info for context
-        user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get recent mood logs for context
-        recent_logs = await mood_logs_collection.find(
-            {"user_id": user_id}
-        ).sort("date", -1).limit(5).to_list(5)
-        
-        # Build context
-        context = "\n\nUSER CONTEXT:\n"
-        context += f"User conditions: {', '.join(user_doc.get('conditions', []))}\n"
-        
-        if recent_logs:
-            context += "Recent mood history (last 5 entries):\n"
-            for log in recent_logs:
-                mood = log.get('mood_rating', 'N/A')
-                date = log.get('date', 'N/A')
-                notes = log.get('notes', '')
-                context += f"- {date}: Mood {mood}/10"
-                if notes:
-                    context += f" - {notes[:100]}"
-                context += "\n"
-        else:
-            context += "No mood logs yet.\n"
-        
-        # Enhanced Crisis Detection
-        message_lower = request.message.lower()
-        
-        # Critical crisis keywords (immediate danger)
-        critical_keywords = [
-            "suicide", "kill myself", "end my life", "want to die", "better off dead",
-            "end it all", "take my life", "jump off", "hang myself", "overdose",
-            "slit my wrists", "shoot myself", "don't want to live"
-        ]
-        
-        # High concern keywords (significant distress)
-        high_concern_keywords = [
-            "self-harm", "hurt myself", "cutting", "burning myself", "punish myself",
-            "can't go on", "no point", "no reason to live", "hopeless", "worthless",
-            "burden to everyone", "everyone hates me", "no one cares", "alone forever",
-            "give up", "can't take it anymore", "exhausted of living"
-        ]
-        
-        # Moderate concern keywords (needs support)
-        moderate_concern_keywords = [
-            "depressed", "anxious", "panic attack", "can't breathe", "overwhelmed",
-            "breaking down", "falling apart", "lost", "scared", "terrified",
-            "crying all day", "can't stop crying", "numb", "empty inside"
-        ]
-        
-        # Determine crisis level
-        crisis_level = None
-        if any(kw in message_lower for kw in critical_keywords):
-            crisis_level = "critical"
-        elif any(kw in message_lower for kw in high_concern_keywords):
-            crisis_level = "high"
-        elif any(kw in message_lower for kw in moderate_concern_keywords):
-            crisis_level = "moderate"
-        
-        # Send caregiver alert for critical and high concern levels
-        if crisis_level in ["critical", "high"]:
-            await send_caregiver_crisis_alert(
-                user_id=user_id,
-                user_name=user_doc.get('name', 'Unknown'),
-                crisis_level=crisis_level,
-                message_snippet=request.message[:200]
-            )
-        
-        # Handle critical crisis
-        if crisis_level == "critical":
-            crisis_response = """I'm deeply concerned about what you're sharing. Your life matters, and I want you to get the support you need right now.
+        await chat_history_collection.update_one({"user_id": user_id}, update, upsert=True)
+    except DuplicateKeyError:
+        # Two first-ever turns raced on the upsert; the document exists now
+        await chat_history_collection.update_one({"user_id": user_id}, update)
+
+
+# Fixed replies that replace the AI response for critical and high concern
+CRISIS_RESPONSES = {
+    "critical": """I'm deeply concerned about what you're sharing. Your life matters, and I want you to get the support you need right now.
 
 🚨 **PLEASE REACH OUT FOR IMMEDIATE HELP:**
 
@@ -1420,17 +1185,8 @@ async def chat_with_ai(
 
 I've also notified your connected caregivers so they can reach out to support you.
 
-Would you like to stay and talk while you wait for help? I'm here with you."""
-            
-            return ChatResponse(
-                response=crisis_response,
-                crisis_detected=True,
-                crisis_level=crisis_level
-            )
-        
-        # Handle high concern
-        if crisis_level == "high":
-            concern_response = """I hear you, and what you're going through sounds incredibly difficult. I'm concerned about your wellbeing.
+Would you like to stay and talk while you wait for help? I'm here with you.""",
+    "high": """I hear you, and what you're going through sounds incredibly difficult. I'm concerned about your wellbeing.
 
 💜 **Support resources available to you:**
 
@@ -1441,9 +1197,72 @@ Would you like to stay and talk while you wait for help? I'm here with you."""
 I've notified your caregivers about how you're feeling so they can check in on you.
 
 You don't have to face this alone. Would you like to tell me more about what's been happening? Sometimes talking through our feelings can help, even a little."""
-            
+}
+
+# Appended to the AI response for moderate concern
+MODERATE_RESOURCES_FOOTER = "\n\n---\n💜 *If you need immediate support: Call/text 988 or text HOME to 741741*"
+
+
+async def prepare_chat_turn(message: str, user_id: str):
+    """Build the user context for the model and detect the crisis level
+
+    Caregivers are alerted for critical and high concern. Returns (context, crisis_level).
+    """
+    # Get user info for context
+    user_doc = await load_user(user_id)
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Get recent mood logs for context
+    recent_logs = await mood_logs_collection.find(
+        {"user_id": user_id}
+    ).sort("date", -1).limit(5).to_list(5)
+    
+    # Build context
+    context = "\n\nUSER CONTEXT:\n"
+    context += f"User conditions: {', '.join(user_doc.get('conditions', []))}\n"
+    
+    if recent_logs:
+        context += "Recent mood history (last 5 entries):\n"
+        for log in recent_logs:
+            mood = log.get('mood_rating', 'N/A')
+            date = log.get('date', 'N/A')
+            notes = log.get('notes', '')
+            context += f"- {date}: Mood {mood}/10"
+            if notes:
+                context += f" - {notes[:100]}"
+            context += "\n"
+    else:
+        context += "No mood logs yet.\n"
+    
+    # Enhanced Crisis Detection (single pass over the shared lexicon)
+    crisis_level = detect_crisis(message).level
+    
+    # Send caregiver alert for critical and high concern levels
+    if crisis_level in ["critical", "high"]:
+        await send_caregiver_crisis_alert(
+            user_id=user_id,
+            user_name=user_doc.get('name', 'Unknown'),
+            crisis_level=crisis_level,
+            message_snippet=message[:200]
+        )
+    
+    return context, crisis_level
+
+
+@api_router.post("/chat", response_model=ChatResponse)
+async def chat_with_ai(
+    request: ChatRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Chat with AI assistant with enhanced crisis detection"""
+    async def respond():
+        context, crisis_level = await prepare_chat_turn(request.message, user_id)
+        
+        # Handle critical crisis and high concern
+        if crisis_level in CRISIS_RESPONSES:
             return ChatResponse(
-                response=concern_response,
+                response=CRISIS_RESPONSES[crisis_level],
                 crisis_detected=True,
                 crisis_level=crisis_level
             )
@@ -1451,70 +1270,37 @@ You don't have to face this alone. Would you like to tell me more about what's b
         # For moderate concern, add resources to AI response
         include_resources = crisis_level == "moderate"
         
-        # Initialize AI chat
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not api_key:
+        # Send message and get response
+        if not llm_gateway.configured:
             raise HTTPException(status_code=500, detail="AI service not configured")
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"user_{user_id}",
-            system_message=MENTAL_HEALTH_SYSTEM_PROMPT + context
-        ).with_model("openai", "gpt-5.2")
-        
-        # Send message and get response
-        user_message = UserMessage(text=request.message)
-        ai_response = await chat.send_message(user_message)
+        ai_response = await llm_gateway.complete(
+            "chat",
+            system_message=MENTAL_HEALTH_SYSTEM_PROMPT + context,
+            text=request.message,
+            session_id=f"user_{user_id}"
+        )
         
         # Save chat history
         chat_msg_user = ChatMessage(role="user", content=request.message)
         chat_msg_assistant = ChatMessage(role="assistant", content=ai_response)
         
-        # Get or create chat history
-        chat_history = await chat_history_collection.find_one({"user_id": user_id})
-        
-        if chat_history:
-            # Append to existing history
-            messages = chat_history.get('messages', [])
-            messages.append(chat_msg_user.model_dump())
-            messages.append(chat_msg_assistant.model_dump())
-            
-            # Keep only last 50 messages
-            if len(messages) > 50:
-                messages = messages[-50:]
-            
-            await chat_history_collection.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        "messages": messages,
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }
-                }
-            )
-        else:
-            # Create new chat history
-            from models import ChatHistory
-            new_history = ChatHistory(
-                user_id=user_id,
-                messages=[chat_msg_user, chat_msg_assistant]
-            )
-            history_dict = new_history.model_dump()
-            history_dict['created_at'] = history_dict['created_at'].isoformat()
-            history_dict['updated_at'] = history_dict['updated_at'].isoformat()
-            
-            await chat_history_collection.insert_one(history_dict)
+        await append_chat_turn(user_id, chat_msg_user, chat_msg_assistant)
         
         # Add resources footer for moderate concern
         final_response = ai_response
         if include_resources:
-            final_response += "\n\n---\n💜 *If you need immediate support: Call/text 988 or text HOME to 741741*"
+            final_response += MODERATE_RESOURCES_FOOTER
         
         return ChatResponse(
             response=final_response,
             crisis_detected=crisis_level is not None,
             crisis_level=crisis_level
         )
+
+    try:
+        # A double-submitted message gets one reply and one stored turn
+        return await chat_flights.run("chat", (user_id, request.message), respond)
         
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
@@ -1524,24 +1310,91 @@ You don't have to face this alone. Would you like to tell me more about what's b
         )
 
 
+def sse_event(data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+@api_router.post("/chat/stream")
+async def chat_with_ai_stream(
+    request: ChatRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Chat with AI assistant, streaming the reply as Server-Sent Events
+
+    Events are JSON objects: {"type": "token", "content": ...} for each piece
+    of the reply, then {"type": "done", "crisis_detected": ..., "crisis_level": ...}
+    or {"type": "error", "detail": ...}.
+    """
+    try:
+        context, crisis_level = await prepare_chat_turn(request.message, user_id)
+    except Exception as e:
+        logger.error(f"Error in chat: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to process chat request"
+        )
+    
+    if crisis_level not in CRISIS_RESPONSES and not llm_gateway.configured:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    async def events():
+        # Crisis replies are fixed text, so they go out immediately in one event
+        if crisis_level in CRISIS_RESPONSES:
+            yield sse_event({"type": "token", "content": CRISIS_RESPONSES[crisis_level]})
+            yield sse_event({"type": "done", "crisis_detected": True, "crisis_level": crisis_level})
+            return
+        
+        chunks = []
+        try:
+            async for chunk in llm_gateway.stream(
+                "chat_stream",
+                system_message=MENTAL_HEALTH_SYSTEM_PROMPT + context,
+                text=request.message,
+                session_id=f"user_{user_id}"
+            ):
+                chunks.append(chunk)
+                yield sse_event({"type": "token", "content": chunk})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield sse_event({"type": "error", "detail": "Unable to process chat request"})
+            return
+        
+        # Only reached when the reply completed; a client disconnect cancels
+        # this generator earlier and nothing is saved
+        ai_response = "".join(chunks)
+        await append_chat_turn(
+            user_id,
+            ChatMessage(role="user", content=request.message),
+            ChatMessage(role="assistant", content=ai_response)
+        )
+        
+        # Add resources footer for moderate concern
+        if crisis_level == "moderate":
+            yield sse_event({"type": "token", "content": MODERATE_RESOURCES_FOOTER})
+        yield sse_event({"type": "done", "crisis_detected": crisis_level is not None, "crisis_level": crisis_level})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @api_router.get("/chat/history")
 async def get_chat_history(
     limit: int = 20,
     user_id: str = Depends(get_current_user_id)
 ):
     """Get chat history for the user"""
-    chat_history = await chat_history_collection.find_one(
-        {"user_id": user_id},
-        {"_id": 0}
-    )
+    # Return last N messages; $slice keeps the rest of the array in the database
+    projection = {"_id": 0, "messages": {"$slice": -limit} if limit > 0 else 1}
+    chat_history = await chat_history_collection.find_one({"user_id": user_id}, projection)
     
     if not chat_history:
         return {"messages": []}
     
-    messages = chat_history.get('messages', [])
-    
-    # Return last N messages
-    return {"messages": messages[-limit:]}
+    return {"messages": chat_history.get('messages', [])}
 
 
 @api_router.delete("/chat/history", status_code=status.HTTP_204_NO_CONTENT)
@@ -1553,43 +1406,48 @@ async def clear_chat_history(user_id: str = Depends(get_current_user_id)):
 
 # ============= EDUCATIONAL CONTENT ROUTES =============
 
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match names etag (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in {strip(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
 @api_router.get("/content", response_model=List[Content])
 async def get_content(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     content_type: Optional[str] = None,
     search: Optional[str] = None,
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0)
 ):
-    """Get educational content with optional filters"""
-    query = {}
-    
-    if category:
-        query["category"] = category
-    
-    if content_type:
-        query["content_type"] = content_type
+    """Get educational content with optional filters; search results are sorted by relevance"""
+    catalog = await get_catalog()
+    if etag_matches(request, catalog.etag):
+        return not_modified(catalog.etag)
+    response.headers["ETag"] = catalog.etag
+    response.headers["Cache-Control"] = "no-cache"
     
     if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"tags": {"$in": [search.lower()]}}
-        ]
-    
-    content_items = await content_collection.find(query, {"_id": 0}).limit(limit).to_list(limit)
-    
-    # Convert ISO strings back to datetime
-    for item in content_items:
-        if isinstance(item.get('created_at'), str):
-            item['created_at'] = datetime.fromisoformat(item['created_at'])
-    
-    return [Content(**item) for item in content_items]
+        return await search_content(search, category, content_type, skip, limit)
+    return catalog.filter(category, content_type, skip, limit)
 
 
 @api_router.get("/content/{content_id}", response_model=Content)
-async def get_content_item(content_id: str):
+async def get_content_item(content_id: str, request: Request, response: Response):
     """Get a specific content item"""
-    content = await content_collection.find_one({"id": content_id}, {"_id": 0})
+    catalog = await get_catalog()
+    content = catalog.by_id.get(content_id)
     
     if not content:
         raise HTTPException(
@@ -1597,10 +1455,12 @@ async def get_content_item(content_id: str):
             detail="Content not found"
         )
     
-    if isinstance(content.get('created_at'), str):
-        content['created_at'] = datetime.fromisoformat(content['created_at'])
+    if etag_matches(request, catalog.etag):
+        return not_modified(catalog.etag)
+    response.headers["ETag"] = catalog.etag
+    response.headers["Cache-Control"] = "no-cache"
     
-    return Content(**content)
+    return content
 
 
 # ============= CAREGIVER ROUTES =============
@@ -1608,17 +1468,15 @@ async def get_content_item(content_id: str):
 @api_router.post("/caregivers/invite", response_model=CaregiverInvitation)
 async def invite_caregiver(
     invitation_data: CaregiverInvitationCreate,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Send an invitation to a caregiver"""
     # Get current user info
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
     # Check if invitation already exists
     existing_invitation = await caregiver_invitations_collection.find_one({
-        "patient_id": user_id,
+        "patient_id": user.id,
         "caregiver_email": invitation_data.caregiver_email,
         "status": "pending"
     })
@@ -1631,7 +1489,7 @@ async def invite_caregiver(
     
     # Check if relationship already exists
     existing_relationship = await caregiver_relationships_collection.find_one({
-        "patient_id": user_id,
+        "patient_id": user.id,
         "caregiver_email": invitation_data.caregiver_email
     })
     
@@ -1649,7 +1507,7 @@ async def invite_caregiver(
     }
     
     invitation = CaregiverInvitation(
-        patient_id=user_id,
+        patient_id=user.id,
         patient_name=user_doc.get('name', 'Unknown'),
         patient_email=user_doc.get('email', ''),
         caregiver_email=invitation_data.caregiver_email,
@@ -1657,8 +1515,6 @@ async def invite_caregiver(
     )
     
     invitation_dict = invitation.model_dump()
-    invitation_dict['created_at'] = invitation_dict['created_at'].isoformat()
-    invitation_dict['expires_at'] = invitation_dict['expires_at'].isoformat()
     
     await caregiver_invitations_collection.insert_one(invitation_dict)
     
@@ -1670,65 +1526,58 @@ async def invite_caregiver(
             notification_type="invitation",
             title="New Caregiver Invitation",
             message=f"{user_doc.get('name')} has invited you to be their caregiver.",
-            related_user_id=user_id,
+            related_user_id=user.id,
             related_user_name=user_doc.get('name')
         )
         notification_dict = notification.model_dump()
-        notification_dict['created_at'] = notification_dict['created_at'].isoformat()
         await notifications_collection.insert_one(notification_dict)
     
     return invitation
 
 
 @api_router.get("/caregivers/invitations/sent")
-async def get_sent_invitations(user_id: str = Depends(get_current_user_id)):
+async def get_sent_invitations(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
     """Get invitations sent by current user (as patient)"""
-    invitations = await caregiver_invitations_collection.find(
+    invitations, next_cursor = await fetch_page(
+        caregiver_invitations_collection,
         {"patient_id": user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    
-    for inv in invitations:
-        if isinstance(inv.get('created_at'), str):
-            inv['created_at'] = datetime.fromisoformat(inv['created_at'])
-        if isinstance(inv.get('expires_at'), str):
-            inv['expires_at'] = datetime.fromisoformat(inv['expires_at'])
+        [("created_at", -1), ("id", -1)], limit, cursor
+    )
     
-    return {"invitations": invitations}
+    return {"invitations": invitations, "next_cursor": next_cursor}
 
 
 @api_router.get("/caregivers/invitations/received")
-async def get_received_invitations(user_id: str = Depends(get_current_user_id)):
+async def get_received_invitations(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user_context)
+):
     """Get invitations received by current user (as caregiver)"""
     # Get user email
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
-    invitations = await caregiver_invitations_collection.find(
+    invitations, next_cursor = await fetch_page(
+        caregiver_invitations_collection,
         {"caregiver_email": user_doc['email'], "status": "pending"},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(100)
-    
-    for inv in invitations:
-        if isinstance(inv.get('created_at'), str):
-            inv['created_at'] = datetime.fromisoformat(inv['created_at'])
-        if isinstance(inv.get('expires_at'), str):
-            inv['expires_at'] = datetime.fromisoformat(inv['expires_at'])
+        [("created_at", -1), ("id", -1)], limit, cursor
+    )
     
-    return {"invitations": invitations}
+    return {"invitations": invitations, "next_cursor": next_cursor}
 
 
 @api_router.post("/caregivers/invitations/{invitation_id}/accept")
 async def accept_invitation(
     invitation_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Accept a caregiver invitation"""
     # Get user info
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
     # Find and validate invitation
     invitation = await caregiver_invitations_collection.find_one({
@@ -1740,12 +1589,9 @@ async def accept_invitation(
     if not invitation:
         raise HTTPException(status_code=404, detail="Invitation not found or already processed")
     
-    # Check if expired
-    expires_at = invitation.get('expires_at')
-    if isinstance(expires_at, str):
-        expires_at = datetime.fromisoformat(expires_at)
-    
-    if expires_at < datetime.now(timezone.utc):
+    # Check if expired (unmigrated invitations still hold an ISO string)
+    expires_at = stored_datetime(invitation.get('expires_at'))
+    if expires_at is None or expires_at < datetime.now(timezone.utc):
         await caregiver_invitations_collection.update_one(
             {"id": invitation_id},
             {"$set": {"status": "expired"}}
@@ -1757,16 +1603,16 @@ async def accept_invitation(
         patient_id=invitation['patient_id'],
         patient_name=invitation['patient_name'],
         patient_email=invitation['patient_email'],
-        caregiver_id=user_id,
+        caregiver_id=user.id,
         caregiver_name=user_doc.get('name', 'Unknown'),
         caregiver_email=user_doc['email'],
         permissions=invitation.get('permissions', {})
     )
     
     relationship_dict = relationship.model_dump()
-    relationship_dict['created_at'] = relationship_dict['created_at'].isoformat()
     
     await caregiver_relationships_collection.insert_one(relationship_dict)
+    invalidate_relationship(user.id, invitation['patient_id'])
     
     # Update invitation status
     await caregiver_invitations_collection.update_one(
@@ -1780,11 +1626,10 @@ async def accept_invitation(
         notification_type="invitation",
         title="Invitation Accepted",
         message=f"{user_doc.get('name')} has accepted your caregiver invitation.",
-        related_user_id=user_id,
+        related_user_id=user.id,
         related_user_name=user_doc.get('name')
     )
     notification_dict = notification.model_dump()
-    notification_dict['created_at'] = notification_dict['created_at'].isoformat()
     await notifications_collection.insert_one(notification_dict)
     
     return {"message": "Invitation accepted successfully", "relationship_id": relationship.id}
@@ -1793,13 +1638,11 @@ async def accept_invitation(
 @api_router.post("/caregivers/invitations/{invitation_id}/reject")
 async def reject_invitation(
     invitation_id: str,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Reject a caregiver invitation"""
     # Get user email
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
     result = await caregiver_invitations_collection.update_one(
         {"id": invitation_id, "caregiver_email": user_doc['email'], "status": "pending"},
@@ -1831,33 +1674,35 @@ async def cancel_invitation(
 
 
 @api_router.get("/caregivers")
-async def get_my_caregivers(user_id: str = Depends(get_current_user_id)):
-    """Get list of caregivers for current user (as patient)"""
-    relationships = await caregiver_relationships_collection.find(
+async def get_my_caregivers(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get list of caregivers for current user (as patient), oldest first"""
+    relationships, next_cursor = await fetch_page(
+        caregiver_relationships_collection,
         {"patient_id": user_id},
-        {"_id": 0}
-    ).to_list(100)
-    
-    for rel in relationships:
-        if isinstance(rel.get('created_at'), str):
-            rel['created_at'] = datetime.fromisoformat(rel['created_at'])
+        [("created_at", 1), ("id", 1)], limit, cursor
+    )
     
-    return {"caregivers": relationships}
+    return {"caregivers": relationships, "next_cursor": next_cursor}
 
 
 @api_router.get("/caregivers/patients")
-async def get_my_patients(user_id: str = Depends(get_current_user_id)):
-    """Get list of patients for current user (as caregiver)"""
-    relationships = await caregiver_relationships_collection.find(
+async def get_my_patients(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get list of patients for current user (as caregiver), oldest first"""
+    relationships, next_cursor = await fetch_page(
+        caregiver_relationships_collection,
         {"caregiver_id": user_id},
-        {"_id": 0}
-    ).to_list(100)
-    
-    for rel in relationships:
-        if isinstance(rel.get('created_at'), str):
-            rel['created_at'] = datetime.fromisoformat(rel['created_at'])
+        [("created_at", 1), ("id", 1)], limit, cursor
+    )
     
-    return {"patients": relationships}
+    return {"patients": relationships, "next_cursor": next_cursor}
 
 
 @api_router.get("/caregivers/patients/{patient_id}/mood-logs")
@@ -1865,15 +1710,13 @@ async def get_patient_mood_logs(
     patient_id: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    limit: int = 30,
+    limit: int = Query(30, ge=1),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
     """Get mood logs for a patient (as caregiver)"""
     # Verify caregiver relationship and permissions
-    relationship = await caregiver_relationships_collection.find_one({
-        "patient_id": patient_id,
-        "caregiver_id": user_id
-    })
+    relationship = await load_relationship(user_id, patient_id)
     
     if not relationship:
         raise HTTPException(status_code=403, detail="Not authorized to view this patient's data")
@@ -1891,48 +1734,15 @@ async def get_patient_mood_logs(
             date_filter["$lte"] = end_date
         query["date"] = date_filter
     
-    logs = await mood_logs_collection.find(query, {"_id": 0}).sort("date", -1).limit(limit).to_list(limit)
+    logs, next_cursor = await fetch_page(mood_logs_collection, query, [("date", -1)], limit, cursor)
     
-    for log in logs:
-        if isinstance(log.get('timestamp'), str):
-            log['timestamp'] = datetime.fromisoformat(log['timestamp'])
-    
-    return {"mood_logs": [MoodLog(**log).model_dump() for log in logs]}
+    return {"mood_logs": [MoodLog(**log).model_dump() for log in logs], "next_cursor": next_cursor}
 
 
-@api_router.get("/caregivers/patients/{patient_id}/analytics")
-async def get_patient_analytics(
-    patient_id: str,
-    days: int = 30,
-    user_id: str = Depends(get_current_user_id)
-):
-    """Get analytics for a patient (as caregiver)"""
-    # Verify caregiver relationship and permissions
-    relationship = await caregiver_relationships_collection.find_one({
-        "patient_id": patient_id,
-        "caregiver_id": user_id
-    })
-    
-    if not relationship:
-        raise HTTPException(status_code=403, detail="Not authorized to view this patient's data")
-    
-    if not relationship.get('permissions', {}).get('view_analytics', False):
-        raise HTTPException(status_code=403, detail="Permission denied to view analytics")
-    
-    # Get patient info
-    patient = await users_collection.find_one({"id": patient_id}, {"_id": 0, "password_hash": 0})
-    
-    # Get logs from last N days
-    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
-    
-    logs = await mood_logs_collection.find({
-        "user_id": patient_id,
-        "date": {"$gte": start_date}
-    }, {"_id": 0}).to_list(1000)
-    
-    if not logs:
+def patient_summary(stats: dict, recent_days: list) -> dict:
+    """Caregiver-facing analytics from a mood_stats summary and the patient's latest logged days"""
+    if not stats["total_logs"]:
         return {
-            "patient_name": patient.get('name') if patient else 'Unknown',
             "average_mood": 0.0,
             "total_logs": 0,
             "mood_trend": "stable",
@@ -1941,68 +1751,129 @@ async def get_patient_analytics(
             "recent_concerns": []
         }
     
-    # Calculate analytics
-    mood_ratings = [log['mood_rating'] for log in logs]
-    avg_mood = mean(mood_ratings)
-    
-    # Determine trend
-    half = len(mood_ratings) // 2
-    if half > 0:
-        first_half_avg = mean(mood_ratings[:half])
-        second_half_avg = mean(mood_ratings[half:])
-        if second_half_avg > first_half_avg + 0.5:
-            trend = "improving"
-        elif second_half_avg < first_half_avg - 0.5:
-            trend = "declining"
-        else:
-            trend = "stable"
-    else:
-        trend = "stable"
-    
-    # Get common symptoms
-    symptom_counts = {}
-    for log in logs:
-        for symptom, value in log.get('symptoms', {}).items():
-            if value:
-                symptom_counts[symptom] = symptom_counts.get(symptom, 0) + 1
-    
-    most_common = sorted(
-        [{"symptom": k, "count": v} for k, v in symptom_counts.items()],
-        key=lambda x: x['count'],
-        reverse=True
-    )[:5]
-    
     # Identify recent concerns (low mood days, missed medications)
     recent_concerns = []
-    recent_logs = logs[:7]  # Last 7 logs
     
-    low_mood_days = [log for log in recent_logs if log['mood_rating'] <= 3]
+    low_mood_days = sum(day.get('low_mood_count', 0) for day in recent_days)
     if low_mood_days:
         recent_concerns.append({
             "type": "low_mood",
-            "message": f"{len(low_mood_days)} day(s) with very low mood in recent logs",
-            "severity": "high" if len(low_mood_days) >= 3 else "medium"
+            "message": f"{low_mood_days} day(s) with very low mood in recent logs",
+            "severity": "high" if low_mood_days >= 3 else "medium"
         })
     
-    missed_meds = [log for log in recent_logs if not log.get('medication_taken', True)]
-    if missed_meds and len(missed_meds) > 2:
+    missed_meds = sum(day.get('medication_missed_count', 0) for day in recent_days)
+    if missed_meds > 2:
         recent_concerns.append({
             "type": "medication",
-            "message": f"Medication missed on {len(missed_meds)} recent days",
+            "message": f"Medication missed on {missed_meds} recent days",
             "severity": "medium"
         })
     
     return {
-        "patient_name": patient.get('name') if patient else 'Unknown',
-        "average_mood": round(avg_mood, 1),
-        "total_logs": len(logs),
-        "mood_trend": trend,
-        "most_common_symptoms": most_common,
+        "average_mood": round(stats["mood_sum"] / stats["total_logs"], 1),
+        "total_logs": stats["total_logs"],
+        "mood_trend": mood_trend(stats),
+        "most_common_symptoms": most_common_symptoms(stats),
         "insights": [],
         "recent_concerns": recent_concerns
     }
 
 
+def build_patient_overview(relationships: list, names: dict, buckets: dict, recent_days: dict,
+                           last_log_dates: dict) -> list:
+    """One overview entry per relationship, from per-patient stat buckets and latest logged days
+
+    Patients whose relationship lacks view_analytics get "analytics": None.
+    last_log_date is the latest log however old, so a patient who has gone
+    quiet still shows when they last logged.
+    """
+    overview = []
+    for relationship in relationships:
+        patient_id = relationship['patient_id']
+        entry = {
+            "patient_id": patient_id,
+            "relationship_id": relationship['id'],
+            "patient_name": names.get(patient_id) or 'Unknown',
+            "analytics": None
+        }
+        if relationship.get('permissions', {}).get('view_analytics', False):
+            patient_days = recent_days.get(patient_id, [])
+            entry["analytics"] = {
+                **patient_summary(summarize_stats(buckets.get(patient_id, [])), patient_days),
+                "last_log_date": last_log_dates.get(patient_id)
+            }
+        overview.append(entry)
+    return overview
+
+
+@api_router.get("/caregivers/patients/{patient_id}/analytics")
+async def get_patient_analytics(
+    patient_id: str,
+    days: int = 30,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Get analytics for a patient (as caregiver)"""
+    # Verify caregiver relationship and permissions
+    relationship = await load_relationship(user_id, patient_id)
+    
+    if not relationship:
+        raise HTTPException(status_code=403, detail="Not authorized to view this patient's data")
+    
+    if not relationship.get('permissions', {}).get('view_analytics', False):
+        raise HTTPException(status_code=403, detail="Permission denied to view analytics")
+    
+    # Get patient info
+    patient = await users_collection.find_one({"id": patient_id}, {"_id": 0, "password_hash": 0})
+    
+    # Get pre-aggregated stats from last N days
+    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    stats = summarize_stats(await load_stat_buckets(patient_id, start_date))
+    recent_days = await recent_stat_days(patient_id, 7)  # Last 7 logged days
+    
+    return {
+        "patient_name": patient.get('name') if patient else 'Unknown',
+        **patient_summary(stats, recent_days)
+    }
+
+
+@api_router.get("/caregivers/patients/overview")
+async def get_patients_overview(
+    days: int = Query(30, ge=1, le=365),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id)
+):
+    """Analytics summaries for all patients of the current user (as caregiver) in one call, oldest first"""
+    relationships, next_cursor = await fetch_page(
+        caregiver_relationships_collection,
+        {"caregiver_id": user_id},
+        [("created_at", 1), ("id", 1)], limit, cursor
+    )
+    patient_ids = [r['patient_id'] for r in relationships]
+    permitted_ids = {
+        r['patient_id'] for r in relationships if r.get('permissions', {}).get('view_analytics', False)
+    }
+    
+    # One query per collection for the whole page of patients
+    start_date = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    patients, buckets, recent_days, last_log_dates = await asyncio.gather(
+        users_collection.find(
+            {"id": {"$in": patient_ids}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None),
+        load_stat_buckets_for_users(list(permitted_ids), start_date),
+        recent_stat_days_for_users(list(permitted_ids), 7),
+        last_log_dates_for_users(list(permitted_ids))
+    )
+    names = {patient['id']: patient.get('name') for patient in patients}
+    
+    return {
+        "days_analyzed": days,
+        "patients": build_patient_overview(relationships, names, buckets, recent_days, last_log_dates),
+        "next_cursor": next_cursor
+    }
+
+
 @api_router.put("/caregivers/{relationship_id}/permissions")
 async def update_caregiver_permissions(
     relationship_id: str,
@@ -2010,14 +1881,17 @@ async def update_caregiver_permissions(
     user_id: str = Depends(get_current_user_id)
 ):
     """Update permissions for a caregiver (as patient)"""
-    result = await caregiver_relationships_collection.update_one(
+    relationship = await caregiver_relationships_collection.find_one_and_update(
         {"id": relationship_id, "patient_id": user_id},
-        {"$set": {"permissions": update_data.permissions}}
+        {"$set": {"permissions": update_data.permissions}},
+        projection={"_id": 0, "caregiver_id": 1, "patient_id": 1}
     )
     
-    if result.matched_count == 0:
+    if not relationship:
         raise HTTPException(status_code=404, detail="Relationship not found")
     
+    invalidate_relationship(relationship['caregiver_id'], relationship['patient_id'])
+    
     return {"message": "Permissions updated successfully"}
 
 
@@ -2037,6 +1911,7 @@ async def remove_caregiver(
         raise HTTPException(status_code=404, detail="Relationship not found")
     
     await caregiver_relationships_collection.delete_one({"id": relationship_id})
+    invalidate_relationship(relationship['caregiver_id'], relationship['patient_id'])
     
     return {"message": "Caregiver relationship removed"}
 
@@ -2046,7 +1921,8 @@ async def remove_caregiver(
 @api_router.get("/notifications")
 async def get_notifications(
     unread_only: bool = False,
-    limit: int = 50,
+    limit: int = Query(50, ge=1),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
     """Get notifications for current user"""
@@ -2054,13 +1930,9 @@ async def get_notifications(
     if unread_only:
         query["is_read"] = False
     
-    notifications = await notifications_collection.find(
-        query, {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
-    
-    for notif in notifications:
-        if isinstance(notif.get('created_at'), str):
-            notif['created_at'] = datetime.fromisoformat(notif['created_at'])
+    notifications, next_cursor = await fetch_page(
+        notifications_collection, query, [("created_at", -1), ("id", -1)], limit, cursor
+    )
     
     # Count unread
     unread_count = await notifications_collection.count_documents({
@@ -2068,7 +1940,7 @@ async def get_notifications(
         "is_read": False
     })
     
-    return {"notifications": notifications, "unread_count": unread_count}
+    return {"notifications": notifications, "unread_count": unread_count, "next_cursor": next_cursor}
 
 
 @api_router.put("/notifications/{notification_id}/read")
@@ -2102,11 +1974,9 @@ async def mark_all_notifications_read(user_id: str = Depends(get_current_user_id
 # ============= NOTIFICATION PREFERENCES ROUTES =============
 
 @api_router.get("/users/me/notification-preferences")
-async def get_notification_preferences(user_id: str = Depends(get_current_user_id)):
+async def get_notification_preferences(user: CurrentUser = Depends(get_current_user_context)):
     """Get user's notification preferences"""
-    user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_doc = await user.doc()
     
     default_prefs = {
         "email_crisis_alerts": True,
@@ -2125,7 +1995,7 @@ async def get_notification_preferences(user_id: str = Depends(get_current_user_i
 @api_router.put("/users/me/notification-preferences")
 async def update_notification_preferences(
     prefs: NotificationPreferencesUpdate,
-    user_id: str = Depends(get_current_user_id)
+    user: CurrentUser = Depends(get_current_user_context)
 ):
     """Update user's notification preferences"""
     update_data = {k: v for k, v in prefs.model_dump().items() if v is not None}
@@ -2133,17 +2003,17 @@ async def update_notification_preferences(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
-    user_doc = await users_collection.find_one({"id": user_id})
-    if not user_doc:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    existing_prefs = user_doc.get('notification_preferences', {})
-    existing_prefs.update(update_data)
-    
-    await users_collection.update_one(
-        {"id": user_id},
-        {"$set": {"notification_preferences": existing_prefs}}
+    # Merge field by field in Mongo, so concurrent updates of different fields both stick
+    updated = await users_collection.find_one_and_update(
+        {"id": user.id},
+        {"$set": {f"notification_preferences.{k}": v for k, v in update_data.items()}},
+        projection={"_id": 0, "notification_preferences": 1},
+        return_document=ReturnDocument.AFTER
     )
+    invalidate_user(user.id)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    existing_prefs = updated.get('notification_preferences', {})
     
     return {"message": "Notification preferences updated", "notification_preferences": existing_prefs}
 
@@ -2172,7 +2042,6 @@ async def subscribe_push(
     )
     
     sub_dict = push_sub.model_dump()
-    sub_dict['created_at'] = sub_dict['created_at'].isoformat()
     
     await push_subscriptions_collection.insert_one(sub_dict)
     
@@ -2208,6 +2077,9 @@ async def get_vapid_public_key():
 
 # ----- Task Chunking Engine -----
 
+CHUNK_UPDATE_ATTEMPTS = 5  # concurrent toggles of the same task retry against the fresh chunks
+
+
 @api_router.post("/tools/tasks")
 async def create_task(
     task_data: TaskCreate,
@@ -2226,8 +2098,7 @@ async def create_task(
     # Use AI to break task into chunks if requested
     if task_data.auto_chunk and task_data.title:
         try:
-            api_key = os.getenv("EMERGENT_LLM_KEY")
-            if api_key:
+            if llm_gateway.configured:
                 chunk_prompt = f"""Break this task into small, concrete, actionable steps for someone with ADHD.
 Task: {task_data.title}
 {f"Description: {task_data.description}" if task_data.description else ""}
@@ -2245,14 +2116,15 @@ Return as JSON array:
   ...
 ]"""
                 
-                chat = LlmChat(
-                    api_key=api_key,
-                    session_id=f"task_chunk_{user_id}_{task.id}",
-                    system_message="You are an ADHD task coach. Break tasks into small, actionable steps. Return only valid JSON."
-                ).with_model("openai", "gpt-5.2")
-                
-                user_message = UserMessage(text=chunk_prompt)
-                ai_response = await chat.send_message(user_message)
+                ai_response = await llm_flights.run(
+                    "task_chunking", (user_id, chunk_prompt),
+                    lambda: llm_gateway.complete(
+                        "task_chunking",
+                        system_message="You are an ADHD task coach. Break tasks into small, actionable steps. Return only valid JSON.",
+                        text=chunk_prompt,
+                        session_id=f"task_chunk_{user_id}_{task.id}"
+                    )
+                )
                 
                 # Parse chunks from AI response
                 json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
@@ -2272,13 +2144,6 @@ Return as JSON array:
             logger.error(f"Error chunking task: {e}")
     
     task_dict = task.model_dump()
-    task_dict['created_at'] = task_dict['created_at'].isoformat()
-    task_dict['updated_at'] = task_dict['updated_at'].isoformat()
-    if task_dict.get('due_date'):
-        task_dict['due_date'] = task_dict['due_date'].isoformat()
-    for chunk in task_dict.get('chunks', []):
-        if chunk.get('completed_at'):
-            chunk['completed_at'] = chunk['completed_at'].isoformat()
     
     await tasks_collection.insert_one(task_dict)
     task_dict.pop('_id', None)  # Remove MongoDB _id before returning
@@ -2290,17 +2155,21 @@ Return as JSON array:
 async def get_tasks(
     status: Optional[str] = None,
     priority: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get all tasks for the current user"""
+    """Get the current user's tasks, newest first"""
     query = {"user_id": user_id}
     if status:
         query["status"] = status
     if priority:
         query["priority"] = priority
     
-    tasks = await tasks_collection.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return {"tasks": tasks}
+    tasks, next_cursor = await fetch_page(
+        tasks_collection, query, [("created_at", -1), ("id", -1)], limit, cursor
+    )
+    return {"tasks": tasks, "next_cursor": next_cursor}
 
 
 @api_router.get("/tools/tasks/{task_id}")
@@ -2326,23 +2195,24 @@ async def update_task(
 ):
     """Update a task"""
     update_data = {k: v for k, v in task_update.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    if 'due_date' in update_data and update_data['due_date']:
-        update_data['due_date'] = update_data['due_date'].isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
     if update_data.get('status') == 'completed':
-        update_data['completed_at'] = datetime.now(timezone.utc).isoformat()
+        update_data['completed_at'] = datetime.now(timezone.utc)
     
-    result = await tasks_collection.update_one(
+    # The pre-image tells the rewards state whether this completes (or reopens) the task
+    old_task = await tasks_collection.find_one_and_update(
         {"id": task_id, "user_id": user_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not old_task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task = await tasks_collection.find_one({"id": task_id}, {"_id": 0})
+    task = {**old_task, **update_data}
+    await record_task_change(user_id, old_task, task)
     return {"task": task}
 
 
@@ -2354,42 +2224,51 @@ async def update_chunk(
     user_id: str = Depends(get_current_user_id)
 ):
     """Update a specific chunk's completion status"""
-    task = await tasks_collection.find_one({"id": task_id, "user_id": user_id})
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    
-    chunks = task.get('chunks', [])
-    chunk_found = False
-    completed_count = 0
-    
-    for chunk in chunks:
-        if chunk['id'] == chunk_id:
-            chunk['is_completed'] = chunk_update.is_completed
-            chunk['completed_at'] = datetime.now(timezone.utc).isoformat() if chunk_update.is_completed else None
-            chunk_found = True
-        if chunk.get('is_completed'):
-            completed_count += 1
-    
-    if not chunk_found:
-        raise HTTPException(status_code=404, detail="Chunk not found")
-    
-    update_data = {
-        'chunks': chunks,
-        'updated_at': datetime.now(timezone.utc).isoformat()
-    }
-    
-    if completed_count == len(chunks) and len(chunks) > 0:
-        update_data['status'] = 'completed'
-        update_data['completed_at'] = datetime.now(timezone.utc).isoformat()
-    elif completed_count > 0:
-        update_data['status'] = 'in_progress'
-    
-    await tasks_collection.update_one(
-        {"id": task_id},
-        {"$set": update_data}
-    )
+    # Compare-and-set on the chunks read, so the pre-image handed to the
+    # rewards state is exactly what this write replaced
+    for _ in range(CHUNK_UPDATE_ATTEMPTS):
+        task = await tasks_collection.find_one({"id": task_id, "user_id": user_id}, {"_id": 0})
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        old_task = {**task, "chunks": [dict(chunk) for chunk in task.get('chunks', [])]}
+        
+        chunks = task.get('chunks', [])
+        chunk_found = False
+        completed_count = 0
+        
+        for chunk in chunks:
+            if chunk['id'] == chunk_id:
+                chunk['is_completed'] = chunk_update.is_completed
+                chunk['completed_at'] = datetime.now(timezone.utc) if chunk_update.is_completed else None
+                chunk_found = True
+            if chunk.get('is_completed'):
+                completed_count += 1
+        
+        if not chunk_found:
+            raise HTTPException(status_code=404, detail="Chunk not found")
+        
+        update_data = {
+            'chunks': chunks,
+            'updated_at': datetime.now(timezone.utc)
+        }
+        
+        if completed_count == len(chunks) and len(chunks) > 0:
+            update_data['status'] = 'completed'
+            update_data['completed_at'] = datetime.now(timezone.utc)
+        elif completed_count > 0:
+            update_data['status'] = 'in_progress'
+        
+        result = await tasks_collection.update_one(
+            {"id": task_id, "user_id": user_id, "chunks": old_task['chunks'], "status": old_task.get('status')},
+            {"$set": update_data}
+        )
+        if result.matched_count:
+            break
+    else:
+        raise HTTPException(status_code=409, detail="Task is being updated concurrently, please retry")
     
-    task = await tasks_collection.find_one({"id": task_id}, {"_id": 0})
+    task = {**task, **update_data}
+    await record_task_change(user_id, old_task, task)
     return {"task": task}
 
 
@@ -2399,9 +2278,13 @@ async def delete_task(
     user_id: str = Depends(get_current_user_id)
 ):
     """Delete a task"""
-    result = await tasks_collection.delete_one({"id": task_id, "user_id": user_id})
-    if result.deleted_count == 0:
+    deleted_task = await tasks_collection.find_one_and_delete(
+        {"id": task_id, "user_id": user_id},
+        projection={"_id": 0}
+    )
+    if not deleted_task:
         raise HTTPException(status_code=404, detail="Task not found")
+    await record_task_change(user_id, deleted_task, None)
     return {"message": "Task deleted"}
 
 
@@ -2424,8 +2307,6 @@ async def create_pomodoro_session(
     )
     
     session_dict = session.model_dump()
-    session_dict['created_at'] = session_dict['created_at'].isoformat()
-    session_dict['started_at'] = session_dict['started_at'].isoformat()
     
     await pomodoro_sessions_collection.insert_one(session_dict)
     session_dict.pop('_id', None)
@@ -2435,16 +2316,18 @@ async def create_pomodoro_session(
 
 @api_router.get("/tools/pomodoro/sessions")
 async def get_pomodoro_sessions(
-    limit: int = 20,
+    limit: int = Query(20, ge=1),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
     """Get pomodoro session history"""
-    sessions = await pomodoro_sessions_collection.find(
+    sessions, next_cursor = await fetch_page(
+        pomodoro_sessions_collection,
         {"user_id": user_id},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(limit)
+        [("created_at", -1), ("id", -1)], limit, cursor
+    )
     
-    return {"sessions": sessions}
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 
 @api_router.put("/tools/pomodoro/sessions/{session_id}")
@@ -2457,17 +2340,21 @@ async def update_pomodoro_session(
     update_data = {k: v for k, v in session_update.model_dump().items() if v is not None}
     
     if update_data.get('status') in ['completed', 'abandoned']:
-        update_data['ended_at'] = datetime.now(timezone.utc).isoformat()
+        update_data['ended_at'] = datetime.now(timezone.utc)
     
-    result = await pomodoro_sessions_collection.update_one(
+    old_session = await pomodoro_sessions_collection.find_one_and_update(
         {"id": session_id, "user_id": user_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not old_session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session = await pomodoro_sessions_collection.find_one({"id": session_id}, {"_id": 0})
+    session = {**old_session, **update_data}
+    await record_session_change(user_id, old_session, session)
+    await record_session_focus(user_id, old_session, session)
     return {"session": session}
 
 
@@ -2482,7 +2369,7 @@ async def get_pomodoro_stats(
     sessions = await pomodoro_sessions_collection.find({
         "user_id": user_id,
         "status": "completed",
-        "created_at": {"$gte": since.isoformat()}
+        "created_at": {"$gte": since}
     }, {"_id": 0}).to_list(500)
     
     total_sessions = len(sessions)
@@ -2559,16 +2446,19 @@ DEFAULT_DOPAMINE_ITEMS = [
 async def get_dopamine_items(
     category: Optional[str] = None,
     energy_level: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_current_user_id)
 ):
-    """Get user's dopamine menu items"""
+    """Get user's dopamine menu items in the order they were added"""
     count = await dopamine_items_collection.count_documents({"user_id": user_id})
     
     if count == 0:
-        for item_data in DEFAULT_DOPAMINE_ITEMS:
-            item = DopamineItem(user_id=user_id, is_custom=False, **item_data)
+        # BSON dates keep milliseconds; space the defaults so they list in menu order
+        now = datetime.now(timezone.utc)
+        for position, item_data in enumerate(DEFAULT_DOPAMINE_ITEMS):
+            item = DopamineItem(user_id=user_id, is_custom=False, created_at=now + timedelta(milliseconds=position), **item_data)
             item_dict = item.model_dump()
-            item_dict['created_at'] = item_dict['created_at'].isoformat()
             await dopamine_items_collection.insert_one(item_dict)
     
     query = {"user_id": user_id}
@@ -2577,9 +2467,11 @@ async def get_dopamine_items(
     if energy_level and energy_level != "any":
         query["$or"] = [{"energy_level": energy_level}, {"energy_level": "any"}]
     
-    items = await dopamine_items_collection.find(query, {"_id": 0}).to_list(100)
+    items, next_cursor = await fetch_page(
+        dopamine_items_collection, query, [("created_at", 1), ("id", 1)], limit, cursor
+    )
     
-    return {"items": items}
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @api_router.post("/tools/dopamine")
@@ -2595,7 +2487,6 @@ async def create_dopamine_item(
     )
     
     item_dict = item.model_dump()
-    item_dict['created_at'] = item_dict['created_at'].isoformat()
     
     await dopamine_items_collection.insert_one(item_dict)
     item_dict.pop('_id', None)
@@ -2634,7 +2525,7 @@ async def use_dopamine_item(
         {"id": item_id, "user_id": user_id},
         {
             "$inc": {"times_used": 1},
-            "$set": {"last_used_at": datetime.now(timezone.utc).isoformat()}
+            "$set": {"last_used_at": datetime.now(timezone.utc)}
         }
     )
     
@@ -2699,14 +2590,14 @@ async def get_time_blindness_stats(
         "user_id": user_id,
         "status": "completed",
         "estimated_total_minutes": {"$exists": True, "$ne": None},
-        "created_at": {"$gte": since.isoformat()}
+        "created_at": {"$gte": since}
     }, {"_id": 0}).to_list(100)
     
     # Get completed pomodoro sessions
     sessions = await pomodoro_sessions_collection.find({
         "user_id": user_id,
         "status": "completed",
-        "created_at": {"$gte": since.isoformat()}
+        "created_at": {"$gte": since}
     }, {"_id": 0}).to_list(500)
     
     # Calculate stats
@@ -2748,62 +2639,17 @@ async def get_energy_patterns(
     user_id: str = Depends(get_current_user_id)
 ):
     """Analyze energy patterns from mood logs and pomodoro sessions"""
-    since = datetime.now(timezone.utc) - timedelta(days=days)
-    
-    # Get mood logs
-    mood_logs = await mood_logs_collection.find({
-        "user_id": user_id,
-        "timestamp": {"$gte": since.isoformat()}
-    }, {"_id": 0}).to_list(500)
-    
-    # Get successful pomodoro sessions
-    sessions = await pomodoro_sessions_collection.find({
-        "user_id": user_id,
-        "status": "completed",
-        "focus_rating": {"$gte": 7},
-        "created_at": {"$gte": since.isoformat()}
-    }, {"_id": 0}).to_list(500)
+    # The histogram keeps whole days, at most ENERGY_WINDOW_DAYS of them
+    days = max(1, min(days, ENERGY_WINDOW_DAYS))
     
-    # Analyze by hour of day
-    hour_energy = {}
-    for log in mood_logs:
-        try:
-            ts = datetime.fromisoformat(log['timestamp'].replace('Z', '+00:00'))
-            hour = ts.hour
-            energy = log.get('energy', 5)
-            mood = log.get('mood', 5)
-            if hour not in hour_energy:
-                hour_energy[hour] = {'energy': [], 'mood': [], 'focus_sessions': 0}
-            hour_energy[hour]['energy'].append(energy)
-            hour_energy[hour]['mood'].append(mood)
-        except Exception:
-            continue
-    
-    # Count successful focus sessions by hour
-    for session in sessions:
-        try:
-            ts = datetime.fromisoformat(session['started_at'].replace('Z', '+00:00'))
-            hour = ts.hour
-            if hour in hour_energy:
-                hour_energy[hour]['focus_sessions'] += 1
-        except Exception:
-            continue
+    # Hourly mood log sums and successful focus sessions from the precomputed buckets
+    histogram = await load_histogram(user_id)
+    energy_sum, mood_sum, log_count, focus_sessions = hour_histogram(
+        histogram, days, datetime.now(timezone.utc).date()
+    )
     
     # Calculate peak hours
-    hour_scores = []
-    for hour, data in hour_energy.items():
-        avg_energy = mean(data['energy']) if data['energy'] else 0
-        avg_mood = mean(data['mood']) if data['mood'] else 0
-        focus_count = data['focus_sessions']
-        # Composite score: energy (40%) + mood (30%) + focus sessions (30%)
-        score = avg_energy * 0.4 + avg_mood * 0.3 + min(focus_count * 2, 10) * 0.3
-        hour_scores.append({
-            'hour': hour,
-            'avg_energy': round(avg_energy, 1),
-            'avg_mood': round(avg_mood, 1),
-            'focus_sessions': focus_count,
-            'productivity_score': round(score, 1)
-        })
+    hour_scores = energy_hour_scores(energy_sum, mood_sum, log_count, focus_sessions)
     
     hour_scores.sort(key=lambda x: x['productivity_score'], reverse=True)
     
@@ -2841,99 +2687,26 @@ async def get_reward_stats(
     user_id: str = Depends(get_current_user_id)
 ):
     """Get gamification stats: streaks, badges, achievements"""
-    today = datetime.now(timezone.utc).date()
-    
-    # Get all tasks and sessions
-    all_tasks = await tasks_collection.find(
-        {"user_id": user_id, "status": "completed"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    all_sessions = await pomodoro_sessions_collection.find(
-        {"user_id": user_id, "status": "completed"},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    # Calculate current streak (consecutive days with activity)
-    activity_dates = set()
-    for task in all_tasks:
-        try:
-            completed_at = task.get('completed_at')
-            if completed_at:
-                date = datetime.fromisoformat(completed_at.replace('Z', '+00:00')).date()
-                activity_dates.add(date)
-        except Exception:
-            continue
-    
-    for session in all_sessions:
-        try:
-            ended_at = session.get('ended_at')
-            if ended_at:
-                date = datetime.fromisoformat(ended_at.replace('Z', '+00:00')).date()
-                activity_dates.add(date)
-        except Exception:
-            continue
-    
-    # Calculate streak
-    current_streak = 0
-    check_date = today
-    while check_date in activity_dates or (check_date == today and len(activity_dates) > 0):
-        if check_date in activity_dates:
-            current_streak += 1
-        check_date -= timedelta(days=1)
-        if current_streak > 0 and check_date not in activity_dates:
-            break
-    
-    # Total stats
-    total_tasks_completed = len(all_tasks)
-    total_chunks_completed = sum(len([c for c in t.get('chunks', []) if c.get('is_completed')]) for t in all_tasks)
-    total_focus_minutes = sum(s.get('actual_duration_minutes', s.get('planned_duration_minutes', 25)) for s in all_sessions)
-    total_sessions = len(all_sessions)
-    
-    # Badges/achievements
-    badges = []
-    
-    if total_tasks_completed >= 1:
-        badges.append({"id": "first_task", "name": "First Step", "description": "Completed your first task", "icon": "rocket"})
-    if total_tasks_completed >= 10:
-        badges.append({"id": "task_master_10", "name": "Task Master", "description": "Completed 10 tasks", "icon": "trophy"})
-    if total_tasks_completed >= 50:
-        badges.append({"id": "task_master_50", "name": "Task Champion", "description": "Completed 50 tasks", "icon": "crown"})
-    
-    if total_sessions >= 10:
-        badges.append({"id": "focus_warrior", "name": "Focus Warrior", "description": "Completed 10 focus sessions", "icon": "flame"})
-    if total_sessions >= 50:
-        badges.append({"id": "focus_master", "name": "Focus Master", "description": "Completed 50 focus sessions", "icon": "zap"})
-    
-    if current_streak >= 3:
-        badges.append({"id": "streak_3", "name": "On Fire", "description": "3-day streak", "icon": "fire"})
-    if current_streak >= 7:
-        badges.append({"id": "streak_7", "name": "Weekly Warrior", "description": "7-day streak", "icon": "star"})
-    if current_streak >= 30:
-        badges.append({"id": "streak_30", "name": "Unstoppable", "description": "30-day streak", "icon": "medal"})
-    
-    if total_focus_minutes >= 60:
-        badges.append({"id": "hour_focus", "name": "Hour of Power", "description": "1 hour total focus time", "icon": "clock"})
-    if total_focus_minutes >= 600:
-        badges.append({"id": "ten_hour_focus", "name": "Focus Legend", "description": "10 hours total focus time", "icon": "award"})
-    
-    # Weekly progress (last 7 days)
-    week_ago = today - timedelta(days=7)
-    weekly_tasks = len([t for t in all_tasks if t.get('completed_at') and datetime.fromisoformat(t['completed_at'].replace('Z', '+00:00')).date() > week_ago])
-    weekly_sessions = len([s for s in all_sessions if s.get('ended_at') and datetime.fromisoformat(s['ended_at'].replace('Z', '+00:00')).date() > week_ago])
-    
-    return {
-        "current_streak": current_streak,
-        "total_tasks_completed": total_tasks_completed,
-        "total_chunks_completed": total_chunks_completed,
-        "total_focus_minutes": total_focus_minutes,
-        "total_sessions": total_sessions,
-        "badges": badges,
-        "weekly_tasks": weekly_tasks,
-        "weekly_sessions": weekly_sessions,
-        "level": 1 + (total_tasks_completed // 5) + (total_sessions // 10),
-        "xp": total_tasks_completed * 10 + total_sessions * 5 + total_chunks_completed * 2
-    }
+    state = await load_state(user_id)
+    return reward_stats(state, datetime.now(timezone.utc).date())
+
+
+@api_router.get("/metrics/latency")
+async def get_latency_metrics(user_id: str = Depends(get_current_user_id)):
+    """Per-operation latency percentiles for this worker process"""
+    return latency_summary()
+
+
+@api_router.get("/metrics/counters")
+async def get_counter_metrics(user_id: str = Depends(get_current_user_id)):
+    """Running counters (e.g. LLM tokens per call site) for this worker process"""
+    return counter_summary()
+
+
+@api_router.get("/metrics/gauges")
+async def get_gauge_metrics(user_id: str = Depends(get_current_user_id)):
+    """Current and peak levels (e.g. password hashing queue depth) for this worker process"""
+    return gauge_summary()
 
 
 # Health check route
@@ -2952,9 +2725,26 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
+outbox_worker = OutboxWorker()
+suggestion_scheduler = SuggestionScheduler()
+
+
+@app.on_event("startup")
+async def startup_event():
+    await ensure_indexes()
+    await load_catalog()
+    await build_content_index()
+    outbox_worker.start()
+    suggestion_scheduler.start()
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    await outbox_worker.stop()
+    await suggestion_scheduler.stop()
+    await llm_gateway.aclose()
     await close_db_connection()
@@ -0,0 +1,55 @@
+"""
+Async single-flight: concurrent calls with the same key share one execution.
+
+The first caller for a key starts the work in its own task; callers that
+arrive while it runs (or within `retention_seconds` after it succeeded) get
+the same result instead of starting another. Cancelling one caller never
+cancels the shared work for the rest. Failures reach every waiter and are
+not retained.
+"""
+import asyncio
+import hashlib
+import json
+
+from metrics import increment
+
+
+def input_hash(*parts) -> str:
+    """Stable hash of JSON-serializable inputs"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, retention_seconds: float = 0.0):
+        self.retention_seconds = retention_seconds
+        self._flights = {}  # (name, hash) -> asyncio.Task
+
+    def _finish(self, key, task: asyncio.Task):
+        failed = task.cancelled() or task.exception() is not None
+        if failed or self.retention_seconds <= 0:
+            self._forget(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.retention_seconds, self._forget, key, task)
+
+    def _forget(self, key, task: asyncio.Task):
+        # A newer flight may have replaced this one under the same key
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    async def run(self, name: str, parts, fn):
+        """Result of `await fn()`, shared with concurrent calls for the same (name, parts)
+
+        `name` identifies the endpoint (and labels the singleflight.<name>.coalesced
+        counter); `parts` are the inputs that make two calls interchangeable,
+        e.g. (user_id, prompt).
+        """
+        key = (name, input_hash(*parts))
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            increment(f"singleflight.{name}.coalesced")
+        return await asyncio.shield(task)
@@ -0,0 +1,340 @@
+"""
+Precomputed daily activity suggestions.
+
+/mood-logs/suggestions serves the user's entry from the suggestion_cache
+collection when one exists for today, and only generates live on a miss.
+Entries are generated ahead of time:
+
+- in the background right after the user writes today's mood log
+- overnight for every active user, by the in-process SuggestionScheduler
+  (one app worker claims each night's run in scheduled_runs) or from the CLI:
+
+    python suggestions.py --batch [--user USER_ID] [--concurrency N]
+
+Background and batch generation share SUGGESTION_BATCH_CONCURRENCY model
+calls, which leaves the rest of the LLM gateway's budget to interactive
+requests.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from database import (
+    users_collection, mood_logs_collection, suggestion_cache_collection, scheduled_runs_collection
+)
+from llm import llm_gateway
+from metrics import increment, timed
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_BATCH_CONCURRENCY = int(os.getenv("SUGGESTION_BATCH_CONCURRENCY", "2"))
+SUGGESTION_BATCH_HOUR_UTC = int(os.getenv("SUGGESTION_BATCH_HOUR_UTC", "3"))
+SUGGESTION_SCHEDULER_ENABLED = os.getenv("SUGGESTION_SCHEDULER_ENABLED", "1") == "1"
+SUGGESTION_CACHE_TTL_HOURS = 48  # entries are only served on the day they were made for
+ACTIVE_USER_DAYS = 14  # users with a mood log this recent are included in the nightly batch
+
+SUGGESTIONS_SYSTEM_PROMPT = "You are a mental health activity advisor. Provide practical, evidence-based activity suggestions in valid JSON format only."
+
+FALLBACK_SUGGESTIONS = [
+    {
+        "activity": "5-Minute Breathing Exercise",
+        "description": "Practice deep breathing to calm your nervous system",
+        "duration": "5-10 min",
+        "category": "mindfulness",
+        "benefit": "Reduces anxiety and promotes relaxation"
+    },
+    {
+        "activity": "Short Walk Outside",
+        "description": "Take a brief walk in fresh air",
+        "duration": "10-15 min",
+        "category": "physical",
+        "benefit": "Boosts mood and energy levels"
+    },
+    {
+        "activity": "Gratitude Journaling",
+        "description": "Write down 3 things you're grateful for",
+        "duration": "5-10 min",
+        "category": "self-care",
+        "benefit": "Shifts focus to positive aspects"
+    }
+]
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def build_suggestion_prompt(user_doc: dict, today_log: dict, recent_logs: list) -> str:
+    """Prompt for 4-5 activity suggestions from the user's profile and recent logs"""
+    context = "USER PROFILE:\n"
+    context += f"Conditions: {', '.join(user_doc.get('conditions', ['general']))}\n\n"
+
+    if today_log:
+        context += "TODAY'S MOOD LOG:\n"
+        context += f"- Mood Rating: {today_log.get('mood_rating')}/10\n"
+        context += f"- Mood Tag: {today_log.get('mood_tag', 'Not specified')}\n"
+
+        symptoms = today_log.get('symptoms', {})
+        if symptoms:
+            active_symptoms = [k.replace('_', ' ') for k, v in symptoms.items() if v]
+            if active_symptoms:
+                context += f"- Symptoms: {', '.join(active_symptoms)}\n"
+
+        if today_log.get('notes'):
+            context += f"- Notes: {today_log.get('notes')[:100]}\n"
+
+        context += f"- Sleep: {today_log.get('sleep_hours', 'Not logged')} hours\n"
+        context += f"- Medication: {'Taken' if today_log.get('medication_taken') else 'Not taken'}\n\n"
+
+    if recent_logs and len(recent_logs) > 1:
+        mood_ratings = [log['mood_rating'] for log in recent_logs]
+        avg_mood = sum(mood_ratings) / len(mood_ratings)
+        context += "RECENT TREND (Last 7 days):\n"
+        context += f"- Average mood: {avg_mood:.1f}/10\n"
+        context += f"- Recent ratings: {', '.join(map(str, mood_ratings[:5]))}\n\n"
+
+    return f"""{context}
+Based on this user's current mood state and mental health conditions, provide 4-5 specific, actionable activity suggestions that could help improve or manage their mood.
+
+REQUIREMENTS:
+1. Make suggestions specific to their conditions ({', '.join(user_doc.get('conditions', []))})
+2. Consider their current mood level
+3. Include a mix of quick (5-10 min) and longer activities
+4. Be practical and realistic
+5. Include activities from different categories: physical, mindfulness, social, creative, self-care
+
+FORMAT YOUR RESPONSE AS A JSON ARRAY (no markdown, just raw JSON):
+[
+  {{
+    "activity": "Short activity name (4-6 words)",
+    "description": "Brief description (1 sentence, max 100 chars)",
+    "duration": "5-10 min" or "15-30 min" or "30+ min",
+    "category": "physical" or "mindfulness" or "social" or "creative" or "self-care",
+    "benefit": "How it helps (1 sentence, max 80 chars)"
+  }}
+]
+
+Provide exactly 4-5 suggestions in valid JSON format."""
+
+
+# ============= CACHE =============
+
+async def cached_suggestions(user_id: str):
+    """Today's precomputed suggestions for the user, or None"""
+    doc = await suggestion_cache_collection.find_one({
+        "_id": user_id,
+        "date": _today(),
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    })
+    if not doc:
+        increment("suggestions.cache_miss")
+        return None
+    increment("suggestions.cache_hit")
+    return {
+        "suggestions": doc['suggestions'],
+        "based_on_mood": doc.get('based_on_mood'),
+        "generated_at": doc['generated_at']
+    }
+
+
+async def store_suggestions(user_id: str, date: str, result: dict):
+    now = datetime.now(timezone.utc)
+    await suggestion_cache_collection.update_one(
+        {"_id": user_id},
+        {"$set": {
+            "date": date,
+            "suggestions": result['suggestions'],
+            "based_on_mood": result['based_on_mood'],
+            "generated_at": result['generated_at'],
+            "expires_at": now + timedelta(hours=SUGGESTION_CACHE_TTL_HOURS)
+        }},
+        upsert=True
+    )
+
+
+async def invalidate_suggestions(user_id: str):
+    await suggestion_cache_collection.delete_one({"_id": user_id})
+
+
+# ============= GENERATION =============
+
+_flights = SingleFlight()
+
+
+async def _generate(user_id: str, today: str, today_log: dict, prompt: str) -> dict:
+    ai_response = await llm_gateway.complete(
+        "mood_suggestions",
+        system_message=SUGGESTIONS_SYSTEM_PROMPT,
+        text=prompt,
+        session_id=f"suggestions_{user_id}"
+    )
+    result = {
+        "based_on_mood": today_log.get('mood_rating') if today_log else None,
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+    # Try to extract JSON from response (in case AI adds markdown)
+    json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
+    try:
+        result["suggestions"] = json.loads(json_match.group(0) if json_match else ai_response)
+    except json.JSONDecodeError:
+        logger.error(f"Failed to parse AI suggestions: {ai_response[:200]}")
+        # Fallback suggestions are returned but never cached
+        return {"suggestions": FALLBACK_SUGGESTIONS, **result}
+
+    await store_suggestions(user_id, today, result)
+    return result
+
+
+async def generate_suggestions(user_doc: dict) -> dict:
+    """Generate and cache today's suggestions; concurrent calls with the same inputs share one model call"""
+    user_id = user_doc['id']
+    today = _today()
+    start_date = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%d")
+    recent_logs = await mood_logs_collection.find(
+        {"user_id": user_id, "date": {"$gte": start_date}},
+        {"_id": 0}
+    ).sort("date", -1).limit(7).to_list(7)
+    today_log = recent_logs[0] if recent_logs and recent_logs[0].get('date') == today else None
+    prompt = build_suggestion_prompt(user_doc, today_log, recent_logs)
+
+    # Keyed on the prompt, so a refresh after a new log never joins a generation from before it
+    return await _flights.run(
+        "mood_suggestions", (user_id, prompt), lambda: _generate(user_id, today, today_log, prompt)
+    )
+
+
+_budget = asyncio.Semaphore(SUGGESTION_BATCH_CONCURRENCY)
+_background = set()
+
+
+async def _refresh(user_id: str, budget: asyncio.Semaphore = None) -> bool:
+    async with budget or _budget:
+        user_doc = await users_collection.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        if not user_doc:
+            return False
+        try:
+            result = await generate_suggestions(user_doc)
+        except Exception as e:
+            logger.error(f"Suggestion generation failed for user {user_id}: {e}")
+            return False
+    return result['suggestions'] is not FALLBACK_SUGGESTIONS
+
+
+def refresh_in_background(user_id: str):
+    """Regenerate the user's suggestions without holding up the caller"""
+    if not llm_gateway.configured:
+        return
+    task = asyncio.create_task(_refresh(user_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def active_user_ids() -> list:
+    since = (datetime.now(timezone.utc) - timedelta(days=ACTIVE_USER_DAYS)).strftime("%Y-%m-%d")
+    return await mood_logs_collection.distinct("user_id", {"date": {"$gte": since}})
+
+
+async def run_batch(user_ids: list = None, concurrency: int = None) -> dict:
+    """Generate today's suggestions for every active user (or `user_ids`) lacking them"""
+    # A batch-specific limit gets its own semaphore; background refreshes keep using _budget
+    budget = asyncio.Semaphore(concurrency) if concurrency else _budget
+    if user_ids is None:
+        user_ids = await active_user_ids()
+
+    already_cached = set(await suggestion_cache_collection.distinct(
+        "_id", {"_id": {"$in": user_ids}, "date": _today()}
+    ))
+    pending = [user_id for user_id in user_ids if user_id not in already_cached]
+
+    async with timed("suggestions.batch"):
+        outcomes = await asyncio.gather(*[_refresh(user_id, budget) for user_id in pending])
+    summary = {
+        "users": len(user_ids),
+        "skipped": len(already_cached),
+        "generated": sum(outcomes),
+        "failed": len(outcomes) - sum(outcomes)
+    }
+    logger.info(f"Suggestion batch finished: {summary}")
+    return summary
+
+
+# ============= SCHEDULER =============
+
+def seconds_until(hour_utc: int, now: datetime = None) -> float:
+    """Seconds from now until the next hour_utc:00 UTC"""
+    now = now or datetime.now(timezone.utc)
+    run_at = now.replace(hour=hour_utc, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+async def claim_nightly_run(date: str) -> bool:
+    """True for exactly one caller per date across all app workers"""
+    try:
+        await scheduled_runs_collection.insert_one({
+            "_id": f"suggestions:{date}",
+            "claimed_at": datetime.now(timezone.utc),
+            "expires_at": datetime.now(timezone.utc) + timedelta(hours=SUGGESTION_CACHE_TTL_HOURS)
+        })
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+class SuggestionScheduler:
+    """Runs the batch once a day at SUGGESTION_BATCH_HOUR_UTC inside the app process"""
+
+    def __init__(self, hour_utc: int = SUGGESTION_BATCH_HOUR_UTC):
+        self.hour_utc = hour_utc
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(seconds_until(self.hour_utc))
+            try:
+                if llm_gateway.configured and await claim_nightly_run(_today()):
+                    await run_batch()
+            except Exception as e:
+                logger.error(f"Nightly suggestion batch failed: {e}")
+
+    def start(self):
+        if SUGGESTION_SCHEDULER_ENABLED:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Scheduled daily suggestion batch at {self.hour_utc:02d}:00 UTC")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+async def main(argv):
+    if "--batch" not in argv:
+        print(__doc__)
+        return
+    if not llm_gateway.configured:
+        print("❌ AI service not configured")
+        return
+    user_ids = [argv[argv.index("--user") + 1]] if "--user" in argv else None
+    concurrency = int(argv[argv.index("--concurrency") + 1]) if "--concurrency" in argv else None
+    try:
+        summary = await run_batch(user_ids, concurrency)
+    finally:
+        await llm_gateway.aclose()
+    print(f"✅ Generated suggestions for {summary['generated']} users "
+          f"({summary['skipped']} already cached, {summary['failed']} failed)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,138 @@
+"""
+Shared setup for the backend unit tests
+Puts backend/ on the import path, sets the env vars database.py reads at
+import time, and provides an in-memory stand-in for a Motor collection.
+"""
+import copy
+import os
+import sys
+
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+OPERATORS = {
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$ne": lambda value, operand: value != operand,
+}
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """Whether `doc` satisfies a Mongo filter using equality, dotted paths, $and/$or and OPERATORS"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif field == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(key in OPERATORS for key in condition):
+            value = _get(doc, field)
+            if not all(OPERATORS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif _get(doc, field) != condition:
+            return False
+    return True
+
+
+def apply_update(doc: dict, update: dict):
+    doc.update(update.get("$set", {}))
+    for field, amount in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + amount
+    for field in update.get("$unset", {}):
+        doc.pop(field, None)
+
+
+def _sorted(docs: list, sort: list) -> list:
+    for field, direction in reversed(sort):
+        docs = sorted(docs, key=lambda doc: _get(doc, field), reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: list):
+        self.docs = docs
+
+    def sort(self, key, direction=None):
+        self.docs = _sorted(self.docs, key if direction is None else [(key, direction)])
+        return self
+
+    def limit(self, count: int):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the unit tests; counts reads in `queries`
+
+    `docs` holds the stored documents themselves, so tests can inspect or
+    change them; reads return copies. Fields named in `unique` reject a
+    second document with the same non-empty value.
+    """
+
+    def __init__(self, docs: list = None, unique: tuple = ()):
+        self.docs = docs if docs is not None else []
+        self.unique = unique
+        self.queries = 0
+
+    def matching(self, query: dict) -> list:
+        """The stored documents that match `query` (not copies)"""
+        return [doc for doc in self.docs if matches(doc, query)]
+
+    async def insert_one(self, doc: dict):
+        for field in self.unique:
+            if doc.get(field) and any(stored.get(field) == doc[field] for stored in self.docs):
+                raise DuplicateKeyError(f"{field} already exists")
+        self.docs.append(copy.deepcopy(doc))
+
+    def find(self, query: dict = None, projection: dict = None) -> FakeCursor:
+        self.queries += 1
+        return FakeCursor([copy.deepcopy(doc) for doc in self.matching(query or {})])
+
+    async def find_one(self, query: dict = None, projection: dict = None):
+        self.queries += 1
+        found = self.matching(query or {})
+        return copy.deepcopy(found[0]) if found else None
+
+    async def find_one_and_update(self, query: dict, update: dict, sort: list = None,
+                                  projection: dict = None, return_document: bool = False):
+        found = _sorted(self.matching(query), sort or [])
+        if not found:
+            return None
+        before = copy.deepcopy(found[0])
+        apply_update(found[0], update)
+        return copy.deepcopy(found[0]) if return_document else before
+
+    async def update_one(self, query: dict, update: dict):
+        found = self.matching(query)
+        if found:
+            apply_update(found[0], update)
+
+    async def update_many(self, query: dict, update: dict):
+        for doc in self.matching(query):
+            apply_update(doc, update)
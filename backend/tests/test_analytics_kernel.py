@@ -0,0 +1,107 @@
+"""
+Unit tests for the NumPy analytics fallback
+Tests: Summary buckets, run lengths, symptom presence, the advanced endpoint when the pipeline fails
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo.errors import OperationFailure
+
+import server
+from analytics import MoodFrame, build_advanced_analytics, frame_summary, longest_run
+from conftest import FakeCollection
+
+LOGS = [
+    # 2024-03-04 is a Monday; listed out of order on purpose
+    {"date": "2024-03-06", "mood_rating": 2, "sleep_hours": 7.0, "medication_taken": False, "symptoms": {"anxiety": True}},
+    {"date": "2024-03-04", "mood_rating": 8, "sleep_hours": 4.5, "medication_taken": True, "symptoms": {"fatigue": False}},
+    {"date": "2024-03-05", "mood_rating": 3, "sleep_hours": None, "symptoms": {"anxiety": True, "fatigue": True}},
+    {"date": "2024-03-11", "mood_rating": 4, "sleep_hours": 8.5, "medication_taken": True},
+    {"date": "not-a-date", "mood_rating": 9, "sleep_hours": 0},
+]
+
+
+def by_id(buckets: list) -> dict:
+    return {bucket["_id"]: bucket for bucket in buckets}
+
+
+def test_longest_run():
+    assert longest_run(np.array([], dtype=bool)) == 0
+    assert longest_run(np.array([True, True, False, True, True, True])) == 3
+
+
+def test_frame_summary_buckets():
+    summary = frame_summary(MoodFrame(LOGS))
+
+    # Oldest date first, so the low streak runs 03-05, 03-06, 03-11
+    assert summary["overall"] == [{"total": 5, "mood_sum": 26, "mood_sq_sum": 174, "max_low_streak": 3}]
+
+    # The unparseable date counts overall but has no weekday
+    assert by_id(summary["day_of_week"]) == {
+        0: {"_id": 0, "sum": 12, "count": 2, "min": 4, "max": 8},
+        1: {"_id": 1, "sum": 3, "count": 1, "min": 3, "max": 3},
+        2: {"_id": 2, "sum": 2, "count": 1, "min": 2, "max": 2},
+    }
+    assert by_id(summary["distribution"]) == {r: {"_id": r, "count": 1} for r in (2, 3, 4, 8, 9)}
+
+    # Missing and zero sleep are "not logged"; range upper bounds are exclusive
+    assert by_id(summary["sleep"]) == {
+        "less_than_5": {"_id": "less_than_5", "sum": 8, "count": 1},
+        "7_to_8": {"_id": "7_to_8", "sum": 2, "count": 1},
+        "more_than_8": {"_id": "more_than_8", "sum": 4, "count": 1},
+    }
+    assert by_id(summary["medication"]) == {
+        True: {"_id": True, "sum": 12, "count": 2},
+        False: {"_id": False, "sum": 14, "count": 3},
+    }
+
+
+def test_frame_summary_symptoms_skip_logs_without_them():
+    symptoms = frame_summary(MoodFrame(LOGS))["symptoms"]
+    # First appearance in date order: fatigue on 03-04, anxiety on 03-05
+    assert [s["_id"] for s in symptoms] == ["fatigue", "anxiety"]
+    fatigue, anxiety = symptoms
+    assert (fatigue["with_sum"], fatigue["with_count"], fatigue["without_sum"], fatigue["without_count"]) == (3, 1, 8, 1)
+    assert (anxiety["with_sum"], anxiety["with_count"], anxiety["without_count"]) == (5, 2, 0)
+
+
+def test_advanced_analytics_from_frame():
+    result = build_advanced_analytics(frame_summary(MoodFrame(LOGS)))
+    assert {p["pattern"] for p in result["patterns"]} == {"low_mood_streak"}
+    assert result["medication_impact"]["difference"] == round(12 / 2 - 14 / 3, 1)
+    assert result["mood_distribution"][1] == {"rating": 2, "count": 1, "percentage": 20.0}
+
+
+class FailingPipelineLogs(FakeCollection):
+    """mood_logs stand-in for a server that can't run the $facet pipeline"""
+
+    def aggregate(self, pipeline):
+        raise OperationFailure("Unrecognized expression '$isoDayOfWeek'")
+
+    def find(self, query=None, projection=None):
+        self.find_args = (query, projection)
+        return super().find(query, projection)
+
+
+def test_advanced_endpoint_falls_back_to_the_kernel(monkeypatch):
+    today = datetime.now(timezone.utc).date()
+    docs = [
+        {"user_id": "u1", "date": (today - timedelta(days=i)).isoformat(), "mood_rating": rating}
+        for i, rating in enumerate([2, 3, 4, 9, 9, 9, 9, 9])
+    ]
+    docs.append({"user_id": "u1", "date": (today - timedelta(days=60)).isoformat(), "mood_rating": 1})  # outside the window
+    docs.append({"user_id": "u2", "date": today.isoformat(), "mood_rating": 1})  # someone else's
+    logs = FailingPipelineLogs(docs)
+    monkeypatch.setattr(server, "mood_logs_collection", logs)
+
+    result = asyncio.run(server.get_advanced_analytics(days=30, user_id="u1"))
+    assert sum(d["count"] for d in result["mood_distribution"]) == 8
+    assert {p["pattern"] for p in result["patterns"]} >= {"low_mood_streak"}
+    assert logs.find_args[0]["user_id"] == "u1"
+
+
+def test_advanced_endpoint_without_logs(monkeypatch):
+    monkeypatch.setattr(server, "mood_logs_collection", FailingPipelineLogs([]))
+    result = asyncio.run(server.get_advanced_analytics(days=30, user_id="u1"))
+    assert result["patterns"] == [] and result["mood_distribution"] == []
@@ -0,0 +1,82 @@
+"""
+Unit tests for the caregiver relationship cache
+Tests: Cached hits and misses, invalidation, TTL expiry, alert caregiver lookup
+"""
+import asyncio
+
+import pytest
+
+import caregiver_access
+from conftest import FakeCollection
+from caregiver_access import alert_relationships, invalidate_relationship, load_relationship
+
+
+@pytest.fixture
+def relationships(monkeypatch):
+    collection = FakeCollection([
+        {"id": "r1", "patient_id": "p1", "caregiver_id": "c1", "permissions": {"view_mood_logs": True, "receive_alerts": True}},
+        {"id": "r2", "patient_id": "p1", "caregiver_id": "c2", "permissions": {"receive_alerts": False}},
+    ])
+    monkeypatch.setattr(caregiver_access, "caregiver_relationships_collection", collection)
+    caregiver_access._relationships.clear()
+    caregiver_access._alert_relationships.clear()
+    return collection
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_repeat_lookups_are_served_from_cache(relationships):
+    first = run(load_relationship("c1", "p1"))
+    first["permissions"]["view_mood_logs"] = False  # callers get copies
+    second = run(load_relationship("c1", "p1"))
+    assert second["permissions"]["view_mood_logs"] is True
+    assert relationships.queries == 1
+
+
+def test_missing_relationship_is_cached(relationships):
+    assert run(load_relationship("c3", "p1")) is None
+    assert run(load_relationship("c3", "p1")) is None
+    assert relationships.queries == 1
+
+
+def test_invalidation_rereads(relationships):
+    run(load_relationship("c1", "p1"))
+    relationships.docs[0]["permissions"] = {"view_mood_logs": False}
+    invalidate_relationship("c1", "p1")
+    assert run(load_relationship("c1", "p1"))["permissions"] == {"view_mood_logs": False}
+    assert relationships.queries == 2
+
+
+def test_entries_expire(relationships, monkeypatch):
+    monkeypatch.setattr(caregiver_access, "CAREGIVER_ACCESS_TTL_SECONDS", 0)
+    run(load_relationship("c1", "p1"))
+    run(load_relationship("c1", "p1"))
+    assert relationships.queries == 2
+
+
+def test_alert_caregivers_are_invalidated_with_any_relationship(relationships):
+    assert [r["caregiver_id"] for r in run(alert_relationships("p1"))] == ["c1"]
+    run(alert_relationships("p1"))
+    assert relationships.queries == 1
+    relationships.docs[1]["permissions"]["receive_alerts"] = True
+    invalidate_relationship("c2", "p1")
+    assert [r["caregiver_id"] for r in run(alert_relationships("p1"))] == ["c1", "c2"]
+
+
+def test_lookup_racing_an_invalidation_is_not_cached(relationships):
+    read = relationships.find_one
+
+    async def revoke_during_read(query, projection=None):
+        before = await read(query, projection)
+        relationships.docs[0]["permissions"] = {"view_mood_logs": False}
+        invalidate_relationship("c1", "p1")
+        return before
+
+    relationships.find_one = revoke_during_read
+    stale = run(load_relationship("c1", "p1"))
+    relationships.find_one = read
+    assert stale["permissions"]["view_mood_logs"] is True  # the read saw the old state...
+    assert run(load_relationship("c1", "p1"))["permissions"] == {"view_mood_logs": False}  # ...but didn't cache it
+    assert relationships.queries == 2
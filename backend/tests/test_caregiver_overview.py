@@ -0,0 +1,92 @@
+"""
+Unit tests for the caregiver multi-patient overview
+Tests: Patient summaries and concerns, permitted/unpermitted patients, patients without logs
+"""
+
+from mood_stats import log_delta, summarize_stats
+from server import build_patient_overview, patient_summary
+
+
+def day(bucket, count=1, mood_sum=5, low_mood_count=0, medication_count=1, medication_missed_count=0,
+        symptoms=None):
+    return {
+        "period": "day", "bucket": bucket, "count": count, "mood_sum": mood_sum,
+        "low_mood_count": low_mood_count, "medication_count": medication_count,
+        "medication_missed_count": medication_missed_count, "symptoms": symptoms or {}
+    }
+
+
+def relationship(patient_id, view_analytics=True):
+    return {"id": f"rel-{patient_id}", "patient_id": patient_id, "permissions": {"view_analytics": view_analytics}}
+
+
+def test_summary_without_logs():
+    summary = patient_summary(summarize_stats([]), [])
+    assert summary["total_logs"] == 0
+    assert summary["average_mood"] == 0.0
+    assert summary["recent_concerns"] == []
+    assert summary["insights"] == ["No mood logs in this period."]
+
+
+def test_summary_averages_trend_and_symptoms():
+    buckets = [
+        day("2024-03-01", mood_sum=2, symptoms={"anxiety": 1}),
+        day("2024-03-02", mood_sum=3, symptoms={"anxiety": 1, "fatigue": 1}),
+        day("2024-03-03", mood_sum=8),
+        day("2024-03-04", mood_sum=9),
+    ]
+    summary = patient_summary(summarize_stats(buckets), [])
+    assert summary["total_logs"] == 4
+    assert summary["average_mood"] == 5.5
+    assert summary["mood_trend"] == "improving"
+    assert summary["most_common_symptoms"] == [{"symptom": "anxiety", "count": 2}, {"symptom": "fatigue", "count": 1}]
+
+
+def test_summary_concerns_from_recent_days():
+    recent = [day(f"2024-03-0{i}", low_mood_count=1, medication_count=0, medication_missed_count=1) for i in range(1, 4)]
+    concerns = patient_summary(summarize_stats(recent), recent)["recent_concerns"]
+    assert [(c["type"], c["severity"]) for c in concerns] == [("low_mood", "high"), ("medication", "medium")]
+
+    calm = [day("2024-03-01")]
+    assert patient_summary(summarize_stats(calm), calm)["recent_concerns"] == []
+
+    # Logs that don't track medication are not missed doses
+    untracked = [day(f"2024-03-0{i}", medication_count=0) for i in range(1, 8)]
+    assert patient_summary(summarize_stats(untracked), untracked)["recent_concerns"] == []
+
+
+def test_missed_medication_needs_the_field():
+    log = {"mood_rating": 6}
+    assert log_delta({**log, "medication_taken": False})["medication_missed_count"] == 1
+    assert log_delta({**log, "medication_taken": True})["medication_missed_count"] == 0
+    assert log_delta(log)["medication_missed_count"] == 0
+
+
+def test_overview_entries_follow_relationships_and_permissions():
+    relationships = [relationship("p1"), relationship("p2", view_analytics=False), relationship("p3")]
+    names = {"p1": "Ada", "p2": "Bo"}
+    buckets = {"p1": [day("2024-03-01", mood_sum=6), day("2024-03-02", mood_sum=8)]}
+    recent_days = {"p1": [day("2024-03-02"), day("2024-03-01")]}
+    last_log_dates = {"p1": "2024-03-02"}
+
+    overview = build_patient_overview(relationships, names, buckets, recent_days, last_log_dates)
+    assert [entry["patient_id"] for entry in overview] == ["p1", "p2", "p3"]
+
+    permitted, unpermitted, no_logs = overview
+    assert permitted["patient_name"] == "Ada" and permitted["relationship_id"] == "rel-p1"
+    assert permitted["analytics"]["average_mood"] == 7.0
+    assert permitted["analytics"]["last_log_date"] == "2024-03-02"
+
+    assert unpermitted["patient_name"] == "Bo"
+    assert unpermitted["analytics"] is None
+
+    assert no_logs["patient_name"] == "Unknown"
+    assert no_logs["analytics"]["total_logs"] == 0
+    assert no_logs["analytics"]["last_log_date"] is None
+
+
+def test_quiet_patient_keeps_last_log_date():
+    # No logs in the period or the recent-days horizon, but logged once long ago
+    (entry,) = build_patient_overview([relationship("p1")], {"p1": "Ada"}, {}, {}, {"p1": "2023-01-15"})
+    assert entry["analytics"]["total_logs"] == 0
+    assert entry["analytics"]["last_log_date"] == "2023-01-15"
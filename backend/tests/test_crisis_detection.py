@@ -0,0 +1,102 @@
+"""
+Unit tests for crisis keyword detection
+Tests: Recall over the full lexicon, severity precedence, normalization, false positives, hot reload
+"""
+import json
+import os
+
+import pytest
+
+from crisis import CrisisMatcher, LEXICON_PATH, LEVELS, _ReloadingMatcher
+
+with open(LEXICON_PATH, encoding="utf-8") as f:
+    LEXICON = json.load(f)
+
+# (message, expected level) — real-world phrasings that must keep being detected
+CORPUS = [
+    ("I want to die", "critical"),
+    ("Honestly everyone would be better off dead without me", "critical"),
+    ("I took an overdose last night", "critical"),
+    ("I overdosed on my pills", "critical"),
+    ("I DON'T WANT TO LIVE ANYMORE", "critical"),
+    ("I don’t want to live", "critical"),
+    ("thinking about suicide again", "critical"),
+    ("I'm going to end   it all", "critical"),
+    ("I feel hopeless and I can't go on", "high"),
+    ("I can’t take it anymore", "high"),
+    ("I keep cutting myself", "high"),
+    ("thinking about self-harm", "high"),
+    ("I'm a burden to everyone", "high"),
+    ("I feel so worthless", "high"),
+    ("I'm really anxious about tomorrow", "moderate"),
+    ("had a panic attack at work", "moderate"),
+    ("I can't stop crying all day", "moderate"),
+    ("I feel empty inside", "moderate"),
+    ("I'm depressed but hopeless is too strong a word", "high"),
+    ("Had a good day, went for a walk", None),
+    ("I almost finished my project", None),
+    ("", None),
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return CrisisMatcher(LEXICON)
+
+
+class TestCrisisRecall:
+    """Every lexicon phrase is detected at its own level"""
+
+    @pytest.mark.parametrize("level", LEVELS)
+    def test_every_phrase_detected(self, matcher, level):
+        for phrase in LEXICON[level]:
+            result = matcher.match(f"Lately {phrase.upper()} is how I feel.")
+            assert result.level == level, f"'{phrase}' detected as {result.level}, expected {level}"
+            assert phrase in result.phrases
+
+    @pytest.mark.parametrize("message,expected", CORPUS)
+    def test_corpus(self, matcher, message, expected):
+        assert matcher.match(message).level == expected
+
+
+class TestCrisisMatching:
+    """Severity precedence and match boundaries"""
+
+    def test_most_severe_level_wins(self, matcher):
+        result = matcher.match("I'm anxious and overwhelmed and I want to die")
+        assert result.level == "critical"
+        assert result.phrases == ["anxious", "overwhelmed", "want to die"]
+
+    def test_overlapping_phrases_reported(self, matcher):
+        result = matcher.match("I can't stop crying all day")
+        assert result.phrases == ["can't stop crying", "crying all day"]
+
+    def test_no_match_inside_words(self):
+        matcher = CrisisMatcher({"moderate": ["lost"]})
+        assert matcher.match("I almost lost it").phrases == ["lost"]
+        assert matcher.match("recovering from colostomy surgery").level is None
+
+
+class TestLexiconReload:
+    """The lexicon file is re-read when it changes"""
+
+    def test_reload_on_change(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("crisis.RELOAD_CHECK_SECONDS", 0)
+        path = tmp_path / "lexicon.json"
+        path.write_text(json.dumps({"moderate": ["stressed"]}))
+        reloading = _ReloadingMatcher(path)
+        assert reloading.match("so stressed").level == "moderate"
+
+        path.write_text(json.dumps({"critical": ["stressed"]}))
+        os.utime(path, (0, path.stat().st_mtime + 10))
+        assert reloading.match("so stressed").level == "critical"
+
+    def test_bad_file_keeps_last_lexicon(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("crisis.RELOAD_CHECK_SECONDS", 0)
+        path = tmp_path / "lexicon.json"
+        path.write_text(json.dumps({"high": ["hopeless"]}))
+        reloading = _ReloadingMatcher(path)
+
+        path.write_text("{not json")
+        os.utime(path, (0, path.stat().st_mtime + 10))
+        assert reloading.match("hopeless").level == "high"
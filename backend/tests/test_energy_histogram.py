@@ -0,0 +1,52 @@
+"""
+Unit tests for the hour-of-day energy histogram
+Tests: Log and session deltas, reversals, summing the last N days
+"""
+from datetime import date, datetime, timezone
+
+from energy_histogram import _merge, hour_histogram, log_delta, session_delta
+
+MORNING = datetime(2024, 3, 10, 9, 30, tzinfo=timezone.utc)
+
+
+def test_log_delta_buckets_by_timestamp_hour():
+    assert log_delta({"mood_rating": 7, "timestamp": MORNING}) == {
+        "days.2024-03-10.logs.9": 1,
+        "days.2024-03-10.energy.9": 5,
+        "days.2024-03-10.mood.9": 7,
+    }
+    assert log_delta({"mood_rating": 7, "timestamp": "2024-03-10T09:30:00+00:00"}) == log_delta(
+        {"mood_rating": 7, "timestamp": MORNING}
+    )
+
+
+def test_imported_logs_are_left_out():
+    imported = {"mood_rating": 7, "timestamp": MORNING, "imported": True}
+    assert log_delta(imported) == {}
+    assert _merge(log_delta(imported, -1), log_delta({**imported, "mood_rating": 3})) == {}
+
+
+def test_mood_update_only_moves_the_mood_sum():
+    old = {"mood_rating": 7, "timestamp": MORNING}
+    new = {**old, "mood_rating": 4}
+    assert _merge(log_delta(old, -1), log_delta(new, 1)) == {"days.2024-03-10.mood.9": -3}
+
+
+def test_only_completed_high_focus_sessions_count():
+    session = {"status": "completed", "focus_rating": 8, "created_at": MORNING, "started_at": MORNING}
+    assert session_delta(session) == {"days.2024-03-10.focus.9": 1}
+    assert session_delta({**session, "focus_rating": 6}) == {}
+    assert session_delta({**session, "status": "abandoned"}) == {}
+    assert session_delta(None) == {}
+
+
+def test_hour_histogram_sums_days_in_range():
+    histogram = {"days": {
+        "2024-03-01": {"logs": {"9": 1}, "energy": {"9": 5}, "mood": {"9": 2}},
+        "2024-03-09": {"logs": {"9": 1}, "energy": {"9": 5}, "mood": {"9": 8}, "focus": {"14": 2}},
+        "2024-03-10": {"logs": {"9": 1, "21": 1}, "energy": {"9": 5, "21": 5}, "mood": {"9": 6, "21": 3}},
+    }}
+    energy, mood, logs, focus = hour_histogram(histogram, 7, date(2024, 3, 10))
+    assert logs[9] == 2 and logs[21] == 1 and logs.sum() == 3
+    assert mood[9] == 14 and energy[21] == 5
+    assert focus[14] == 2 and focus.sum() == 2
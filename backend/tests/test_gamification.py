@@ -0,0 +1,71 @@
+"""
+Unit tests for the materialized rewards state
+Tests: Streak transitions, per-day window, reversals, stats derived from state
+"""
+from datetime import date
+
+from gamification import apply_change, empty_state, reward_stats, task_contribution
+
+
+def complete_task(state, today):
+    return apply_change(state, {"tasks_completed": 1}, today, [(today, "tasks", 1)])
+
+
+def test_consecutive_days_extend_the_streak():
+    state = empty_state("u")
+    for today in ("2024-03-01", "2024-03-02", "2024-03-02", "2024-03-03"):
+        state = complete_task(state, today)
+    assert state["streak"] == 3
+    assert state["last_activity_date"] == "2024-03-03"
+    assert state["tasks_completed"] == 4
+    assert state["xp"] == 40 and state["level"] == 1
+
+
+def test_gap_restarts_the_streak():
+    state = complete_task(complete_task(empty_state("u"), "2024-03-01"), "2024-03-02")
+    state = complete_task(state, "2024-03-05")
+    assert state["streak"] == 1
+
+
+def test_reversal_does_not_count_as_activity():
+    state = complete_task(empty_state("u"), "2024-03-01")
+    state = apply_change(state, {"tasks_completed": -1}, "2024-03-02", [("2024-03-01", "tasks", -1)])
+    assert state["tasks_completed"] == 0
+    assert state["last_activity_date"] == "2024-03-01"
+    assert state["days"]["2024-03-01"]["tasks"] == 0
+
+
+def test_old_days_fall_out_of_the_window():
+    state = complete_task(empty_state("u"), "2024-03-01")
+    state = complete_task(state, "2024-03-20")
+    assert list(state["days"]) == ["2024-03-20"]
+
+
+def test_stats_streak_expires_after_a_missed_day():
+    state = complete_task(empty_state("u"), "2024-03-01")
+    assert reward_stats(state, date(2024, 3, 2))["current_streak"] == 1
+    assert reward_stats(state, date(2024, 3, 3))["current_streak"] == 0
+
+
+def test_stats_weekly_counts_and_badges():
+    state = empty_state("u")
+    for day in ("2024-03-01", "2024-03-04", "2024-03-05", "2024-03-06"):
+        state = complete_task(state, day)
+    stats = reward_stats(state, date(2024, 3, 8))
+    assert stats["weekly_tasks"] == 3
+    assert stats["current_streak"] == 0
+    assert [badge["id"] for badge in stats["badges"]] == ["first_task"]
+
+
+def test_task_contribution():
+    task = {"status": "in_progress", "chunks": [{"is_completed": True}, {"is_completed": False}]}
+    assert task_contribution(task) == {"tasks_completed": 0, "chunks_completed": 0}
+    assert task_contribution({**task, "status": "completed"}) == {"tasks_completed": 1, "chunks_completed": 1}
+    assert task_contribution(None) == {"tasks_completed": 0, "chunks_completed": 0}
+
+
+def test_chunk_toggle_does_not_extend_the_streak():
+    state = complete_task(empty_state("u"), "2024-03-01")
+    state = apply_change(state, {"chunks_completed": 1}, "2024-03-02")
+    assert state["chunks_completed"] == 1 and state["xp"] == 12
+    assert state["streak"] == 1 and state["last_activity_date"] == "2024-03-01"
@@ -0,0 +1,107 @@
+"""
+Unit tests for the LLM gateway
+Tests: Retrying only transient errors, concurrency slots during backoff and slow stream readers
+"""
+import asyncio
+
+import httpx
+import pytest
+
+import llm
+from llm import LLMGateway, StubBackend, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyBackend(StubBackend):
+    """Raises the queued errors on the first calls, then replies"""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    async def complete(self, system_message, text, session_id):
+        if self.errors:
+            self.calls.append(text)
+            raise self.errors.pop(0)
+        return await super().complete(system_message, text, session_id)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(llm, "RETRY_BASE_SECONDS", 0.05)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_transient_errors_are_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(401)) and not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_transient_failure_is_retried():
+    gateway = LLMGateway(FlakyBackend(StatusError(503)), max_retries=2)
+    assert run(gateway.complete("test", "system", "hello")) == "Stub reply to: hello"
+
+
+def test_client_error_is_not_retried():
+    backend = FlakyBackend(StatusError(401), StatusError(401))
+    with pytest.raises(StatusError):
+        run(LLMGateway(backend, max_retries=2).complete("test", "system", "hello"))
+    assert len(backend.calls) == 1
+
+
+def test_backoff_releases_the_concurrency_slot(monkeypatch):
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: high)
+    gateway = LLMGateway(FlakyBackend(StatusError(503)), concurrency=1, max_retries=1)
+    finished = []
+
+    async def call(text):
+        await gateway.complete("test", "system", text)
+        finished.append(text)
+
+    async def main():
+        failing = asyncio.create_task(call("first"))
+        await asyncio.sleep(0)
+        await asyncio.gather(failing, call("second"))
+
+    run(main())
+    assert finished == ["second", "first"]
+
+
+def test_slow_stream_reader_does_not_hold_a_slot():
+    gateway = LLMGateway(StubBackend(), concurrency=1)
+
+    async def main():
+        reader = gateway.stream("test", "system", "a slow reader")
+        first = await reader.__anext__()
+        # The reply has been buffered, so another call gets the only slot
+        reply = await asyncio.wait_for(gateway.complete("test", "system", "hello"), 1)
+        rest = [piece async for piece in reader]
+        return first + "".join(rest), reply
+
+    streamed, reply = run(main())
+    assert streamed.strip() == "Stub reply to: a slow reader"
+    assert reply == "Stub reply to: hello"
+
+
+def test_stream_errors_reach_the_reader():
+    class BrokenStream(StubBackend):
+        async def stream(self, system_message, text, session_id):
+            yield "partial "
+            raise StatusError(502)
+
+    async def main():
+        return [piece async for piece in LLMGateway(BrokenStream()).stream("test", "system", "hi")]
+
+    with pytest.raises(StatusError):
+        run(main())
@@ -0,0 +1,48 @@
+"""
+Unit tests for the ISO string -> BSON date migration
+Tests: Timestamp parsing, top-level and array-element conversion, unparseable values
+"""
+from datetime import datetime, timezone
+
+from migrate_datetimes import converted_fields, parse_timestamp, stored_datetime
+
+
+def test_parse_timestamp_normalizes_to_utc():
+    expected = datetime(2024, 1, 2, 8, 0, tzinfo=timezone.utc)
+    assert parse_timestamp("2024-01-02T10:00:00+02:00") == expected
+    assert parse_timestamp("2024-01-02T08:00:00Z") == expected
+    assert parse_timestamp("2024-01-02T08:00:00") == expected
+
+
+def test_parse_timestamp_rejects_garbage():
+    assert parse_timestamp("not a date") is None
+    assert parse_timestamp(None) is None
+
+
+def test_converted_fields():
+    doc = {
+        "created_at": "2024-01-02T08:00:00+00:00",
+        "completed_at": None,
+        "updated_at": datetime(2024, 1, 3, tzinfo=timezone.utc),
+        "chunks": [{"id": "a", "completed_at": "2024-01-02T09:00:00+00:00"}, {"id": "b", "completed_at": None}],
+    }
+    update = converted_fields(doc, ["created_at", "completed_at", "updated_at", "chunks.completed_at"])
+    assert update == {
+        "created_at": datetime(2024, 1, 2, 8, tzinfo=timezone.utc),
+        "chunks": [
+            {"id": "a", "completed_at": datetime(2024, 1, 2, 9, tzinfo=timezone.utc)},
+            {"id": "b", "completed_at": None},
+        ],
+    }
+
+
+def test_already_converted_document_needs_no_update():
+    doc = {"created_at": datetime(2024, 1, 2, tzinfo=timezone.utc), "chunks": [{"completed_at": None}]}
+    assert converted_fields(doc, ["created_at", "chunks.completed_at"]) == {}
+
+
+def test_stored_datetime_accepts_both_representations():
+    expected = datetime(2024, 1, 2, 8, 0, tzinfo=timezone.utc)
+    assert stored_datetime(expected) == expected
+    assert stored_datetime("2024-01-02T08:00:00+00:00") == expected
+    assert stored_datetime(None) is None
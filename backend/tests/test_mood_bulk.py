@@ -0,0 +1,72 @@
+"""
+Unit tests for streaming mood-log import parsing
+Tests: JSON array and NDJSON bodies split at any byte, per-record errors, malformed bodies
+"""
+import asyncio
+import json
+
+import pytest
+
+from mood_bulk import BulkFormatError, iter_records, validate_record
+
+RECORDS = [
+    {"date": "2024-01-01", "mood_rating": 4, "notes": "café, [brackets] and \"quotes\""},
+    {"date": "2024-01-02", "mood_rating": 7, "symptoms": {"anxiety": True}},
+    {"date": "2024-01-03", "mood_rating": 2},
+]
+
+
+def parse(body: bytes, chunk_size: int = None) -> list:
+    async def chunks():
+        size = chunk_size or len(body) or 1
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    async def collect():
+        return [item async for item in iter_records(chunks())]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, None])
+def test_json_array_split_anywhere(chunk_size):
+    body = json.dumps(RECORDS, ensure_ascii=False).encode()
+    assert parse(body, chunk_size) == [(record, None) for record in RECORDS]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, None])
+def test_ndjson_split_anywhere(chunk_size):
+    body = ("\n".join(json.dumps(record) for record in RECORDS) + "\n\n").encode()
+    assert parse(body, chunk_size) == [(record, None) for record in RECORDS]
+
+
+def test_ndjson_bad_line_is_reported_and_skipped():
+    body = b'{"date": "2024-01-01", "mood_rating": 4}\n{oops\n{"date": "2024-01-02", "mood_rating": 5}'
+    items = parse(body, 4)
+    assert [record for record, _ in items] == [
+        {"date": "2024-01-01", "mood_rating": 4}, None, {"date": "2024-01-02", "mood_rating": 5}
+    ]
+    assert items[1][1].startswith("Malformed JSON")
+
+
+def test_numbers_split_across_chunks_stay_whole():
+    assert parse(b"[12345, 678]", 3) == [(12345, None), (678, None)]
+
+
+def test_empty_bodies():
+    assert parse(b"") == []
+    assert parse(b"  []  ") == []
+
+
+@pytest.mark.parametrize("body", [b"[{\"a\": 1} {\"b\": 2}]", b"[{\"a\": 1}", b"[1,]", b"[1] 2"])
+def test_malformed_array_raises(body):
+    with pytest.raises(BulkFormatError):
+        parse(body, 2)
+
+
+def test_validate_record():
+    log, error = validate_record({"date": "2024-01-01", "mood_rating": 5})
+    assert error is None and log.mood_rating == 5
+    assert validate_record([1])[1] == "Expected a JSON object"
+    assert validate_record({"date": "01/02/2024", "mood_rating": 5})[1] == "date: expected YYYY-MM-DD"
+    assert validate_record({"date": "2024-01-01", "mood_rating": 11})[1].startswith("mood_rating:")
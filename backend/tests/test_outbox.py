@@ -0,0 +1,122 @@
+"""
+Unit tests for the outbound email/push queue
+Tests: Delivery, retry with backoff, dead-lettering, dedup keys, one bad email in a batch
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import outbox
+from conftest import FakeCollection
+from outbox import MAX_ATTEMPTS, FakeTransport, OutboxWorker, crisis_dedup_key, enqueue
+
+START = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def outbound_jobs():
+    """The outbound_jobs collection, with its unique dedup_key index"""
+    return FakeCollection(unique=("dedup_key",))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"value": START}
+    monkeypatch.setattr(outbox, "_now", lambda: now["value"])
+    monkeypatch.setattr(outbox.random, "random", lambda: 0.0)  # no jitter
+    return now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def email(address: str) -> dict:
+    return {"to": [address], "subject": "Crisis Alert"}
+
+
+def test_delivered_jobs_are_marked_sent(clock):
+    jobs, transport = outbound_jobs(), FakeTransport()
+    run(enqueue("email", email("a@example.com"), collection=jobs))
+    run(enqueue("push", {"user_id": "c1", "title": "Alert"}, collection=jobs))
+    assert run(OutboxWorker(jobs, transport).process_once()) == 2
+    assert len(transport.emails) == 1 and len(transport.pushes) == 1
+    assert len(jobs.matching({"status": "sent"})) == 2
+
+
+def test_failure_is_retried_after_backoff(clock):
+    jobs, transport = outbound_jobs(), FakeTransport()
+    worker = OutboxWorker(jobs, transport)
+    run(enqueue("push", {"user_id": "c1", "title": "Alert"}, collection=jobs))
+    transport.fail_next()
+    run(worker.process_once())
+
+    job = jobs.docs[0]
+    assert job["status"] == "pending" and job["attempts"] == 1
+    assert job["next_attempt_at"] == START + timedelta(seconds=outbox.BASE_BACKOFF_SECONDS)
+    assert run(worker.process_once()) == 0  # not due yet
+
+    clock["value"] = job["next_attempt_at"]
+    run(worker.process_once())
+    assert job["status"] == "sent" and len(transport.pushes) == 1
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    assert outbox.backoff_seconds(1) == outbox.BASE_BACKOFF_SECONDS
+    assert outbox.backoff_seconds(3) == outbox.BASE_BACKOFF_SECONDS * 4
+    assert outbox.backoff_seconds(50) == outbox.MAX_BACKOFF_SECONDS
+
+
+def test_job_is_dead_after_max_attempts(clock):
+    jobs, transport = outbound_jobs(), FakeTransport()
+    worker = OutboxWorker(jobs, transport)
+    run(enqueue("push", {"user_id": "c1", "title": "Alert"}, collection=jobs))
+    transport.fail_next(MAX_ATTEMPTS)
+    for _ in range(MAX_ATTEMPTS):
+        run(worker.process_once())
+        clock["value"] += timedelta(seconds=outbox.MAX_BACKOFF_SECONDS)
+
+    job = jobs.docs[0]
+    assert job["status"] == "dead" and job["attempts"] == MAX_ATTEMPTS
+    assert "Simulated transport failure" in job["last_error"]
+    assert run(worker.process_once()) == 0
+
+
+def test_dedup_key_collision_is_skipped(clock):
+    jobs = outbound_jobs()
+    key = crisis_dedup_key("email", "c1", "p1", "high", START)
+    assert run(enqueue("email", email("a@example.com"), key, collection=jobs)) is True
+    assert run(enqueue("email", email("a@example.com"), key, collection=jobs)) is False
+    assert len(jobs.docs) == 1
+
+
+def test_escalation_within_the_window_is_not_deduplicated(clock):
+    jobs = outbound_jobs()
+    assert run(enqueue("email", email("a@example.com"), crisis_dedup_key("email", "c1", "p1", "high"), collection=jobs))
+    assert run(enqueue("email", email("a@example.com"), crisis_dedup_key("email", "c1", "p1", "critical"), collection=jobs))
+    assert len(jobs.docs) == 2
+
+
+def test_dedup_key_changes_between_crisis_windows():
+    later = START + timedelta(seconds=outbox.CRISIS_DEDUP_WINDOW_SECONDS)
+    assert crisis_dedup_key("email", "c1", "p1", "high", START) != crisis_dedup_key("email", "c1", "p1", "high", later)
+    assert crisis_dedup_key("email", "c1", "p1", "high", START) != crisis_dedup_key("push", "c1", "p1", "high", START)
+
+
+def test_one_bad_email_does_not_hold_back_the_batch(clock):
+    jobs, transport = outbound_jobs(), FakeTransport()
+    worker = OutboxWorker(jobs, transport)
+    transport.rejected_recipients.add("bad@example.com")
+    for address in ("a@example.com", "bad@example.com", "b@example.com"):
+        run(enqueue("email", email(address), collection=jobs))
+
+    run(worker.process_once())  # the batch fails and its jobs are requeued to go alone
+    assert all(job["send_alone"] and job["attempts"] <= 1 for job in jobs.docs)
+    while run(worker.process_once()):
+        pass
+
+    assert sorted(e["to"][0] for e in transport.emails) == ["a@example.com", "b@example.com"]
+    assert [job["payload"]["to"] for job in jobs.matching({"status": "sent"})] == [["a@example.com"], ["b@example.com"]]
+    (failed,) = jobs.matching({"status": "pending"})
+    assert failed["payload"]["to"] == ["bad@example.com"] and failed["attempts"] == 1
+    assert "Invalid recipient" in failed["last_error"]
@@ -0,0 +1,44 @@
+"""
+Unit tests for keyset pagination cursors
+Tests: Cursor round trip, malformed cursors, seek filters for mixed sort directions
+"""
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import encode_cursor, decode_cursor, seek_filter
+
+
+def test_cursor_round_trip():
+    values = ["2024-01-05T10:00:00+00:00", "task-1"]
+    assert decode_cursor(encode_cursor(values), 2) == values
+
+
+def test_cursor_round_trips_datetimes():
+    when = datetime(2024, 1, 5, 10, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor([when, "task-1"]), 2) == [when, "task-1"]
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(["????>>>>", "id/with+chars"])
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor!", "e30", encode_cursor(["only-one"])])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, 2)
+    assert exc.value.status_code == 400
+
+
+def test_single_field_seek():
+    assert seek_filter([("date", -1)], ["2024-01-05"]) == {"date": {"$lt": "2024-01-05"}}
+
+
+def test_compound_seek_breaks_ties_on_id():
+    sort = [("created_at", 1), ("id", 1)]
+    assert seek_filter(sort, ["2024-01-05", "b"]) == {"$or": [
+        {"created_at": {"$gt": "2024-01-05"}},
+        {"created_at": "2024-01-05", "id": {"$gt": "b"}},
+    ]}
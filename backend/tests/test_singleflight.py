@@ -0,0 +1,99 @@
+"""
+Unit tests for single-flight request coalescing
+Tests: Shared execution, distinct keys, retention window, failures, caller cancellation
+"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+class CountingCall:
+    def __init__(self, delay: float = 0.05, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return f"reply {self.calls}"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    async def scenario():
+        flights = SingleFlight()
+        call = CountingCall()
+        results = await asyncio.gather(*[flights.run("chat", ("u1", "hello"), call) for _ in range(5)])
+        return call.calls, results
+
+    calls, results = run(scenario())
+    assert calls == 1
+    assert results == ["reply 1"] * 5
+
+
+def test_different_users_and_inputs_do_not_share():
+    async def scenario():
+        flights = SingleFlight()
+        call = CountingCall()
+        await asyncio.gather(
+            flights.run("chat", ("u1", "hello"), call),
+            flights.run("chat", ("u2", "hello"), call),
+            flights.run("chat", ("u1", "goodbye"), call),
+            flights.run("mood_suggestions", ("u1", "hello"), call),
+        )
+        return call.calls
+
+    assert run(scenario()) == 4
+
+
+def test_result_is_shared_within_retention_window_only():
+    async def scenario():
+        flights = SingleFlight(retention_seconds=0.1)
+        call = CountingCall(delay=0)
+        first = await flights.run("chat", ("u1", "hi"), call)
+        second = await flights.run("chat", ("u1", "hi"), call)
+        await asyncio.sleep(0.15)
+        third = await flights.run("chat", ("u1", "hi"), call)
+        return first, second, third
+
+    assert run(scenario()) == ("reply 1", "reply 1", "reply 2")
+
+
+def test_failure_reaches_every_waiter_and_is_not_retained():
+    async def scenario():
+        flights = SingleFlight(retention_seconds=10)
+        failing = CountingCall(fail=True)
+        results = await asyncio.gather(
+            *[flights.run("chat", ("u1", "hi"), failing) for _ in range(3)],
+            return_exceptions=True
+        )
+        retry = await flights.run("chat", ("u1", "hi"), CountingCall(delay=0))
+        return failing.calls, results, retry
+
+    calls, results, retry = run(scenario())
+    assert calls == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retry == "reply 1"
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def scenario():
+        flights = SingleFlight()
+        call = CountingCall(delay=0.05)
+        first = asyncio.ensure_future(flights.run("chat", ("u1", "hi"), call))
+        second = asyncio.ensure_future(flights.run("chat", ("u1", "hi"), call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return call.calls, await second
+
+    assert run(scenario()) == (1, "reply 1")